@@ -0,0 +1,278 @@
+"""
+Relatórios de desempenho dos anunciantes: visualizações do perfil, aparições
+na busca, links de divulgação gerados/acessados e conversas iniciadas.
+
+As rotas não gravam nada no banco: cada evento soma num buffer em memória do
+worker, agregado por (anunciante, evento, hora). Uma thread do próprio worker
+descarrega o buffer com um INSERT em lote em AnalyticsEvent a cada
+ANALYTICS_FLUSH_SECONDS ou quando ANALYTICS_FLUSH_EVENTS eventos se acumulam
+(e na saída do processo). Se o banco falhar, as contagens voltam para o
+buffer, que tem um limite de chaves; passando dele, eventos novos são
+descartados em vez de crescer a memória.
+
+`flask analytics-rollup` consolida AnalyticsEvent em AnalyticsHourly e
+AnalyticsDaily (uma instância por vez, pelo cron ou com --interval). O
+relatório lê só essas tabelas, então fica atrás dos eventos no máximo o
+intervalo do buffer mais o do rollup.
+"""
+
+import atexit
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, request
+from sqlalchemy import insert, update, delete, select, bindparam
+from models import db, AnalyticsEvent, AnalyticsHourly, AnalyticsDaily
+
+VIEW = "view"
+IMPRESSION = "impression"
+SHARE = "share"
+SHARE_CLICK = "share_click"
+CHAT_START = "chat_start"
+EVENTS = (VIEW, IMPRESSION, SHARE, SHARE_CLICK, CHAT_START)
+SHARE_REF = "share"  # ?ref= dos links de divulgação (ver share_kit.share_link)
+
+DEFAULT_FLUSH_EVENTS = 500
+DEFAULT_FLUSH_SECONDS = 10
+MAX_BUFFERED_KEYS = 50000
+HOURLY_RETENTION_DAYS = 14
+ROLLUP_CHUNK = 500
+REPORT_PLANS = ("annual",)  # "Relatórios de desempenho" (ver PAGSEGURO_PLANS)
+
+logger = logging.getLogger(__name__)
+
+
+def hour_of(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class EventBuffer:
+    """Contagens em memória por (anunciante, evento, hora), descarregadas por uma thread do worker"""
+
+    def __init__(self, writer, flush_events=DEFAULT_FLUSH_EVENTS, flush_seconds=DEFAULT_FLUSH_SECONDS,
+                 max_keys=MAX_BUFFERED_KEYS, clock=datetime.utcnow):
+        self.writer = writer
+        self.flush_events = flush_events
+        self.flush_seconds = flush_seconds
+        self.max_keys = max_keys
+        self.clock = clock
+        self.dropped = 0
+        self._counts = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread_pid = None
+
+    def add(self, events):
+        """events: [(evento, advertiser_id)]; só memória, sem I/O"""
+        hour = hour_of(self.clock())
+        with self._lock:
+            for event, advertiser_id in events:
+                key = (advertiser_id, event, hour)
+                if key not in self._counts and len(self._counts) >= self.max_keys:
+                    self.dropped += 1
+                    continue
+                self._counts[key] = self._counts.get(key, 0) + 1
+                self._pending += 1
+            full = self._pending >= self.flush_events
+        if self._thread_pid != os.getpid():
+            self._start_thread()
+        if full:
+            self._wake.set()
+
+    def _merge(self, counts):
+        with self._lock:
+            for key, count in counts.items():
+                if key not in self._counts and len(self._counts) >= self.max_keys:
+                    self.dropped += count
+                    continue
+                self._counts[key] = self._counts.get(key, 0) + count
+
+    def flush(self):
+        """Descarrega o que estiver no buffer; retorna quantas linhas foram gravadas"""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts, self._pending = self._counts, {}, 0
+            if not counts:
+                return 0
+            try:
+                self.writer(counts)
+            except Exception as e:
+                # Tenta de novo na próxima descarga
+                logger.warning(f"Falha ao gravar estatísticas ({len(counts)} linhas): {e}")
+                self._merge(counts)
+                return 0
+            return len(counts)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def _start_thread(self):
+        # Uma thread por processo: depois do fork do Gunicorn o worker inicia a sua
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, name="analytics-flush", daemon=True).start()
+
+
+def database_writer(app):
+    """Grava as contagens do buffer com um INSERT em lote, fora de qualquer requisição"""
+    def write(counts):
+        with app.app_context():
+            try:
+                db.session.execute(insert(AnalyticsEvent.__table__), [
+                    {"advertiser_id": advertiser_id, "event": event, "hour": hour, "count": count}
+                    for (advertiser_id, event, hour), count in counts.items()
+                ])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+    return write
+
+
+def init_app(app):
+    """Buffer do worker conforme ANALYTICS_ENABLED / ANALYTICS_FLUSH_EVENTS / ANALYTICS_FLUSH_SECONDS"""
+    if not app.config.get("ANALYTICS_ENABLED", True):
+        app.extensions["analytics_buffer"] = None
+        return
+    buffer = EventBuffer(
+        database_writer(app),
+        flush_events=app.config.get("ANALYTICS_FLUSH_EVENTS", DEFAULT_FLUSH_EVENTS),
+        flush_seconds=app.config.get("ANALYTICS_FLUSH_SECONDS", DEFAULT_FLUSH_SECONDS)
+    )
+    app.extensions["analytics_buffer"] = buffer
+    atexit.register(buffer.flush)
+
+
+def record(event, advertiser_id):
+    buffer = current_app.extensions.get("analytics_buffer")
+    if buffer is not None:
+        buffer.add([(event, advertiser_id)])
+
+
+def track(events):
+    """
+    Decorador das rotas públicas: conta os eventos da resposta, inclusive
+    quando ela vem do cache ou é um 304. `events(response, **view_args)`
+    devolve [(evento, advertiser_id)].
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            response = current_app.make_response(view(*args, **kwargs))
+            buffer = current_app.extensions.get("analytics_buffer")
+            if buffer is not None and response.status_code in (200, 304):
+                buffer.add(events(response, **kwargs))
+            return response
+        return wrapper
+    return decorator
+
+
+def profile_events(response, advertiser_id):
+    """Perfil aberto; pelo link de divulgação também conta como acesso ao link"""
+    if request.args.get("ref") == SHARE_REF:
+        return [(VIEW, advertiser_id), (SHARE_CLICK, advertiser_id)]
+    return [(VIEW, advertiser_id)]
+
+
+def search_events(response, **kwargs):
+    """Uma aparição para cada anunciante da página de resultados"""
+    cards = response.get_json(silent=True)
+    if not isinstance(cards, list):
+        return []
+    return [(IMPRESSION, card["id"]) for card in cards]
+
+
+def _merge_counts(model, period_name, counts):
+    """Soma `counts` {(anunciante, período, evento): n} na tabela: UPDATE em lote nas que existem, INSERT no resto"""
+    table = model.__table__
+    period = table.c[period_name]
+    periods = [key[1] for key in counts]
+    advertiser_ids = sorted({key[0] for key in counts})
+    existing = {}
+    for start in range(0, len(advertiser_ids), ROLLUP_CHUNK):
+        chunk = advertiser_ids[start:start + ROLLUP_CHUNK]
+        rows = db.session.execute(
+            select(table.c.id, table.c.advertiser_id, period, table.c.event)
+            .where(table.c.advertiser_id.in_(chunk), period.between(min(periods), max(periods)))
+        )
+        for row in rows:
+            existing[(row[1], row[2], row[3])] = row[0]
+
+    updates = [{"row_id": existing[key], "delta": count} for key, count in counts.items() if key in existing]
+    inserts = [{"advertiser_id": key[0], period_name: key[1], "event": key[2], "count": count}
+               for key, count in counts.items() if key not in existing]
+    if updates:
+        db.session.execute(
+            update(table).where(table.c.id == bindparam("row_id")).values(count=table.c.count + bindparam("delta")),
+            updates
+        )
+    if inserts:
+        db.session.execute(insert(table), inserts)
+
+
+def rollup(now=None):
+    """
+    Consolida os eventos descarregados até agora nas tabelas por hora e por
+    dia e apaga os consolidados, num único commit. Rodar uma instância por vez.
+    """
+    now = now or datetime.utcnow()
+    max_id = db.session.query(db.func.max(AnalyticsEvent.id)).scalar()
+    hourly = {}
+    daily = defaultdict(int)
+    if max_id is not None:
+        groups = (db.session.query(AnalyticsEvent.advertiser_id, AnalyticsEvent.hour, AnalyticsEvent.event,
+                                   db.func.sum(AnalyticsEvent.count))
+                  .filter(AnalyticsEvent.id <= max_id)
+                  .group_by(AnalyticsEvent.advertiser_id, AnalyticsEvent.hour, AnalyticsEvent.event))
+        for advertiser_id, hour, event, count in groups:
+            hourly[(advertiser_id, hour, event)] = count
+            daily[(advertiser_id, hour.date(), event)] += count
+        if hourly:
+            _merge_counts(AnalyticsHourly, "hour", hourly)
+            _merge_counts(AnalyticsDaily, "day", daily)
+        db.session.execute(delete(AnalyticsEvent.__table__).where(AnalyticsEvent.__table__.c.id <= max_id))
+
+    pruned = db.session.execute(
+        delete(AnalyticsHourly.__table__)
+        .where(AnalyticsHourly.__table__.c.hour < now - timedelta(days=HOURLY_RETENTION_DAYS))
+    ).rowcount
+    db.session.commit()
+    return {"hourly": len(hourly), "daily": len(daily), "pruned": pruned}
+
+
+def report(advertiser_id, granularity, start, end):
+    """Totais e série por hora/dia do anunciante em [start, end), só das tabelas consolidadas"""
+    if granularity == "hourly":
+        model, period = AnalyticsHourly, AnalyticsHourly.hour
+    else:
+        model, period = AnalyticsDaily, AnalyticsDaily.day
+        start, end = start.date(), end.date()
+    rows = (db.session.query(period, model.event, model.count)
+            .filter(model.advertiser_id == advertiser_id, period >= start, period < end)
+            .order_by(period))
+
+    totals = dict.fromkeys(EVENTS, 0)
+    series = {}
+    for moment, event, count in rows:
+        point = series.get(moment)
+        if point is None:
+            point = series[moment] = dict.fromkeys(EVENTS, 0)
+        point[event] = point.get(event, 0) + count
+        totals[event] = totals.get(event, 0) + count
+    return {
+        "granularity": granularity,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "totals": totals,
+        "series": [dict(point, period=moment.isoformat()) for moment, point in series.items()]
+    }
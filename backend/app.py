@@ -29,22 +29,38 @@ def create_app():
     cors.init_app(app)
     migrate.init_app(app, db)
 
+    import cache
+    cache.init_app(app)
+    import chat_push
+    chat_push.init_app(app)
+    import passwords
+    passwords.init_app(app)
+    import analytics
+    analytics.init_app(app)
+
     # Importar e registrar blueprints
-    from routes import auth_bp, advertiser_bp, admin_bp, user_bp
+    from routes import auth_bp, advertiser_bp, admin_bp, user_bp, webhook_bp, api_bp
     app.register_blueprint(auth_bp, url_prefix="/auth")
     app.register_blueprint(advertiser_bp, url_prefix="/advertiser")
     app.register_blueprint(admin_bp, url_prefix="/admin")
     app.register_blueprint(user_bp, url_prefix="/user")
+    app.register_blueprint(webhook_bp, url_prefix="/webhook")
+    app.register_blueprint(api_bp)
 
     # Importar modelos para que o Flask-Migrate os detecte
-    from models import Advertiser, User, Report, SubscriptionPlan, PlanPricing, AdScope, ChatMessage
+    from models import Advertiser, User, Report, SubscriptionPlan, PlanPricing, AdScope, ChatMessage, Conversation, WebhookEvent
+
+    # Índice de busca (listeners de sincronização) e comandos de manutenção
+    import search_index
+    from commands import register_commands
+    register_commands(app)
 
     return app
 
 # Criar a instância do aplicativo para que Gunicorn possa encontrá-la
 app = create_app()
 
-CORS(app, origins=["https://tudo-mais-app.vercel.app"])
+CORS(app, origins=["https://tudo-mais-app.vercel.app"], expose_headers=["X-Next-Cursor", "Link"])
 
 # Adicionar rota de webhook diretamente ao app principal
 # from webhook_handler import PagSeguroWebhookHandler
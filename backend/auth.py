@@ -0,0 +1,114 @@
+"""
+Autorização pelas claims do JWT, sem consultar o banco a cada requisição.
+
+O token de acesso (curto, JWT_ACCESS_TOKEN_EXPIRES) leva o id do usuário
+(sub) e as claims que as rotas protegidas usam: tipo, id do anunciante,
+plano e limite de itens. Papel e dono viram comparações com essas claims no
+decorador `authorize`. O que muda no banco (plano, limite, conta desativada)
+é relido quando o cliente troca o refresh token em POST /auth/refresh, então
+fica desatualizado por no máximo a validade do token de acesso. Duas
+exceções: as rotas que trocam o plano devolvem um token de acesso novo, e o
+limite de itens, que só importa na escrita, é relido do banco (item_quota).
+"""
+
+from functools import wraps
+from flask import jsonify
+from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt, verify_jwt_in_request
+from sqlalchemy import exists
+from models import db, Advertiser, User, UserType
+
+ADMIN_USER_ID = 0  # Id reservado para o administrador (não existe na tabela user)
+
+
+def user_claims(user):
+    """Claims do token a partir do banco (login e refresh): uma consulta de duas colunas para anunciantes"""
+    claims = {"user_type": user.user_type.value}
+    if user.user_type == UserType.ADVERTISER:
+        row = (db.session.query(Advertiser.id, Advertiser.subscription_plan)
+               .filter(Advertiser.user_id == user.id).first())
+        if row is not None:
+            claims.update(advertiser_id=row.id, plan=row.subscription_plan.value,
+                          item_quota=Advertiser.plan_max_items(row.subscription_plan))
+    return claims
+
+
+def admin_claims():
+    return {"user_type": "admin"}
+
+
+def issue_tokens(user_id, claims, refresh=True):
+    """Token de acesso com as claims; o refresh token leva só o id (as claims são relidas na troca)"""
+    tokens = {"access_token": create_access_token(identity=str(user_id), additional_claims=claims)}
+    if refresh:
+        tokens["refresh_token"] = create_refresh_token(identity=str(user_id))
+    return tokens
+
+
+def owner_tokens(identity, advertiser):
+    """Novo token de acesso com plano e quota relidos, depois de uma troca de plano pelo próprio anunciante"""
+    if identity["advertiser_id"] != advertiser.id:
+        return {}
+    return issue_tokens(identity["user_id"], user_claims(advertiser.user), refresh=False)
+
+
+def refreshed_claims(user_id):
+    """Claims atualizadas para a troca do refresh token; None se a conta não existe mais ou foi desativada"""
+    if user_id == ADMIN_USER_ID:
+        return admin_claims()
+    user = db.session.get(User, user_id)
+    if user is None or user.is_active is False:
+        return None
+    return user_claims(user)
+
+
+def current_identity():
+    """Identidade da requisição (dict com user_id, user_type, advertiser_id, plan, item_quota)"""
+    claims = get_jwt()
+    return {
+        "user_id": int(claims["sub"]),
+        "user_type": claims.get("user_type"),
+        "advertiser_id": claims.get("advertiser_id"),
+        "plan": claims.get("plan"),
+        "item_quota": claims.get("item_quota")
+    }
+
+
+def authorize(*user_types, owner=None):
+    """
+    Substitui @jwt_required() e as checagens de identidade copiadas em cada rota.
+    user_types: tipos aceitos (nenhum = qualquer usuário logado). owner: argumento
+    da rota ("user_id" ou "advertiser_id") que precisa ser igual à claim de
+    mesmo nome; o administrador passa nessa checagem.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            identity = current_identity()
+            if user_types and identity["user_type"] not in user_types:
+                return jsonify({"error": "Não autorizado"}), 403
+            if owner and identity["user_type"] != "admin" and identity[owner] != kwargs[owner]:
+                return jsonify({"error": "Não autorizado"}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def can_manage(identity, advertiser_id):
+    """O usuário pode alterar dados deste anunciante?"""
+    return identity["user_type"] == "admin" or identity["advertiser_id"] == advertiser_id
+
+
+def row_exists(*criteria):
+    """SELECT EXISTS(...) pelo índice, sem carregar a linha"""
+    return db.session.query(exists().where(*criteria)).scalar()
+
+
+def item_quota(advertiser_id):
+    """
+    Limite de itens pelo plano atual no banco (só a coluna, pela PK). Caminho
+    de escrita: a claim item_quota pode estar defasada até o próximo refresh
+    se o plano mudou pelo webhook.
+    """
+    plan = db.session.query(Advertiser.subscription_plan).filter(Advertiser.id == advertiser_id).scalar()
+    return Advertiser.plan_max_items(plan) if plan is not None else None
@@ -0,0 +1,6 @@
+"""
+Benchmarks reproduzíveis (rodar de backend/: `python -m benchmarks.<nome> --help`).
+
+Cada script monta os próprios dados num SQLite temporário (ou no banco de
+DATABASE_URL, se definido) e imprime uma tabela com os números.
+"""
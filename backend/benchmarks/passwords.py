@@ -0,0 +1,85 @@
+"""
+Custo do bcrypt por BCRYPT_LOG_ROUNDS e vazão de logins pelo pool limitado.
+
+    python -m benchmarks.passwords --rounds 10 11 12 13 --workers 2 --clients 16
+
+Para cada custo: tempo de um hash e logins/s com `--clients` threads
+disputando PasswordVerifier(workers); com o pool lotado, quantos foram
+recusados na hora (PasswordVerifierBusy) em vez de esperar. Por último, o
+custo de uma tentativa barrada pelo LoginThrottle (sem bcrypt).
+"""
+
+import argparse
+import os
+import threading
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app import bcrypt  # noqa: E402
+import passwords  # noqa: E402
+
+
+def hash_seconds(rounds, samples=3):
+    started = time.perf_counter()
+    for _ in range(samples):
+        bcrypt.generate_password_hash("senha-de-benchmark", rounds)
+    return (time.perf_counter() - started) / samples
+
+
+def login_throughput(password_hash, workers, queue_max, clients, per_client):
+    verifier = passwords.PasswordVerifier(workers, queue_max)
+    results = {"ok": 0, "busy": 0}
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(per_client):
+            try:
+                verifier.run(passwords._check, password_hash, "senha-de-benchmark")
+                outcome = "ok"
+            except passwords.PasswordVerifierBusy:
+                outcome = "busy"
+            with lock:
+                results[outcome] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    verifier.executor.shutdown()
+    return results["ok"] / elapsed, results["busy"]
+
+
+def throttled_seconds(attempts=10000):
+    throttle = passwords.LoginThrottle(passwords.MemoryThrottleBackend(), max_per_email=5)
+    for _ in range(5):
+        throttle.failure("alvo@teste.com", "10.0.0.1")
+    started = time.perf_counter()
+    for _ in range(attempts):
+        throttle.retry_after("alvo@teste.com", "10.0.0.1")
+    return (time.perf_counter() - started) / attempts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12, 13])
+    parser.add_argument("--workers", type=int, default=passwords.DEFAULT_WORKERS)
+    parser.add_argument("--queue", type=int, default=passwords.DEFAULT_QUEUE)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--per-client", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'custo':>5} {'hash (ms)':>10} {'logins/s':>9} {'recusados':>9}")
+    for rounds in args.rounds:
+        password_hash = bcrypt.generate_password_hash("senha-de-benchmark", rounds).decode("utf-8")
+        per_second, busy = login_throughput(password_hash, args.workers, args.queue, args.clients,
+                                            args.per_client)
+        print(f"{rounds:>5} {hash_seconds(rounds) * 1000:>10.1f} {per_second:>9.1f} {busy:>9}")
+    print(f"tentativa barrada pelo limite: {throttled_seconds() * 1e6:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
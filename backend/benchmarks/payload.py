@@ -0,0 +1,102 @@
+"""
+Bytes por página de busca: upload original x variantes (images.py).
+
+    python -m benchmarks.payload --size 4000 3000 --cards 20
+
+Gera uma foto sintética de câmera (ruído + gradiente, JPEG qualidade 92),
+passa pelo mesmo pipeline do upload (load_image + render_variants) e monta
+uma página de GET /advertiser/ com `--cards` anunciantes usando essa logo.
+Antes das variantes, cada card da listagem apontava para o arquivo enviado;
+agora aponta para a thumbnail. Imprime o JSON da página e o total com as
+imagens que o navegador baixa para exibir os cards (contando uma logo
+diferente, do mesmo tamanho, por card).
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from datetime import date
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from PIL import Image  # noqa: E402
+
+from app import app  # noqa: E402
+import images  # noqa: E402
+from models import db, User, UserType, State, City, Category, Advertiser  # noqa: E402
+
+
+def camera_photo(path, width, height):
+    """JPEG com ruído por cima de um gradiente: comprime como uma foto, não como uma cor chapada"""
+    noise = Image.effect_noise((width, height), 48).convert("L")
+    gradient = Image.linear_gradient("L").resize((width, height))
+    Image.merge("RGB", (noise, gradient, Image.blend(noise, gradient, 0.5))).save(path, "JPEG", quality=92)
+    return os.path.getsize(path)
+
+
+def search_page_bytes(cards, logo_url):
+    db.drop_all()
+    db.create_all()
+    state = State(name="Pernambuco", code="PE")
+    db.session.add(state)
+    db.session.flush()
+    city, category = City(name="Recife", state_id=state.id), Category(name="Alimentação")
+    db.session.add_all([city, category])
+    db.session.flush()
+    for n in range(1, cards + 1):
+        user = User(email=f"anunciante{n}@bench.local", name=f"Anunciante {n}",
+                    user_type=UserType.ADVERTISER, password_hash="x")
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Advertiser(
+            user_id=user.id, business_name=f"Pizzaria {n}", description="Forno a lenha e entrega rápida " * 4,
+            phone="81999999999", cpf=f"{n:011d}", birth_date=date(1990, 1, 1), city_id=city.id,
+            category_id=category.id, logo=logo_url))
+    db.session.commit()
+    response = app.test_client().get("/advertiser/", query_string={"limit": cards})
+    assert response.status_code == 200 and len(response.get_json()) == cards
+    return len(response.get_data())
+
+
+def kb(size):
+    return f"{size / 1024:,.1f} KB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, nargs=2, default=[4000, 3000], metavar=("LARGURA", "ALTURA"))
+    parser.add_argument("--cards", type=int, default=20)
+    args = parser.parse_args()
+
+    app.config.update(CACHE_DISABLED=True, ANALYTICS_ENABLED=False)
+    app.extensions["analytics_buffer"] = None
+    with tempfile.TemporaryDirectory() as folder, app.app_context():
+        source = os.path.join(folder, "foto.jpg")
+        source_bytes = camera_photo(source, *args.size)
+        started = time.perf_counter()
+        rendered = images.process_file(source, folder, "bench")
+        render_ms = (time.perf_counter() - started) * 1000
+        print(f"Original {args.size[0]}x{args.size[1]}: {kb(source_bytes)}; variantes em {render_ms:.0f} ms")
+        for variant, files in rendered.items():
+            sizes = ", ".join(f"{ext} {kb(os.path.getsize(os.path.join(folder, files[ext])))}"
+                              for ext in images.FORMATS)
+            print(f"  {variant:<9} {files['width']}x{files['height']}: {sizes}")
+
+        before_json = search_page_bytes(args.cards, "/uploads/foto.jpg")
+        after_json = search_page_bytes(args.cards, f"/uploads/{rendered['full']['jpg']}")
+        thumbnail = {ext: os.path.getsize(os.path.join(folder, rendered["thumbnail"][ext])) for ext in images.FORMATS}
+
+        print(f"\nPágina de busca com {args.cards} cards")
+        print(f"{'':<22} {'JSON':>10} {'imagens':>12} {'total':>12}")
+        rows = [("antes (original)", before_json, source_bytes),
+                ("thumbnail jpg", after_json, thumbnail["jpg"]),
+                ("thumbnail webp", after_json, thumbnail["webp"])]
+        for label, json_bytes, image_bytes in rows:
+            print(f"{label:<22} {kb(json_bytes):>10} {kb(image_bytes * args.cards):>12} "
+                  f"{kb(json_bytes + image_bytes * args.cards):>12}")
+        db.session.remove()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Busca de anunciantes: LIKE '%termo%' (busca original) x índice de busca (search_index.py).
+
+    python -m benchmarks.search --sizes 10000 100000 1000000
+
+Para cada tamanho o banco de DATABASE_URL (padrão: um SQLite em /tmp) é
+recriado com anunciantes sintéticos (nome, categoria, descrição de ~30
+palavras e dois itens cada) e o índice é montado com rebuild_index. Cada
+consulta roda --runs vezes e a mediana é impressa:
+
+- like: o filtro da rota antiga (business_name/description LIKE), todas as linhas;
+- indice: match_advertisers ordenado por score, primeira página (20);
+- rota: GET /advertiser/?query=... completo (primeira página, JSON).
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import date
+
+os.environ.setdefault("DATABASE_URL", "sqlite:////tmp/tudo_mais_search_bench.db")
+
+from sqlalchemy import insert, select, text  # noqa: E402
+
+from app import app  # noqa: E402
+from models import db, User, UserType, State, City, Category, Advertiser, Item  # noqa: E402
+from search_index import SEARCH_TABLE, match_advertisers, rebuild_index  # noqa: E402
+
+QUERIES = ("pizza", "barbearia centro", "mecan", "entrega rapida")
+CATEGORIES = ("Alimentação", "Beleza", "Automotivo", "Saúde", "Casa e Construção", "Serviços")
+NAMES = ("Pizzaria", "Barbearia", "Padaria", "Oficina Mecânica", "Lanchonete", "Salão", "Mercadinho",
+         "Farmácia", "Hamburgueria", "Açaí", "Pet Shop", "Auto Peças", "Doceria", "Marcenaria")
+PLACES = ("Centro", "do Bairro", "Boa Viagem", "Casa Forte", "da Praia", "Estrela", "Bom Preço", "Real")
+WORDS = ("entrega", "rápida", "qualidade", "preço", "justo", "atendimento", "delivery", "forno", "lenha",
+         "corte", "barba", "revisão", "freio", "óleo", "pão", "francês", "bolo", "encomenda", "pizza",
+         "hambúrguer", "artesanal", "promoção", "cartão", "pix", "estacionamento", "família", "tradição",
+         "desde", "anos", "bairro", "centro", "horário", "domingo", "feriado", "orçamento", "grátis")
+BATCH = 5000
+PAGE = 20
+
+
+def populate(size, seed=42):
+    rng = random.Random(seed)
+    db.drop_all()
+    with db.engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+    db.create_all()
+
+    state = State(name="Pernambuco", code="PE")
+    db.session.add(state)
+    db.session.flush()
+    db.session.add(City(name="Recife", state_id=state.id))
+    db.session.add_all([Category(name=name) for name in CATEGORIES])
+    db.session.commit()
+
+    # Core em lotes: sem o after_flush do índice (ele é montado de uma vez no final)
+    for start in range(1, size + 1, BATCH):
+        ids = range(start, min(start + BATCH, size + 1))
+        db.session.execute(insert(User.__table__), [
+            {"id": n, "email": f"anunciante{n}@bench.local", "name": f"Anunciante {n}",
+             "password_hash": "x", "user_type": UserType.ADVERTISER.name} for n in ids])
+        db.session.execute(insert(Advertiser.__table__), [
+            {"id": n, "user_id": n, "business_name": f"{rng.choice(NAMES)} {rng.choice(PLACES)}",
+             "description": " ".join(rng.choices(WORDS, k=30)), "phone": "81999999999",
+             "cpf": f"{n:011d}", "birth_date": date(1990, 1, 1), "city_id": 1,
+             "category_id": rng.randint(1, len(CATEGORIES)), "is_active": True} for n in ids])
+        db.session.execute(insert(Item.__table__), [
+            {"advertiser_id": n, "title": " ".join(rng.choices(WORDS, k=3))} for n in ids for _ in range(2)])
+        db.session.commit()
+
+    started = time.perf_counter()
+    with db.engine.begin() as connection:
+        rebuild_index(connection)
+    return time.perf_counter() - started
+
+
+def like_rows(query):
+    pattern = f"%{query}%"
+    return db.session.query(Advertiser.id).filter(
+        Advertiser.is_active == True,
+        Advertiser.business_name.like(pattern) | Advertiser.description.like(pattern)
+    ).all()
+
+
+def index_page(query):
+    match = match_advertisers(db.session.connection(), query)
+    return db.session.execute(
+        select(Advertiser.id).join(match, match.c.advertiser_id == Advertiser.id)
+        .where(Advertiser.is_active == True)
+        .order_by(match.c.score.desc(), Advertiser.id).limit(PAGE)
+    ).all()
+
+
+def route_page(client, query):
+    response = client.get("/advertiser/", query_string={"query": query})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.get_json()
+
+
+def median_ms(fn, runs):
+    timings = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    app.config.update(CACHE_DISABLED=True, ANALYTICS_ENABLED=False)
+    app.extensions["analytics_buffer"] = None
+    client = app.test_client()
+    with app.app_context():
+        for size in args.sizes:
+            index_seconds = populate(size)
+            print(f"\n{size} anunciantes (índice montado em {index_seconds:.1f}s)")
+            print(f"{'consulta':<18} {'like (ms)':>10} {'linhas':>8} {'indice (ms)':>12} {'rota (ms)':>10}")
+            for query in QUERIES:
+                like_ms, rows = median_ms(lambda: like_rows(query), args.runs)
+                index_ms, _ = median_ms(lambda: index_page(query), args.runs)
+                route_ms, _ = median_ms(lambda: route_page(client, query), args.runs)
+                print(f"{query:<18} {like_ms:>10.1f} {len(rows):>8} {index_ms:>12.1f} {route_ms:>10.1f}")
+            db.session.remove()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Cache de leitura (read-through) das respostas públicas do catálogo.
+
+As respostas ficam guardadas por endpoint + parâmetros normalizados. Cada
+entrada depende de "tags" (ex: "catalog", "advertiser:42"); invalidar uma tag
+incrementa a versão dela, e as chaves antigas deixam de ser lidas e expiram
+sozinhas pelo TTL/LRU. Backends: memória do processo (padrão, LRU com TTL e
+limite de entradas) ou um servidor compatível com Redis, compartilhado entre
+os workers do Gunicorn (CACHE_BACKEND = "redis" + CACHE_REDIS_URL).
+
+Com o backend em memória, a invalidação só vale no processo que fez a
+mudança: os outros workers do Gunicorn e, principalmente, os comandos que
+alteram anunciantes fora das rotas (subscriptions-expire,
+subscriptions-scheduler, webhook-worker) não alcançam o cache dos workers
+web. Por isso o TTL das entradas em memória é limitado a
+CACHE_MEMORY_MAX_TTL (padrão 60 s): esse é o atraso máximo para uma
+expiração ou um pagamento aparecer nas listagens. O perfil /advertiser/<id>
+não depende disso (a chave inclui a versão lida do banco, ver
+http_cache.py). Para invalidação imediata entre processos, use o Redis.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, g
+
+try:
+    import redis
+except ImportError:  # Opcional: só necessário com CACHE_BACKEND = "redis"
+    redis = None
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL = 60  # segundos
+DEFAULT_MEMORY_MAX_TTL = 60  # segundos; limite de desatualização sem invalidação entre processos
+
+# Cabeçalhos da resposta que fazem parte do conteúdo guardado
+CACHED_HEADERS = ("Content-Type", "X-Next-Cursor", "Link")
+
+
+class CacheBackend:
+    """Interface comum dos backends"""
+
+    # As versões das tags valem para todos os processos?
+    shared = False
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def get_versions(self, tags):
+        """Versão atual de cada tag"""
+        raise NotImplementedError
+
+    def bump(self, tag):
+        """Incrementa a versão da tag (invalida as entradas que dependem dela)"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    """
+    LRU em memória com TTL por entrada; cada worker tem o seu. O TTL é
+    limitado a max_ttl (None = sem limite), ver o topo do módulo.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_ttl=DEFAULT_MEMORY_MAX_TTL):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries = OrderedDict()  # key -> (expira_em, valor)
+        self._versions = {}  # tag -> versão; fora do LRU para nunca voltar a um valor antigo
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        if self.max_ttl:
+            ttl = min(ttl, self.max_ttl) if ttl else self.max_ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_versions(self, tags):
+        return [self._versions.get(tag, 0) for tag in tags]
+
+    def bump(self, tag):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {"entries": len(self._entries), "max_entries": self.max_entries,
+                "max_ttl": self.max_ttl, "evictions": self.evictions}
+
+
+class RedisBackend(CacheBackend):
+    """Servidor compatível com Redis (Redis, Valkey, KeyDB...) compartilhado entre processos"""
+
+    shared = True
+
+    def __init__(self, url, prefix="tudo_mais:cache:"):
+        if redis is None:
+            raise RuntimeError("CACHE_BACKEND = 'redis' exige o pacote redis instalado")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        return self._load(self.client.get(self.prefix + key))
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=ttl or None)
+
+    def get_versions(self, tags):
+        keys = [f"{self.prefix}tag:{tag}" for tag in tags]
+        versions = self.client.mget(keys)
+        for key, version in zip(keys, versions):
+            if version is None:
+                self._start_version(key)
+        if None in versions:
+            versions = self.client.mget(keys)
+        return [int(version) for version in versions]
+
+    def bump(self, tag):
+        key = f"{self.prefix}tag:{tag}"
+        self._start_version(key)
+        self.client.incr(key)
+
+    def _start_version(self, key):
+        # Se a versão sumir (ex: despejo por falta de memória), recomeça num valor
+        # maior que qualquer anterior, para não reaproveitar entradas antigas
+        self.client.set(key, time.time_ns() // 1_000_000, nx=True)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            self.client.delete(key)
+
+    def stats(self):
+        info = self.client.info("stats")
+        return {"evictions": info.get("evicted_keys", 0)}
+
+    @staticmethod
+    def _load(raw):
+        return json.loads(raw) if raw is not None else None
+
+
+class ResponseCache:
+    """Cache de respostas com versões por tag e contadores de acerto/erro"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def key_for(self, endpoint, params, tags):
+        versions = ",".join(f"{tag}={version}" for tag, version in zip(tags, self.backend.get_versions(tags)))
+        return f"{endpoint}?{params}#{versions}"
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl):
+        self.backend.set(key, value, ttl)
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.bump(tag)
+        self.invalidations += len(tags)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations,
+                **self.backend.stats()}
+
+
+def init_app(app):
+    """
+    Cria o cache conforme a configuração (CACHE_BACKEND, CACHE_REDIS_URL,
+    CACHE_MAX_ENTRIES, CACHE_MEMORY_MAX_TTL)
+    """
+    if app.config.get("CACHE_BACKEND", "memory") == "redis":
+        backend = RedisBackend(app.config["CACHE_REDIS_URL"])
+    else:
+        backend = MemoryBackend(app.config.get("CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES),
+                                app.config.get("CACHE_MEMORY_MAX_TTL", DEFAULT_MEMORY_MAX_TTL))
+    app.extensions["response_cache"] = ResponseCache(backend)
+
+
+def get_cache():
+    return current_app.extensions.get("response_cache")
+
+
+def local_invalidation_warning():
+    """
+    Aviso para os comandos que alteram anunciantes fora das rotas: com o
+    cache em memória, as invalidações deles não chegam aos workers web.
+    None se o cache for compartilhado (ou não existir).
+    """
+    cache = get_cache()
+    if cache is None or cache.backend.shared:
+        return None
+    delay = f"{cache.backend.max_ttl} s" if cache.backend.max_ttl else "o TTL de cada endpoint"
+    return (f"Cache em memória (CACHE_BACKEND = 'memory'): os workers web só veem as mudanças "
+            f"deste comando nas listagens depois de até {delay}. Use o Redis para invalidação imediata.")
+
+
+def normalized_params():
+    """Parâmetros da query string em ordem fixa, sem valores vazios"""
+    items = sorted((key, value.strip()) for key, value in request.args.items(multi=True) if value.strip())
+    return "&".join(f"{key}={value}" for key, value in items)
+
+
+def cached(endpoint, ttl=DEFAULT_TTL, tags=("catalog",)):
+    """
+    Decorador read-through para views GET públicas. Só respostas 200 são
+    guardadas. `tags` pode ser uma função que recebe os argumentos da view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            if cache is None or current_app.config.get("CACHE_DISABLED"):
+                return view(*args, **kwargs)
+
+            entry_tags = tags(**kwargs) if callable(tags) else tags
+            view_args = ",".join(f"{name}={kwargs[name]}" for name in sorted(kwargs))
+            key = cache.key_for(f"{endpoint}/{view_args}", normalized_params(), entry_tags)
+            if g.get("resource_version"):
+                # Versão lida do banco por http_cache.conditional: vale entre workers
+                key += f"@{g.resource_version}"
+
+            entry = cache.get(key)
+            if entry is not None:
+                response = current_app.response_class(entry["body"], status=200)
+                for name, value in entry["headers"]:
+                    response.headers[name] = value
+                return response
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                cache.set(key, {
+                    "body": response.get_data(as_text=True),
+                    "headers": [(name, response.headers[name]) for name in CACHED_HEADERS
+                                if name in response.headers]
+                }, ttl)
+            return response
+        return wrapper
+    return decorator
+
+
+def invalidate_advertiser(advertiser_id):
+    """Após mudar anunciante, itens, avaliações ou assinatura"""
+    cache = get_cache()
+    if cache is not None:
+        cache.invalidate("catalog", f"advertiser:{advertiser_id}")
+
+
+def invalidate_advertisers(advertiser_ids):
+    """Após alterações em lote (uma única invalidação do catálogo)"""
+    cache = get_cache()
+    if cache is not None and advertiser_ids:
+        cache.invalidate("catalog", *(f"advertiser:{advertiser_id}" for advertiser_id in advertiser_ids))
+
+
+def invalidate_plans():
+    """Após mudar preços ou configuração de planos"""
+    cache = get_cache()
+    if cache is not None:
+        cache.invalidate("plans")
@@ -0,0 +1,184 @@
+"""
+Entrega de mensagens do chat por push (SSE ou long-poll) em vez de polling.
+
+O cliente informa o último id que já tem (`since` ou o cabeçalho
+Last-Event-ID do EventSource) e a requisição fica parada até chegar
+mensagem nova na conversa ou o tempo acabar. O aviso de "mensagem nova" vem
+de um pub/sub leve: em memória no próprio processo (padrão) ou via Redis
+entre os workers do Gunicorn (CHAT_PUBSUB_BACKEND = "redis"). O pub/sub só
+carrega o id; as mensagens sempre são lidas do banco, então nada se perde
+se um aviso não chegar - no pior caso ele é notado no próximo timeout.
+
+Conversas paradas não custam nada: quem espera dorme num Event, sem
+consultar o banco. Cada conexão aberta ocupa uma thread do worker, então
+em produção use workers gthread ou gevent no Gunicorn.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from models import db, ChatMessage, Conversation
+import conversations
+
+try:
+    import redis
+except ImportError:  # Opcional: só necessário com CHAT_PUBSUB_BACKEND = "redis"
+    redis = None
+
+DEFAULT_TIMEOUT = 25  # segundos; abaixo do timeout típico de proxies (30 s)
+MAX_TIMEOUT = 55
+STREAM_DURATION = 300  # O SSE é encerrado depois disso; o EventSource reconecta com Last-Event-ID
+HEARTBEAT = 15
+BATCH_LIMIT = 100
+LATEST_MAX_CHANNELS = 10000
+
+
+def channel(user_id, advertiser_id):
+    return f"chat:{user_id}:{advertiser_id}"
+
+
+class MemoryBroker:
+    """Pub/sub dentro do processo; cada conversa só acorda quem espera por ela"""
+
+    def __init__(self, max_channels=LATEST_MAX_CHANNELS):
+        self.max_channels = max_channels
+        self._latest = OrderedDict()  # canal -> último id publicado (fecha a corrida consulta/espera)
+        self._waiters = {}  # canal -> {Event}
+        self._lock = threading.Lock()
+
+    def publish(self, channel_name, message_id):
+        self.notify(channel_name, message_id)
+
+    def notify(self, channel_name, message_id):
+        with self._lock:
+            if message_id > self._latest.get(channel_name, 0):
+                self._latest[channel_name] = message_id
+                self._latest.move_to_end(channel_name)
+                while len(self._latest) > self.max_channels:
+                    self._latest.popitem(last=False)
+            for event in self._waiters.get(channel_name, ()):
+                event.set()
+
+    def wait(self, channel_name, since, timeout):
+        """Espera mensagem com id > since no canal; False se o tempo acabar"""
+        with self._lock:
+            if self._latest.get(channel_name, 0) > since:
+                return True
+            event = threading.Event()
+            self._waiters.setdefault(channel_name, set()).add(event)
+        try:
+            return event.wait(timeout)
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(channel_name)
+                waiters.discard(event)
+                if not waiters:
+                    del self._waiters[channel_name]
+
+    def stats(self):
+        with self._lock:
+            return {"channels_waiting": len(self._waiters),
+                    "waiters": sum(len(waiters) for waiters in self._waiters.values())}
+
+
+class RedisBroker(MemoryBroker):
+    """Publica no Redis; uma thread por processo repassa os avisos aos que esperam localmente"""
+
+    def __init__(self, url, prefix="tudo_mais:", max_channels=LATEST_MAX_CHANNELS):
+        if redis is None:
+            raise RuntimeError("CHAT_PUBSUB_BACKEND = 'redis' exige o pacote redis instalado")
+        super().__init__(max_channels)
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def publish(self, channel_name, message_id):
+        self.notify(channel_name, message_id)  # Quem está neste processo não espera a volta do Redis
+        self.client.publish(self.prefix + channel_name, message_id)
+
+    def wait(self, channel_name, since, timeout):
+        self._ensure_listener()
+        return super().wait(channel_name, since, timeout)
+
+    def _ensure_listener(self):
+        with self._listener_lock:
+            # Workers criados por fork não herdam a thread do processo pai
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name="chat-pubsub", daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f"{self.prefix}chat:*")
+                for item in pubsub.listen():
+                    name = item["channel"].decode()[len(self.prefix):]
+                    self.notify(name, int(item["data"]))
+            except redis.RedisError:
+                time.sleep(1)  # Sem Redis, as esperas terminam pelo timeout e o cliente refaz a consulta
+
+
+def init_app(app):
+    """Cria o broker conforme CHAT_PUBSUB_BACKEND / CHAT_REDIS_URL"""
+    if app.config.get("CHAT_PUBSUB_BACKEND", "memory") == "redis":
+        broker = RedisBroker(app.config["CHAT_REDIS_URL"])
+    else:
+        broker = MemoryBroker()
+    app.extensions["chat_broker"] = broker
+
+
+def get_broker():
+    return current_app.extensions["chat_broker"]
+
+
+def publish(user_id, advertiser_id, message_id):
+    """Chamado depois do commit de uma mensagem nova"""
+    try:
+        get_broker().publish(channel(user_id, advertiser_id), message_id)
+    except Exception as e:
+        # A mensagem já está salva; quem espera vai vê-la no próximo timeout
+        current_app.logger.warning(f"Falha ao publicar aviso do chat: {e}")
+
+
+def messages_since(user_id, advertiser_id, since, limit=BATCH_LIMIT):
+    """Mensagens da conversa com id > since, em ordem de envio"""
+    messages = (ChatMessage.query.join(Conversation, Conversation.id == ChatMessage.conversation_id)
+                .filter(Conversation.user_id == user_id, Conversation.advertiser_id == advertiser_id,
+                        ChatMessage.id > since)
+                .order_by(ChatMessage.id).limit(limit).all())
+    results = [conversations.message_payload(msg) for msg in messages]
+    # Devolve a conexão ao pool antes de uma eventual espera longa
+    db.session.remove()
+    return results
+
+
+def long_poll(user_id, advertiser_id, since, timeout):
+    """Mensagens novas assim que existirem, ou [] depois de `timeout` segundos"""
+    results = messages_since(user_id, advertiser_id, since)
+    if results or not get_broker().wait(channel(user_id, advertiser_id), since, timeout):
+        return results
+    return messages_since(user_id, advertiser_id, since)
+
+
+def event_stream(user_id, advertiser_id, since, duration=STREAM_DURATION, heartbeat=HEARTBEAT):
+    """Gerador de eventos SSE (`id`/`data` por mensagem e comentários de heartbeat)"""
+    broker = get_broker()
+    name = channel(user_id, advertiser_id)
+    deadline = time.monotonic() + duration
+    yield "retry: 3000\n\n"
+    while True:
+        messages = messages_since(user_id, advertiser_id, since)
+        for message in messages:
+            since = message["id"]
+            yield f"id: {since}\nevent: message\ndata: {json.dumps(message)}\n\n"
+        if len(messages) == BATCH_LIMIT:
+            continue  # Histórico acumulado: segue lendo sem esperar
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        if not broker.wait(name, since, min(heartbeat, remaining)):
+            yield ": ping\n\n"  # Mantém a conexão viva em proxies
@@ -0,0 +1,291 @@
+"""
+Comandos de manutenção executados via `flask <comando>` (cron do cPanel ou terminal)
+"""
+
+import click
+from flask.cli import with_appcontext
+from models import db
+from cache import local_invalidation_warning
+
+
+@click.command("search-reindex")
+@with_appcontext
+def search_reindex_command():
+    """Recria o índice de busca textual de todos os anunciantes"""
+    from search_index import rebuild_index
+
+    total = rebuild_index(db.session.connection())
+    db.session.commit()
+    click.echo(f"{total} anunciantes indexados.")
+
+
+@click.command("ratings-repair")
+@with_appcontext
+def ratings_repair_command():
+    """Recalcula soma, contagem, média e histograma de avaliações de todos os anunciantes"""
+    from models import Advertiser
+
+    total = Advertiser.recompute_ratings()
+    db.session.commit()
+    click.echo(f"Avaliações recalculadas para {total} anunciantes.")
+
+
+@click.command("explain-check")
+@click.option("--seed", "seed_rows", type=int, default=0,
+              help="Insere N anunciantes sintéticos antes do EXPLAIN (desfeito ao final).")
+@with_appcontext
+def explain_check_command(seed_rows):
+    """Falha se alguma consulta quente fizer varredura completa de tabela"""
+    from explain_check import check_plans, seed
+
+    bind = db.session.connection()
+    try:
+        if seed_rows:
+            seed(bind, seed_rows)
+        results = check_plans(bind)
+    finally:
+        db.session.rollback()
+
+    failures = 0
+    for name, scans in results:
+        if scans:
+            failures += 1
+            click.echo(f"FALHA  {name}: varredura completa em {', '.join(scans)}")
+        else:
+            click.echo(f"ok     {name}")
+    if failures:
+        raise click.ClickException(f"{failures} consulta(s) sem índice adequado.")
+
+
+@click.command("regions-import")
+@click.argument("csv_file", type=click.File("r", encoding="utf-8"))
+@with_appcontext
+def regions_import_command(csv_file):
+    """Importa a região (microrregião/região imediata do IBGE) das cidades de um CSV uf,municipio,regiao"""
+    import csv
+    from regions import import_regions
+
+    updated, missing = import_regions(csv.DictReader(csv_file))
+    db.session.commit()
+    click.echo(f"{updated} cidades atualizadas.")
+    if missing:
+        click.echo(f"{len(missing)} cidades do arquivo não cadastradas: {', '.join(missing[:20])}")
+
+
+@click.command("image-worker")
+@click.option("--once", is_flag=True, help="Processa a fila atual e sai (para uso no cron).")
+@click.option("--interval", type=float, default=2.0, help="Segundos entre verificações da fila.")
+@with_appcontext
+def image_worker_command(once, interval):
+    """Processa a fila de imagens enviadas (ImageJob)"""
+    import time
+    from image_jobs import requeue_stale, run_pending
+
+    while True:
+        requeued = requeue_stale()
+        if requeued:
+            click.echo(f"{requeued} jobs interrompidos voltaram para a fila.")
+        processed = run_pending()
+        if processed:
+            click.echo(f"{processed} imagens processadas.")
+        if once:
+            break
+        db.session.remove()
+        time.sleep(interval)
+
+
+@click.command("webhook-worker")
+@click.option("--once", is_flag=True, help="Processa a fila atual e sai (para uso no cron).")
+@click.option("--interval", type=float, default=2.0, help="Segundos entre verificações da fila.")
+@with_appcontext
+def webhook_worker_command(once, interval):
+    """Aplica os webhooks do PagSeguro recebidos (WebhookEvent), em ordem por anunciante"""
+    import time
+    from webhook_inbox import requeue_stale, run_pending
+
+    warning = local_invalidation_warning()
+    if warning:
+        click.echo(warning, err=True)
+
+    while True:
+        requeued = requeue_stale()
+        if requeued:
+            click.echo(f"{requeued} eventos interrompidos voltaram para a fila.")
+        results = run_pending()
+        if results:
+            click.echo(", ".join(f"{count} {outcome}" for outcome, count in sorted(results.items())))
+        if once:
+            break
+        db.session.remove()
+        time.sleep(interval)
+
+
+@click.command("subscriptions-expire")
+@click.option("--chunk-size", type=int, default=500, help="Anunciantes por UPDATE/commit.")
+@click.option("--dry-run", is_flag=True, help="Só lista quem seria expirado.")
+@click.option("--show-ids", is_flag=True, help="Lista os ids alterados (para notificações).")
+@with_appcontext
+def subscriptions_expire_command(chunk_size, dry_run, show_ids):
+    """Expira as assinaturas vencidas em blocos (suspensões ficam com subscriptions-scheduler)"""
+    from expiry import expire_subscriptions, TRANSITIONS
+
+    warning = local_invalidation_warning()
+    if warning:
+        click.echo(warning, err=True)
+
+    report = expire_subscriptions(chunk_size=chunk_size, dry_run=dry_run)
+    for name, _, _ in TRANSITIONS:
+        action = "seriam" if dry_run else "foram"
+        click.echo(f"{len(report[name])} assinaturas {action} {name}.")
+        if show_ids and report[name]:
+            click.echo(f"  ids: {', '.join(str(advertiser_id) for advertiser_id in report[name])}")
+    if not dry_run:
+        click.echo(f"{report['rows']} linhas em {report['seconds']}s ({report['rows_per_second']} linhas/s).")
+
+
+@click.command("subscriptions-scheduler")
+@click.option("--once", is_flag=True, help="Roda uma vez e sai (para uso no cron).")
+@click.option("--interval", type=float, default=300.0, help="Segundos entre rodadas.")
+@with_appcontext
+def subscriptions_scheduler_command(once, interval):
+    """Lembretes de vencimento, suspensões e cancelamentos automáticos (AUTOMATION_CONFIG)"""
+    import time
+    from dunning import run_due
+
+    warning = local_invalidation_warning()
+    if warning:
+        click.echo(warning, err=True)
+
+    while True:
+        results = run_due()
+        sent = {kind: count for kind, count in results.items() if count}
+        if sent:
+            click.echo(", ".join(f"{count} {kind}" for kind, count in sorted(sent.items())))
+        if once:
+            break
+        db.session.remove()
+        time.sleep(interval)
+
+
+@click.command("stats-rollup")
+@click.option("--once", is_flag=True, help="Roda uma vez e sai (para uso no cron).")
+@click.option("--interval", type=float, default=300.0, help="Segundos entre recontagens.")
+@with_appcontext
+def stats_rollup_command(once, interval):
+    """Recontagem dos contadores do painel do administrador (DailyStats)"""
+    import time
+    from stats import run_rollup
+
+    while True:
+        row = run_rollup()
+        if once:
+            click.echo(f"{row.day.isoformat()}: {row.total_advertisers} anunciantes "
+                       f"({row.active_advertisers} ativos), {row.new_signups} cadastros hoje.")
+            break
+        db.session.remove()
+        time.sleep(interval)
+
+
+@click.command("analytics-rollup")
+@click.option("--once", is_flag=True, help="Roda uma vez e sai (para uso no cron).")
+@click.option("--interval", type=float, default=300.0, help="Segundos entre consolidações.")
+@with_appcontext
+def analytics_rollup_command(once, interval):
+    """Consolida os eventos dos relatórios de desempenho nas tabelas por hora e por dia"""
+    import time
+    from analytics import rollup
+
+    while True:
+        result = rollup()
+        if result["hourly"] or result["pruned"]:
+            click.echo(f"{result['hourly']} linhas por hora, {result['daily']} por dia, "
+                       f"{result['pruned']} linhas antigas removidas.")
+        if once:
+            break
+        db.session.remove()
+        time.sleep(interval)
+
+
+@click.command("email-worker")
+@click.option("--once", is_flag=True, help="Envia a fila atual e sai (para uso no cron).")
+@click.option("--interval", type=float, default=10.0, help="Segundos entre verificações da fila.")
+@with_appcontext
+def email_worker_command(once, interval):
+    """Envia os emails automáticos da caixa de saída (EmailOutbox) por uma conexão SMTP"""
+    import time
+    from flask import current_app
+    from mailer import SMTPConnection, RateLimiter, requeue_stale, run_pending
+
+    connection = SMTPConnection.from_config(current_app.config)
+    limiter = RateLimiter(current_app.config.get("MAIL_RATE_PER_MINUTE", 60))
+    try:
+        while True:
+            requeued = requeue_stale()
+            if requeued:
+                click.echo(f"{requeued} emails interrompidos voltaram para a fila.")
+            results = run_pending(connection, limiter)
+            if results:
+                click.echo(", ".join(f"{count} {outcome}" for outcome, count in sorted(results.items())))
+            if once:
+                break
+            db.session.remove()
+            time.sleep(interval)
+    finally:
+        connection.close()
+
+
+@click.command("uploads-gc")
+@click.option("--dry-run", is_flag=True, help="Só lista o que seria removido.")
+@click.option("--grace-hours", type=float, default=24, help="Não remove arquivos mais novos que isso.")
+@with_appcontext
+def uploads_gc_command(dry_run, grace_hours):
+    """Remove imagens enviadas que nenhum anunciante ou item referencia"""
+    from datetime import timedelta
+    from storage import collect_garbage
+
+    removed, freed = collect_garbage(grace_period=timedelta(hours=grace_hours), dry_run=dry_run)
+    action = "seriam removidas" if dry_run else "removidas"
+    click.echo(f"{len(removed)} imagens {action} ({freed / 1024 / 1024:.1f} MB).")
+
+
+@click.command("share-kit")
+@click.argument("output", type=click.Path(dir_okay=False, writable=True))
+@click.option("--base-url", required=True, help="URL pública do site, ex: https://tudomais.app")
+@click.option("--format", "qr_format", type=click.Choice(["png", "svg"]), default="png")
+@click.option("--workers", type=int, default=None, help="Processos para renderizar (0 = neste processo).")
+@click.option("--city-id", type=int, default=None)
+@click.option("--state-id", type=int, default=None)
+@click.option("--category-id", type=int, default=None)
+@with_appcontext
+def share_kit_command(output, base_url, qr_format, workers, city_id, state_id, category_id):
+    """Gera o ZIP com link, texto e QR Code de divulgação de cada anunciante ativo"""
+    from flask import current_app
+    from share_kit import advertiser_rows, stream_archive, DEFAULT_WORKERS
+
+    if workers is None:
+        workers = current_app.config.get("SHARE_KIT_WORKERS", DEFAULT_WORKERS)
+    report = {}
+    rows = advertiser_rows(city_id=city_id, state_id=state_id, category_id=category_id)
+    with open(output, "wb") as out:
+        for chunk in stream_archive(rows, base_url.rstrip("/"), qr_format, workers=workers, report=report):
+            out.write(chunk)
+    click.echo(f"{report['advertisers']} kits em {report['seconds']}s "
+               f"({report['kits_per_second']} kits/s, {workers} workers, "
+               f"{report['zip_bytes'] / 1024 / 1024:.1f} MB).")
+
+
+def register_commands(app):
+    """Registra os comandos de manutenção no CLI do Flask"""
+    app.cli.add_command(search_reindex_command)
+    app.cli.add_command(ratings_repair_command)
+    app.cli.add_command(explain_check_command)
+    app.cli.add_command(regions_import_command)
+    app.cli.add_command(image_worker_command)
+    app.cli.add_command(uploads_gc_command)
+    app.cli.add_command(share_kit_command)
+    app.cli.add_command(webhook_worker_command)
+    app.cli.add_command(subscriptions_expire_command)
+    app.cli.add_command(subscriptions_scheduler_command)
+    app.cli.add_command(email_worker_command)
+    app.cli.add_command(stats_rollup_command)
+    app.cli.add_command(analytics_rollup_command)
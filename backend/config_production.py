@@ -2,11 +2,15 @@
 Configuração de Produção para HostGator
 """
 import os
+from datetime import timedelta
 
 class ProductionConfig:
     # Configurações básicas
     SECRET_KEY = os.environ.get("SECRET_KEY") or "ALTERE_ESTA_CHAVE_SECRETA_PARA_PRODUCAO"
     JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY") or "ALTERE_ESTA_CHAVE_JWT_PARA_PRODUCAO"
+    # Tokens (ver auth.py): as claims do token de acesso valem até ele expirar; o refresh relê do banco
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=int(os.environ.get("JWT_ACCESS_TOKEN_MINUTES", 15)))
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=int(os.environ.get("JWT_REFRESH_TOKEN_DAYS", 30)))
     
     # Configuração do banco de dados MySQL na HostGator
     # IMPORTANTE: Substitua pelos dados reais do seu cPanel
@@ -15,12 +19,50 @@ class ProductionConfig:
     DB_NAME = "SEU_CPANEL_tudomais_db"        # Ex: joao123_tudomais_db
     DB_HOST = "localhost"                     # Geralmente localhost na HostGator
     
-    SQLALCHEMY_DATABASE_URI = f"mysql+pymysql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+    # DATABASE_URL sobrescreve (ex: sqlite:// nos testes)
+    SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL") or f"mysql+pymysql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
     # Configurações de upload
     UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
+    # Entrega dos uploads (ver storage.py): "flask", "x-sendfile" (Apache/mod_xsendfile) ou "x-accel" (nginx)
+    UPLOAD_SERVE_MODE = os.environ.get("UPLOAD_SERVE_MODE", "flask")
+    UPLOAD_ACCEL_PREFIX = "/protected-uploads/"
+    # Processamento de imagens (ver image_jobs.py): 0 workers = só via `flask image-worker`
+    IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+    IMAGE_QUEUE_MAX = int(os.environ.get("IMAGE_QUEUE_MAX", 50))
+    # Kit de divulgação em lote (ver share_kit.py): processos para renderizar os QR Codes
+    SHARE_KIT_WORKERS = int(os.environ.get("SHARE_KIT_WORKERS", 2))
+    
+    # Cache das respostas públicas (ver cache.py): "memory" por worker ou "redis" compartilhado
+    CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+    CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
+    CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 1024))
+    # Sem Redis, a invalidação não passa entre processos: TTL máximo das entradas em memória
+    CACHE_MEMORY_MAX_TTL = int(os.environ.get("CACHE_MEMORY_MAX_TTL", 60))
+    # Avisos de mensagem nova do chat (ver chat_push.py): "memory" por worker ou "redis" entre workers
+    CHAT_PUBSUB_BACKEND = os.environ.get("CHAT_PUBSUB_BACKEND", "memory")
+    CHAT_REDIS_URL = os.environ.get("CHAT_REDIS_URL", CACHE_REDIS_URL)
+    # QR Codes renderizados (ver qr_codes.py): LRU por worker + disco compartilhado
+    QR_CACHE_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'qr_cache')
+    QR_CACHE_MAX_ENTRIES = int(os.environ.get("QR_CACHE_MAX_ENTRIES", 256))
+    
+    # Senhas (ver passwords.py): custo do bcrypt (hashes antigos são refeitos no login),
+    # threads que verificam senhas e o limite de falhas de login por email/IP
+    BCRYPT_LOG_ROUNDS = int(os.environ.get("BCRYPT_LOG_ROUNDS", 12))
+    PASSWORD_VERIFY_WORKERS = int(os.environ.get("PASSWORD_VERIFY_WORKERS", 2))
+    PASSWORD_VERIFY_QUEUE = int(os.environ.get("PASSWORD_VERIFY_QUEUE", 16))
+    LOGIN_THROTTLE_BACKEND = os.environ.get("LOGIN_THROTTLE_BACKEND", "memory")
+    LOGIN_THROTTLE_REDIS_URL = os.environ.get("LOGIN_THROTTLE_REDIS_URL", CACHE_REDIS_URL)
+    LOGIN_THROTTLE_WINDOW = int(os.environ.get("LOGIN_THROTTLE_WINDOW", 15 * 60))
+    LOGIN_MAX_FAILURES_PER_EMAIL = int(os.environ.get("LOGIN_MAX_FAILURES_PER_EMAIL", 5))
+    LOGIN_MAX_FAILURES_PER_IP = int(os.environ.get("LOGIN_MAX_FAILURES_PER_IP", 20))
+    
+    # Relatórios de desempenho (ver analytics.py): buffer por worker descarregado em lote
+    ANALYTICS_ENABLED = os.environ.get("ANALYTICS_ENABLED", "true").lower() == "true"
+    ANALYTICS_FLUSH_EVENTS = int(os.environ.get("ANALYTICS_FLUSH_EVENTS", 500))
+    ANALYTICS_FLUSH_SECONDS = float(os.environ.get("ANALYTICS_FLUSH_SECONDS", 10))
     
     # Configurações de segurança
     SESSION_COOKIE_SECURE = True
@@ -32,6 +74,14 @@ class ProductionConfig:
     
     # Email de suporte
     SUPPORT_EMAIL = "tudomaisapp@hotmail.com"
+    # Envio dos emails automáticos (ver mailer.py e `flask email-worker`)
+    MAIL_SERVER = os.environ.get("MAIL_SERVER", "localhost")
+    MAIL_PORT = int(os.environ.get("MAIL_PORT", 587))
+    MAIL_USE_TLS = os.environ.get("MAIL_USE_TLS", "1") == "1"
+    MAIL_USERNAME = os.environ.get("MAIL_USERNAME")
+    MAIL_PASSWORD = os.environ.get("MAIL_PASSWORD")
+    MAIL_DEFAULT_SENDER = os.environ.get("MAIL_DEFAULT_SENDER", SUPPORT_EMAIL)
+    MAIL_RATE_PER_MINUTE = int(os.environ.get("MAIL_RATE_PER_MINUTE", 60))  # Limite do provedor SMTP
     
     # URL base do aplicativo (substitua pelo seu domínio)
     BASE_URL = "https://app.seudominio.com.br"  # Ex: https://app.minhaempresa.com.br
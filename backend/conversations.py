@@ -0,0 +1,123 @@
+"""
+Conversas do chat (consumidor x anunciante).
+
+Cada mensagem pertence a uma Conversation, que guarda o ponteiro para a
+última mensagem e quantas cada lado ainda não leu. O histórico é lido por
+conversation_id + id > since no índice (conversation_id, id), já na ordem
+de envio; a caixa de entrada do anunciante é uma única consulta pelo índice
+(advertiser_id, last_message_at, id).
+"""
+
+from datetime import datetime
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from models import db, Conversation, ChatMessage, User
+
+PREVIEW_LENGTH = 120
+
+
+def find(user_id, advertiser_id):
+    return Conversation.query.filter_by(user_id=user_id, advertiser_id=advertiser_id).first()
+
+
+def get_or_create(user_id, advertiser_id):
+    """
+    Conversa do par, criada na primeira mensagem (a constraint única resolve
+    corridas). Retorna (conversa, False) se ela já existia.
+    """
+    conversation = find(user_id, advertiser_id)
+    if conversation is not None:
+        return conversation, False
+    try:
+        with db.session.begin_nested():
+            conversation = Conversation(user_id=user_id, advertiser_id=advertiser_id)
+            db.session.add(conversation)
+    except IntegrityError:
+        return find(user_id, advertiser_id), False
+    return conversation, True
+
+
+def side_of(conversation, identity):
+    """"user", "advertiser" ou None conforme quem está acessando a conversa"""
+    if identity["user_type"] == "advertiser" and identity["advertiser_id"] == conversation.advertiser_id:
+        return "advertiser"
+    if identity["user_id"] == conversation.user_id:
+        return "user"
+    return None
+
+
+def add_message(conversation, sender_id, text, from_advertiser):
+    """
+    Grava a mensagem e atualiza o ponteiro/contador da conversa na mesma
+    transação (o commit fica com quem chama). O incremento é feito no banco,
+    então mensagens simultâneas não perdem contagem.
+    """
+    message = ChatMessage(
+        conversation_id=conversation.id,
+        sender_id=sender_id,
+        advertiser_id=conversation.advertiser_id,
+        message=text,
+        is_from_advertiser=from_advertiser,
+        created_at=datetime.utcnow()
+    )
+    db.session.add(message)
+    db.session.flush()
+
+    table = Conversation.__table__
+    unread = table.c.user_unread if from_advertiser else table.c.advertiser_unread
+    db.session.execute(
+        update(table).where(table.c.id == conversation.id)
+        .values({table.c.last_message_id: message.id, table.c.last_message_at: message.created_at,
+                 unread: unread + 1})
+    )
+    return message
+
+
+def mark_read(conversation_id, side):
+    """Zera o contador de não lidas de um lado (só escreve se houver algo a zerar)"""
+    table = Conversation.__table__
+    column = table.c.user_unread if side == "user" else table.c.advertiser_unread
+    return db.session.execute(
+        update(table).where(table.c.id == conversation_id, column > 0).values({column: 0})
+    ).rowcount
+
+
+def messages_query(conversation_id, since=0):
+    return ChatMessage.query.filter(ChatMessage.conversation_id == conversation_id, ChatMessage.id > since)
+
+
+def message_payload(msg):
+    return {
+        "id": msg.id,
+        "conversation_id": msg.conversation_id,
+        "sender_id": msg.sender_id,
+        "advertiser_id": msg.advertiser_id,
+        "message": msg.message,
+        "is_from_advertiser": msg.is_from_advertiser,
+        "created_at": msg.created_at.isoformat()
+    }
+
+
+def inbox_query(advertiser_id):
+    """Conversas do anunciante com nome do consumidor e prévia da última mensagem, numa consulta"""
+    return (db.session.query(Conversation.id, Conversation.user_id, Conversation.last_message_at,
+                             Conversation.advertiser_unread, User.name.label("user_name"),
+                             ChatMessage.message.label("last_message"),
+                             ChatMessage.is_from_advertiser.label("last_from_advertiser"))
+            .join(User, User.id == Conversation.user_id)
+            .outerjoin(ChatMessage, ChatMessage.id == Conversation.last_message_id)
+            .filter(Conversation.advertiser_id == advertiser_id))
+
+
+def inbox_payload(row):
+    preview = row.last_message
+    if preview and len(preview) > PREVIEW_LENGTH:
+        preview = preview[:PREVIEW_LENGTH] + "..."
+    return {
+        "conversation_id": row.id,
+        "user": {"id": row.user_id, "name": row.user_name},
+        "last_message": preview,
+        "last_message_from_advertiser": row.last_from_advertiser,
+        "last_message_at": row.last_message_at.isoformat(),
+        "unread": row.advertiser_unread
+    }
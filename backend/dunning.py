@@ -0,0 +1,174 @@
+"""
+Agendador de cobrança (comando `flask subscriptions-scheduler`).
+
+Aplica AUTOMATION_CONFIG: lembretes antes do vencimento (reminder_days),
+suspensão ao fim da carência de um pagamento recusado e cancelamento depois
+de auto_cancel_after_days suspenso. É o único que suspende por falta de
+pagamento; o motor de expiração (expiry.py) só vence assinaturas. Cada
+etapa é uma consulta por faixa nos índices (subscription_status,
+subscription_end) e (subscription_status, grace_period_end), processada em
+blocos de BATCH_SIZE.
+
+O que já foi enviado fica em SubscriptionNotice (único por anunciante, tipo e
+vencimento), então rodar a cada poucos minutos não repete avisos; quando não
+há nada vencido, cada etapa custa uma consulta vazia no índice.
+"""
+
+import math
+from datetime import datetime, timedelta
+from sqlalchemy import update, insert, exists
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from models import db, Advertiser, SubscriptionNotice
+from cache import invalidate_advertisers
+from beta_config import is_beta_mode
+from pagseguro_config import AUTOMATION_CONFIG, SUBSCRIPTION_STATUS
+from webhook_handler import PagSeguroWebhookHandler
+
+BATCH_SIZE = 200
+
+PAYMENT_UPDATE_URL = "https://pagseguro.uol.com.br"
+RENEWAL_URL = "https://tudomais.app/planos"
+REACTIVATION_URL = "https://tudomais.app/reativar"
+
+# Quem recebe lembrete de renovação (os mesmos que o motor de expiração vence)
+REMINDER_STATUSES = ("trial", SUBSCRIPTION_STATUS["ACTIVE"])
+
+
+def reminder_statuses():
+    """No modo beta o teste não vence (ver expiry.py): trials não recebem lembrete"""
+    if is_beta_mode():
+        return tuple(status for status in REMINDER_STATUSES if status != "trial")
+    return REMINDER_STATUSES
+
+
+def reminder_windows(now):
+    """
+    [(tipo, dias, início, fim)]: faixas disjuntas de vencimento (início, fim].
+    Quem vence em 2 dias só recebe o lembrete de 3, mesmo que o agendador
+    não tenha rodado quando faltavam 7.
+    """
+    windows = []
+    previous = 0
+    for days in sorted(set(AUTOMATION_CONFIG["reminder_days"])):
+        windows.append((f"reminder_{days}", days, now + timedelta(days=previous), now + timedelta(days=days)))
+        previous = days
+    return windows
+
+
+def suspend_cutoff(now):
+    """
+    grace_period_end é a falha + grace_period_days; a suspensão vem
+    auto_suspend_after_days depois da falha. Convertido para um corte em
+    grace_period_end, para a consulta usar o índice.
+    """
+    return now + timedelta(days=AUTOMATION_CONFIG["grace_period_days"] - AUTOMATION_CONFIG["auto_suspend_after_days"])
+
+
+def cancel_cutoff(now):
+    """Suspenso há auto_cancel_after_days, no mesmo eixo de grace_period_end"""
+    return suspend_cutoff(now) - timedelta(days=AUTOMATION_CONFIG["auto_cancel_after_days"])
+
+
+def _not_sent(kind, period_column):
+    return ~exists().where(SubscriptionNotice.advertiser_id == Advertiser.id,
+                           SubscriptionNotice.kind == kind,
+                           SubscriptionNotice.period_end == period_column)
+
+
+def due_query(kind, statuses, period_column, end, start=None):
+    """Anunciantes no status, com a data em (início, fim] e sem o aviso deste ciclo"""
+    query = (db.session.query(Advertiser.id, period_column.label("period_end"))
+             .filter(Advertiser.subscription_status.in_(statuses), period_column <= end,
+                     _not_sent(kind, period_column)))
+    if start is not None:
+        query = query.filter(period_column > start)
+    return query
+
+
+def _record(kind, rows, now):
+    db.session.execute(insert(SubscriptionNotice.__table__), [
+        {"advertiser_id": row.id, "kind": kind, "period_end": row.period_end, "sent_at": now} for row in rows
+    ])
+
+
+def _send(ids, event_type, params):
+    """
+    Coloca os emails do bloco na caixa de saída, na transação do bloco (ver
+    mailer.py). params é um dict ou uma função do anunciante que devolve um.
+    """
+    advertisers = Advertiser.query.options(joinedload(Advertiser.user)).filter(Advertiser.id.in_(ids)).all()
+    for advertiser in advertisers:
+        extra = params(advertiser) if callable(params) else params
+        PagSeguroWebhookHandler.send_automated_email(
+            advertiser, event_type, plan_name=advertiser.subscription_plan.value, **extra
+        )
+
+
+def process_stage(query, kind, now, to_status=None, batch_size=BATCH_SIZE, notify=None):
+    """
+    Processa uma etapa em blocos: os avisos, a mudança de status (se houver)
+    e os emails na caixa de saída vão num único commit por bloco. Retorna os ids.
+    """
+    done = []
+    while True:
+        if to_status is not None:
+            query_batch = query.limit(batch_size).with_for_update()
+        else:
+            query_batch = query.limit(batch_size)
+        rows = query_batch.all()
+        if not rows:
+            db.session.rollback()
+            break
+        ids = [row.id for row in rows]
+        try:
+            _record(kind, rows, now)
+        except IntegrityError:
+            # Outro agendador gravou parte do bloco; o restante fica para a próxima rodada
+            db.session.rollback()
+            break
+        if to_status is not None:
+            table = Advertiser.__table__
+            db.session.execute(
+                update(table).where(table.c.id.in_(ids))
+                .values(subscription_status=to_status, is_active=False, updated_at=now)
+            )
+        if notify and AUTOMATION_CONFIG["email_notifications"]:
+            notify(ids)
+        db.session.commit()
+        if to_status is not None:
+            invalidate_advertisers(ids)
+        done.extend(ids)
+    return done
+
+
+def run_due(now=None, batch_size=BATCH_SIZE):
+    """Roda todas as etapas; retorna {tipo: quantidade de anunciantes}"""
+    now = now or datetime.utcnow()
+    cancel_after = AUTOMATION_CONFIG["auto_cancel_after_days"]
+
+    suspended = process_stage(
+        due_query("suspended", ("payment_pending",), Advertiser.grace_period_end, suspend_cutoff(now)),
+        "suspended", now, SUBSCRIPTION_STATUS["SUSPENDED"], batch_size,
+        lambda ids: _send(ids, "subscription_suspended", {
+            "cancel_after": cancel_after, "payment_update_url": PAYMENT_UPDATE_URL
+        }))
+    cancelled = process_stage(
+        due_query("cancelled", (SUBSCRIPTION_STATUS["SUSPENDED"],), Advertiser.grace_period_end, cancel_cutoff(now)),
+        "cancelled", now, SUBSCRIPTION_STATUS["CANCELLED"], batch_size,
+        lambda ids: _send(ids, "subscription_auto_cancelled", {
+            "cancel_after": cancel_after, "reactivation_url": REACTIVATION_URL
+        }))
+    results = {"suspended": len(suspended), "cancelled": len(cancelled)}
+
+    for kind, _, start, end in reminder_windows(now):
+        sent = process_stage(
+            due_query(kind, reminder_statuses(), Advertiser.subscription_end, end, start),
+            kind, now, batch_size=batch_size,
+            notify=lambda ids: _send(ids, "subscription_reminder", lambda advertiser: {
+                "days_left": max(math.ceil((advertiser.subscription_end - now).total_seconds() / 86400), 1),
+                "expiry_date": advertiser.subscription_end.strftime('%d/%m/%Y'),
+                "renewal_url": RENEWAL_URL
+            }))
+        results[kind] = len(sent)
+    return results
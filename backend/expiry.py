@@ -0,0 +1,99 @@
+"""
+Motor de expiração de assinaturas (comando `flask subscriptions-expire`, para o cron).
+
+Cada transição é aplicada em blocos: seleciona até CHUNK_SIZE ids vencidos
+pelo índice (subscription_status, subscription_end), trava só essas linhas,
+faz um UPDATE em conjunto com o mesmo filtro e confirma o bloco. Nenhum
+anunciante é carregado na sessão e os bloqueios duram um bloco, não a
+execução inteira. Os ids afetados são devolvidos (e passados a `on_chunk`)
+para as notificações.
+
+Dois casos ficam de fora: trials enquanto o modo beta estiver ligado (o
+teste é gratuito por tempo indeterminado, como em routes.py) e cancelados
+pelo agendador de cobrança (dunning.py), que têm grace_period_end. Só o
+cancelamento voluntário, sem carência, mantém o acesso até o vencimento.
+"""
+
+import time
+from datetime import datetime
+from sqlalchemy import update, and_, or_
+from models import db, Advertiser
+from cache import invalidate_advertisers
+from beta_config import is_beta_mode
+from pagseguro_config import SUBSCRIPTION_STATUS
+
+CHUNK_SIZE = 500
+
+# (nome, status de origem, status de destino)
+# payment_pending -> suspended fica só com o agendador de cobrança (dunning.py), pelo fim da carência
+TRANSITIONS = [
+    # Vencimento normal; cancelados por vontade do cliente mantêm o acesso até aqui
+    ("expired", ("trial", SUBSCRIPTION_STATUS["ACTIVE"], SUBSCRIPTION_STATUS["CANCELLED"]),
+     SUBSCRIPTION_STATUS["EXPIRED"]),
+]
+
+
+def eligible(columns, from_statuses):
+    """Filtro de status de origem; `columns` é Advertiser ou Advertiser.__table__.c"""
+    if is_beta_mode():
+        from_statuses = tuple(status for status in from_statuses if status != "trial")
+    return and_(
+        columns.subscription_status.in_(from_statuses),
+        # Cancelado pelo dunning (passou pela carência) não volta a ser alterado aqui
+        or_(columns.subscription_status != SUBSCRIPTION_STATUS["CANCELLED"], columns.grace_period_end.is_(None))
+    )
+
+
+def due_query(from_statuses, now):
+    # Sem ORDER BY: a ordem do índice basta e evita o planejador trocar a faixa pela varredura da PK
+    return (db.session.query(Advertiser.id)
+            .filter(eligible(Advertiser, from_statuses), Advertiser.subscription_end <= now))
+
+
+def due_ids(from_statuses, now, limit):
+    """Próximo bloco de ids vencidos (travados até o commit no MySQL)"""
+    return [row.id for row in due_query(from_statuses, now).limit(limit).with_for_update()]
+
+
+def apply_transition(from_statuses, to_status, now=None, chunk_size=CHUNK_SIZE, dry_run=False, on_chunk=None):
+    """Aplica uma transição em blocos; retorna a lista de ids alterados"""
+    now = now or datetime.utcnow()
+    table = Advertiser.__table__
+    if dry_run:
+        return [row.id for row in due_query(from_statuses, now)]
+
+    changed = []
+    while True:
+        ids = due_ids(from_statuses, now, chunk_size)
+        if not ids:
+            db.session.rollback()
+            break
+
+        db.session.execute(
+            update(table)
+            .where(table.c.id.in_(ids), eligible(table.c, from_statuses), table.c.subscription_end <= now)
+            .values(subscription_status=to_status, is_active=False, updated_at=now)
+        )
+        db.session.commit()
+        invalidate_advertisers(ids)
+        if on_chunk:
+            on_chunk(to_status, ids)
+        changed.extend(ids)
+    return changed
+
+
+def expire_subscriptions(now=None, chunk_size=CHUNK_SIZE, dry_run=False, on_chunk=None):
+    """
+    Roda todas as transições. Retorna {"expired": [ids],
+    "rows": total, "seconds": tempo, "rows_per_second": vazão}.
+    """
+    now = now or datetime.utcnow()
+    started = time.perf_counter()
+    report = {}
+    for name, from_statuses, to_status in TRANSITIONS:
+        report[name] = apply_transition(from_statuses, to_status, now, chunk_size, dry_run, on_chunk)
+    elapsed = time.perf_counter() - started
+    rows = sum(len(report[name]) for name, _, _ in TRANSITIONS)
+    report.update(rows=rows, seconds=round(elapsed, 3),
+                  rows_per_second=round(rows / elapsed, 1) if elapsed else None)
+    return report
@@ -0,0 +1,136 @@
+"""
+Verificação dos planos de execução das consultas quentes (comando `flask explain-check`).
+
+Roda EXPLAIN em cada consulta usada pelos endpoints e aponta as que fazem
+varredura completa de uma tabela grande. Com --seed, insere dados sintéticos
+dentro da transação (desfeita ao final) para o planejador ter volume real.
+"""
+
+from datetime import datetime, timedelta, date
+from sqlalchemy import text, insert
+from sqlalchemy.dialects import mysql, sqlite
+from models import (db, Advertiser, User, State, City, Category, Item, Review, Favorite,
+                    ChatMessage, Conversation, Report, UserType, SubscriptionPlan, AdScope)
+import queries
+import conversations
+import expiry
+import dunning
+from regions import scope_filter
+
+# Tabelas de referência pequenas: varrer uma delas como laço externo é aceitável
+LOOKUP_TABLES = {"state", "city", "category"}
+
+
+def hot_queries():
+    """Consultas dos endpoints quentes, com valores de exemplo nos filtros"""
+    now = datetime.utcnow()
+    return [
+        ("busca por cidade", queries.search_cards()
+            .filter(Advertiser.city_id == 1).order_by(Advertiser.id).limit(21)),
+        ("busca por cidade e categoria", queries.search_cards()
+            .filter(Advertiser.city_id == 1, Advertiser.category_id == 1).order_by(Advertiser.id).limit(21)),
+        ("busca por categoria", queries.search_cards()
+            .filter(Advertiser.category_id == 1).order_by(Advertiser.id).limit(21)),
+        ("busca por visibilidade na cidade", queries.search_cards()
+            .filter(scope_filter(90001, [90001, 90002], list(range(90000, 90010)))).order_by(Advertiser.id).limit(21)),
+        ("busca por avaliação", queries.search_cards()
+            .filter(Advertiser.rating_average >= 4)
+            .order_by(Advertiser.rating_average.desc(), Advertiser.rating_count.desc(), Advertiser.id)
+            .limit(21)),
+        ("top 10 recentes", queries.recent_cards(10)),
+        ("itens em destaque", db.session.query(Item.id, Item.title)
+            .filter(Item.advertiser_id.in_([1, 2, 3]))
+            .order_by(Item.advertiser_id, Item.order, Item.id)),
+        ("favoritos", queries.favorite_cards(1).order_by(Favorite.id).limit(21)),
+        ("denúncias pendentes", queries.pending_report_rows().order_by(Report.id).limit(21)),
+        ("histórico do chat", conversations.messages_query(1, since=100).order_by(ChatMessage.id).limit(21)),
+        ("mensagens novas do chat (push)", ChatMessage.query
+            .join(Conversation, Conversation.id == ChatMessage.conversation_id)
+            .filter(Conversation.user_id == 1, Conversation.advertiser_id == 2, ChatMessage.id > 100)
+            .order_by(ChatMessage.id).limit(100)),
+        ("caixa de entrada do anunciante", conversations.inbox_query(1)
+            .order_by(Conversation.last_message_at.desc(), Conversation.id.desc()).limit(21)),
+        ("anunciantes ativos (painel)", db.session.query(Advertiser.id).filter(Advertiser.is_active == True)),
+        ("novas assinaturas do dia", db.session.query(Advertiser.id)
+            .filter(Advertiser.subscription_start >= date.today())),
+        ("cadastros do dia", db.session.query(Advertiser.id)
+            .filter(Advertiser.created_at >= now.replace(hour=0, minute=0, second=0, microsecond=0))),
+        ("assinaturas vencidas (expiração)", expiry.due_query(expiry.TRANSITIONS[0][1], now).limit(500)),
+        ("lembretes de vencimento", dunning.due_query("reminder_3", dunning.REMINDER_STATUSES,
+            Advertiser.subscription_end, now + timedelta(days=3), now + timedelta(days=1)).limit(200)),
+        ("suspensões por falta de pagamento", dunning.due_query("suspended", ("payment_pending",),
+            Advertiser.grace_period_end, now).limit(200)),
+        ("contagem de itens do anunciante", db.session.query(Item.id).filter(Item.advertiser_id == 1)),
+        ("avaliações do anunciante", db.session.query(Review.id).filter(Review.advertiser_id == 1)),
+    ]
+
+
+def _compile(query, bind):
+    dialect = mysql.dialect() if bind.dialect.name == "mysql" else sqlite.dialect()
+    return str(query.statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+
+def full_scans(bind, sql):
+    """Retorna as tabelas que o plano varre por completo"""
+    if bind.dialect.name == "mysql":
+        rows = bind.execute(text(f"EXPLAIN {sql}")).mappings().all()
+        return [row["table"] for row in rows
+                if row["type"] == "ALL" and row["table"] not in LOOKUP_TABLES]
+
+    scans = []
+    for row in bind.execute(text(f"EXPLAIN QUERY PLAN {sql}")):
+        detail = row[-1]
+        if not detail.startswith("SCAN ") or "USING" in detail or "VIRTUAL TABLE" in detail:
+            continue
+        table = detail.split()[1]
+        if table not in LOOKUP_TABLES:
+            scans.append(table)
+    return scans
+
+
+def seed(bind, advertisers=2000):
+    """Insere dados sintéticos para o planejador (usar só dentro de transação desfeita)"""
+    now = datetime.utcnow()
+    bind.execute(insert(State.__table__), [{"id": 90000 + n, "name": f"Estado {n}", "code": f"Z{n}"}
+                                          for n in range(5)])
+    bind.execute(insert(City.__table__), [{"id": 90000 + n, "name": f"Cidade {n}", "state_id": 90000 + n % 5}
+                                         for n in range(50)])
+    bind.execute(insert(Category.__table__), [{"id": 90000 + n, "name": f"Categoria {n}"} for n in range(20)])
+    bind.execute(insert(User.__table__), [{
+        "id": 900000 + n, "email": f"explain{n}@exemplo.com", "password_hash": "-", "name": f"Usuário {n}",
+        "user_type": UserType.ADVERTISER.name, "created_at": now, "is_active": True
+    } for n in range(advertisers)])
+    bind.execute(insert(Advertiser.__table__), [{
+        "id": 900000 + n, "user_id": 900000 + n, "business_name": f"Empresa {n}", "phone": "0",
+        "cpf": f"EX{n:09d}", "birth_date": date(1980, 1, 1), "city_id": 90000 + n % 50,
+        "category_id": 90000 + n % 20, "ad_scope": list(AdScope)[n % 3].name,
+        "subscription_plan": SubscriptionPlan.MONTHLY.name, "subscription_start": now - timedelta(days=n % 60),
+        "subscription_end": now + timedelta(days=n % 60 - 30), "is_active": n % 10 != 0,
+        "created_at": now - timedelta(days=n % 365), "updated_at": now,
+        "rating_average": n % 5, "rating_count": n % 7
+    } for n in range(advertisers)])
+    bind.execute(insert(Item.__table__), [{
+        "advertiser_id": 900000 + n % advertisers, "title": f"Item {n}", "order": n % 5
+    } for n in range(advertisers * 3)])
+    bind.execute(insert(Favorite.__table__), [{
+        "user_id": 900000 + n % 100, "advertiser_id": 900000 + n
+    } for n in range(advertisers)])
+    bind.execute(insert(Conversation.__table__), [{
+        "id": 900000 + n, "user_id": 900000 + n % 100, "advertiser_id": 900000 + n,
+        "last_message_at": now - timedelta(minutes=n), "created_at": now
+    } for n in range(advertisers)])
+    bind.execute(insert(ChatMessage.__table__), [{
+        "conversation_id": 900000 + n % advertisers, "sender_id": 900000 + n % 100,
+        "advertiser_id": 900000 + n % advertisers, "message": "Olá", "is_from_advertiser": False, "created_at": now
+    } for n in range(advertisers * 3)])
+    bind.execute(insert(Report.__table__), [{
+        "reporter_id": 900000 + n, "advertiser_id": 900000 + n, "reason": "Teste",
+        "status": "pending" if n % 10 == 0 else "resolved", "created_at": now
+    } for n in range(advertisers // 2)])
+    if bind.dialect.name == "sqlite":
+        bind.execute(text("ANALYZE"))
+
+
+def check_plans(bind):
+    """Executa EXPLAIN em todas as consultas; retorna [(nome, [tabelas varridas])]"""
+    return [(name, full_scans(bind, _compile(query, bind))) for name, query in hot_queries()]
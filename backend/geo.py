@@ -0,0 +1,190 @@
+"""
+Busca por proximidade ("perto de mim").
+
+Cada anunciante com latitude/longitude recebe uma célula de uma grade fixa
+(geo_cell, indexada). A busca seleciona as células que cobrem o retângulo
+do raio pedido e filtra pelo retângulo. Dentro dele, o banco ordena e
+limita por uma distância aproximada (plana, só com aritmética, para valer
+no MySQL e no SQLite). A distância exata (haversine) é calculada só nos
+lotes lidos, que param assim que nenhuma linha ainda não lida pode entrar
+na página.
+"""
+
+import math
+from sqlalchemy import event, not_, or_
+from models import Advertiser, AdScope
+from pagination import encode_cursor, decode_cursor, InvalidCursor
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Folga da distância aproximada: a geodésica pode sair um pouco do retângulo
+# em direção ao polo, onde o cosseno é menor que o usado na aproximação
+APPROX_SLACK = 0.005
+
+CELL_SIZE_DEG = 0.2  # ~22 km de latitude por célula
+GRID_COLUMNS = int(round(360 / CELL_SIZE_DEG))
+
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 100
+
+# Até que distância do ponto de busca cada escopo de anúncio aparece
+# (None = sem limite além do raio pedido)
+SCOPE_MAX_DISTANCE_KM = {
+    AdScope.CITY: 15,
+    AdScope.CITY_REGION: 100,
+    AdScope.CITY_REGION_OTHER_STATES: None
+}
+
+
+def geo_cell(latitude, longitude):
+    """Célula da grade que contém o ponto (None se não houver coordenadas)"""
+    if latitude is None or longitude is None:
+        return None
+    row = int(math.floor((latitude + 90) / CELL_SIZE_DEG))
+    column = int(math.floor((longitude + 180) / CELL_SIZE_DEG)) % GRID_COLUMNS
+    return row * GRID_COLUMNS + column
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Distância em km entre dois pontos na superfície da Terra"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """Retângulo (min_lat, max_lat, min_lng, max_lng) que contém o círculo do raio"""
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+    d_lng = min(math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)), 180)
+    return (max(latitude - d_lat, -90), min(latitude + d_lat, 90),
+            max(longitude - d_lng, -180), min(longitude + d_lng, 180))
+
+
+def cells_for_box(min_lat, max_lat, min_lng, max_lng):
+    """Células da grade que cobrem o retângulo"""
+    first_row = int(math.floor((min_lat + 90) / CELL_SIZE_DEG))
+    last_row = int(math.floor((max_lat + 90) / CELL_SIZE_DEG))
+    first_column = int(math.floor((min_lng + 180) / CELL_SIZE_DEG))
+    last_column = int(math.floor((max_lng + 180) / CELL_SIZE_DEG))
+    return [row * GRID_COLUMNS + column % GRID_COLUMNS
+            for row in range(first_row, last_row + 1)
+            for column in range(first_column, last_column + 1)]
+
+
+def _box_cos(min_lat, max_lat):
+    """Menor e maior cosseno das latitudes do retângulo"""
+    cosines = [math.cos(math.radians(value)) for value in (min_lat, max_lat)]
+    smallest = max(min(cosines), 0.01)
+    largest = 1.0 if min_lat <= 0 <= max_lat else max(cosines)
+    return smallest, largest
+
+
+def approx_distance_km2(latitude, longitude, lng_scale):
+    """
+    Quadrado da distância plana até o ponto, em km². Com lng_scale = menor
+    cosseno do retângulo, fica abaixo da distância real (até APPROX_SLACK).
+    """
+    d_lat = (Advertiser.latitude - latitude) * KM_PER_DEGREE
+    d_lng = (Advertiser.longitude - longitude) * (KM_PER_DEGREE * lng_scale)
+    return d_lat * d_lat + d_lng * d_lng
+
+
+def nearby_candidates(query, latitude, longitude, radius_km):
+    """
+    Pré-filtro indexado: células da grade + retângulo do raio, mais o raio e
+    o limite de cada escopo pela distância aproximada. Retorna a consulta
+    ordenada pela aproximação (coluna approx_km2), ainda sem limite, e a
+    expressão da aproximação.
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, radius_km)
+    lng_scale, _ = _box_cos(min_lat, max_lat)
+    approx = approx_distance_km2(latitude, longitude, lng_scale)
+    reach = radius_km * (1 + APPROX_SLACK)
+    scope_limits = [(Advertiser.ad_scope == scope) & (approx > (max_km * (1 + APPROX_SLACK)) ** 2)
+                    for scope, max_km in SCOPE_MAX_DISTANCE_KM.items() if max_km is not None and max_km < radius_km]
+    query = (
+        query
+        .add_columns(Advertiser.latitude, Advertiser.longitude, Advertiser.ad_scope, approx.label("approx_km2"))
+        .filter(Advertiser.geo_cell.in_(cells_for_box(min_lat, max_lat, min_lng, max_lng)))
+        .filter(Advertiser.latitude.between(min_lat, max_lat))
+        .filter(Advertiser.longitude.between(min_lng, max_lng))
+        .filter(approx <= reach * reach)
+    )
+    if scope_limits:
+        query = query.filter(not_(or_(*scope_limits)))
+    return query.order_by(approx, Advertiser.id), approx
+
+
+def is_visible_at(ad_scope, distance_km):
+    """O escopo do anúncio permite aparecer a essa distância?"""
+    max_distance = SCOPE_MAX_DISTANCE_KM.get(ad_scope)
+    return max_distance is None or distance_km <= max_distance
+
+
+def rank_by_distance(rows, latitude, longitude, radius_km):
+    """Distância exata dos candidatos, respeitando raio e escopo; ordenado por (distância, id)"""
+    ranked = []
+    for row in rows:
+        distance = haversine_km(latitude, longitude, row.latitude, row.longitude)
+        if distance <= radius_km and is_visible_at(row.ad_scope, distance):
+            ranked.append((round(distance, 3), row))
+    ranked.sort(key=lambda pair: (pair[0], pair[1].id))
+    return ranked
+
+
+def nearby_page(query, latitude, longitude, radius_km, limit, cursor=None):
+    """
+    Página por cursor (distância exata, id). O banco entrega os candidatos em
+    lotes de limit + 2 na ordem da distância aproximada, e a leitura para
+    quando a aproximação da última linha lida (um limite inferior da
+    distância real) passa da distância da linha limit + 1 já encontrada. A
+    linha a mais costuma bastar para parar no primeiro lote.
+    Retorna ([(distância, linha)], cursor da próxima página ou None).
+    """
+    last_key = None
+    candidates, approx = nearby_candidates(query, latitude, longitude, radius_km)
+    if cursor:
+        last_distance, last_id = decode_cursor(cursor, 2)
+        try:
+            last_key = (float(last_distance), int(last_id))
+        except (TypeError, ValueError) as e:
+            raise InvalidCursor(cursor) from e
+        # Só pula o que com certeza já foi entregue (a aproximação subestima no máximo
+        # pela razão entre os cossenos do retângulo)
+        min_lat, max_lat, _, _ = bounding_box(latitude, longitude, radius_km)
+        smallest, largest = _box_cos(min_lat, max_lat)
+        floor_km = last_key[0] * smallest / largest * (1 - APPROX_SLACK)
+        candidates = candidates.filter(approx >= floor_km * floor_km)
+
+    ranked = []
+    batch_size = limit + 2
+    after = None
+    while True:
+        batch = candidates
+        if after is not None:
+            batch = batch.filter((approx > after[0]) | ((approx == after[0]) & (Advertiser.id > after[1])))
+        rows = batch.limit(batch_size).all()
+        for distance, row in rank_by_distance(rows, latitude, longitude, radius_km):
+            if last_key is None or (distance, row.id) > last_key:
+                ranked.append((distance, row))
+        ranked.sort(key=lambda pair: (pair[0], pair[1].id))
+        if len(rows) < batch_size:
+            break
+        after = (rows[-1].approx_km2, rows[-1].id)
+        if len(ranked) > limit and math.sqrt(after[0]) * (1 - APPROX_SLACK) > ranked[limit][0]:
+            break
+
+    page = ranked[:limit]
+    next_cursor = None
+    if len(ranked) > limit:
+        next_cursor = encode_cursor([page[-1][0], page[-1][1].id])
+    return page, next_cursor
+
+
+@event.listens_for(Advertiser, "before_insert")
+@event.listens_for(Advertiser, "before_update")
+def _update_geo_cell(mapper, connection, target):
+    target.geo_cell = geo_cell(target.latitude, target.longitude)
@@ -0,0 +1,88 @@
+"""
+Cache HTTP: requisições condicionais (ETag / Last-Modified) e Cache-Control por endpoint.
+
+`conditional` consulta só os marcadores de versão do recurso e responde 304
+quando o cliente já tem a versão atual, sem executar a view (nem carregar os
+itens). As respostas 200 saem com ETag e Last-Modified para o navegador e
+qualquer CDN na frente do servidor revalidarem depois.
+"""
+
+import hashlib
+from datetime import timezone
+from functools import wraps
+from flask import current_app, request, g
+from queries import advertiser_version
+
+
+def make_etag(*parts):
+    """ETag forte a partir dos marcadores de versão do recurso"""
+    raw = "|".join("" if part is None else str(part) for part in parts)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _as_utc(value):
+    return value.replace(tzinfo=timezone.utc, microsecond=0) if value else None
+
+
+def not_modified(etag, last_modified):
+    """O cliente já tem esta versão? If-None-Match tem precedência sobre If-Modified-Since"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified and request.if_modified_since:
+        return _as_utc(last_modified) <= request.if_modified_since
+    return False
+
+
+def conditional(validator):
+    """
+    Decorador para views GET. `validator(**view_args)` devolve
+    (etag, last_modified) ou None se o recurso não existir (a view decide o 404).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = validator(**kwargs)
+            if version is None:
+                return view(*args, **kwargs)
+
+            etag, last_modified = version
+            # O cache de respostas (cache.py) inclui a versão na chave
+            g.resource_version = etag
+            if not_modified(etag, last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = _as_utc(last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def cache_control(**directives):
+    """Define o Cache-Control das respostas 200/304 (ex: public=True, max_age=60)"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code in (200, 304):
+                for name, value in directives.items():
+                    setattr(response.cache_control, name, value)
+            return response
+        return wrapper
+    return decorator
+
+
+def advertiser_validator(advertiser_id):
+    """Versão do perfil público /advertiser/<id> (anunciante + itens)"""
+    row = advertiser_version(advertiser_id)
+    if row is None:
+        return None
+    last_modified = max(filter(None, (row.updated_at, row.items_updated_at)), default=None)
+    etag = make_etag(advertiser_id, row.updated_at and row.updated_at.isoformat(),
+                     row.items_updated_at and row.items_updated_at.isoformat(),
+                     row.item_count, row.rating_sum, row.rating_count)
+    return etag, last_modified
@@ -0,0 +1,210 @@
+"""
+Fila de processamento de imagens em segundo plano.
+
+O upload é gravado em blocos numa área de staging endereçada pelo sha256 do
+conteúdo e vira um ImageJob no banco (as variantes vão para o armazenamento
+por conteúdo de storage.py); a requisição responde na hora com o id
+do job. O processamento roda num pool de processos limitado (IMAGE_WORKERS) ou,
+com IMAGE_WORKERS = 0, pelo comando `flask image-worker`, que também recupera
+jobs interrompidos. Com a fila cheia (IMAGE_QUEUE_MAX jobs pendentes) o
+upload é recusado para o cliente tentar de novo mais tarde.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from flask import current_app
+from sqlalchemy import update
+from models import db, ImageJob
+import images
+import storage
+
+STAGING_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads_staging")
+CHUNK_SIZE = 64 * 1024
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_MAX = 50
+STALE_AFTER = timedelta(minutes=5)  # "processing" há mais tempo que isso volta para a fila
+UNFINISHED = ("queued", "processing")
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+class QueueFull(Exception):
+    pass
+
+
+def staging_folder():
+    """Área de staging: UPLOAD_STAGING_FOLDER da configuração ou uploads_staging/ ao lado do código"""
+    return current_app.config.get("UPLOAD_STAGING_FOLDER") or STAGING_FOLDER
+
+
+def stage_upload(file_storage, folder=None):
+    """Grava o upload em blocos calculando o sha256; o arquivo final tem o hash como nome"""
+    folder = folder or staging_folder()
+    os.makedirs(folder, exist_ok=True)
+    digest = hashlib.sha256()
+    partial_path = os.path.join(folder, f".{uuid.uuid4().hex}.part")
+    with open(partial_path, "wb") as out:
+        for chunk in iter(lambda: file_storage.stream.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            out.write(chunk)
+    source_hash = digest.hexdigest()
+    path = os.path.join(folder, source_hash)
+    os.replace(partial_path, path)  # Mesmo conteúdo, mesmo arquivo
+    return source_hash, path
+
+
+def staged_path(source_hash):
+    return os.path.join(staging_folder(), source_hash)
+
+
+def discard_staged(source_hash):
+    """Remove o arquivo de staging se nenhum job pendente ainda precisar dele"""
+    pending = db.session.query(ImageJob.id).filter(
+        ImageJob.source_hash == source_hash, ImageJob.status.in_(UNFINISHED)
+    ).first()
+    if pending is None:
+        try:
+            os.remove(staged_path(source_hash))
+        except FileNotFoundError:
+            pass
+
+
+def upload_result(rendered):
+    """URLs da imagem processada no formato devolvido ao frontend"""
+    full = rendered["full"][images.DEFAULT_FORMAT]
+    return {
+        "image_url": f"{storage.URL_PREFIX}{full}",
+        "filename": full,
+        "variants": {name: {ext: f"{storage.URL_PREFIX}{files[ext]}" for ext in images.FORMATS}
+                     for name, files in rendered.items()},
+        "srcset": images.srcset(storage.URL_PREFIX, rendered)
+    }
+
+
+def job_payload(job):
+    """Estado do job para o cliente (com as URLs quando terminado)"""
+    payload = {"job_id": job.id, "status": job.status}
+    if job.status == "done":
+        payload.update(json.loads(job.result))
+    elif job.status == "failed":
+        payload["error"] = job.error
+    return payload
+
+
+def enqueue(user_id, source_hash):
+    """Cria o job (ou reaproveita o resultado do mesmo arquivo) e dispara o processamento"""
+    job = ImageJob(id=uuid.uuid4().hex, user_id=user_id, source_hash=source_hash,
+                   base_name=storage.blob_base(source_hash))
+
+    previous = db.session.query(ImageJob.result).filter(
+        ImageJob.source_hash == source_hash, ImageJob.status == "done"
+    ).first()
+    if previous is not None and storage.has_blob(source_hash):
+        # Mesmo conteúdo já armazenado: as variantes existentes servem
+        storage.touch_blob(source_hash)
+        job.status = "done"
+        job.result = previous.result
+        db.session.add(job)
+        db.session.commit()
+        discard_staged(source_hash)
+        return job
+
+    pending = db.session.query(db.func.count(ImageJob.id)).filter(ImageJob.status.in_(UNFINISHED)).scalar()
+    if pending >= current_app.config.get("IMAGE_QUEUE_MAX", DEFAULT_QUEUE_MAX):
+        discard_staged(source_hash)
+        raise QueueFull()
+
+    db.session.add(job)
+    db.session.commit()
+    dispatch(job)
+    return job
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        # Um pool por processo: workers do Gunicorn criados por fork não herdam o do pai
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=current_app.config.get("IMAGE_WORKERS", DEFAULT_WORKERS))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def claim(job_id):
+    """Marca o job como em processamento; False se outro processo já pegou"""
+    claimed = db.session.execute(
+        update(ImageJob.__table__)
+        .where(ImageJob.__table__.c.id == job_id, ImageJob.__table__.c.status == "queued")
+        .values(status="processing", attempts=ImageJob.__table__.c.attempts + 1, updated_at=datetime.utcnow())
+    ).rowcount == 1
+    db.session.commit()
+    return claimed
+
+
+def dispatch(job):
+    """Envia o job ao pool de processos (sem pool, fica na fila para `flask image-worker`)"""
+    if not current_app.config.get("IMAGE_WORKERS", DEFAULT_WORKERS) or not claim(job.id):
+        return
+    future = _get_pool().submit(images.process_file, staged_path(job.source_hash), storage.upload_folder(),
+                                job.base_name)
+    future.add_done_callback(partial(_on_done, current_app._get_current_object(), job.id, job.source_hash))
+
+
+def _on_done(app, job_id, source_hash, future):
+    with app.app_context():
+        try:
+            finish(job_id, source_hash, future.result)
+        finally:
+            db.session.remove()
+
+
+def finish(job_id, source_hash, get_rendered):
+    """Grava o resultado (ou o erro) do processamento e limpa o staging"""
+    values = {"updated_at": datetime.utcnow()}
+    try:
+        values.update(status="done", result=json.dumps(upload_result(get_rendered())))
+    except images.InvalidImage as e:
+        values.update(status="failed", error=str(e))
+    except Exception as e:
+        values.update(status="failed", error=f"Erro ao processar imagem: {e}"[:255])
+    db.session.execute(update(ImageJob.__table__).where(ImageJob.__table__.c.id == job_id).values(**values))
+    db.session.commit()
+    discard_staged(source_hash)
+
+
+def requeue_stale(now=None):
+    """Devolve à fila jobs "processing" abandonados (processo reiniciado no meio)"""
+    cutoff = (now or datetime.utcnow()) - STALE_AFTER
+    count = db.session.execute(
+        update(ImageJob.__table__)
+        .where(ImageJob.__table__.c.status == "processing", ImageJob.__table__.c.updated_at < cutoff)
+        .values(status="queued")
+    ).rowcount
+    db.session.commit()
+    return count
+
+
+def run_pending(limit=None):
+    """Processa jobs da fila neste processo, em ordem de chegada; retorna quantos processou"""
+    processed = 0
+    while limit is None or processed < limit:
+        job = (ImageJob.query.filter_by(status="queued")
+               .order_by(ImageJob.created_at, ImageJob.id).first())
+        if job is None:
+            break
+        job_id, source_hash, base_name = job.id, job.source_hash, job.base_name
+        if not claim(job_id):
+            continue
+        finish(job_id, source_hash,
+               partial(images.process_file, staged_path(source_hash), storage.upload_folder(), base_name))
+        processed += 1
+    return processed
@@ -0,0 +1,120 @@
+"""
+Processamento das imagens enviadas (logos e fotos de itens).
+
+Cada upload é decodificado uma única vez, tem a orientação EXIF aplicada e os
+metadados descartados, e vira um conjunto fixo de variantes (thumbnail, card,
+full) em WebP e JPEG. As listagens usam a thumbnail; o perfil usa o srcset.
+"""
+
+import os
+import re
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Lado maior (px) de cada variante, da menor para a maior
+VARIANTS = {"thumbnail": 160, "card": 480, "full": 1280}
+FORMATS = {"webp": ("WEBP", {"quality": 80, "method": 4}),
+           "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True})}
+DEFAULT_FORMAT = "jpg"
+
+ACCEPTED_FORMATS = {"JPEG", "PNG", "GIF", "WEBP"}
+MAX_SOURCE_PIXELS = 40_000_000  # ~ foto de 40 MP; acima disso é recusado antes de decodificar
+
+# Nome gerado: <base>_<variante>.<formato>
+_VARIANT_RE = re.compile(r"^(?P<base>.+)_(?P<variant>%s)\.(?P<ext>%s)$"
+                         % ("|".join(VARIANTS), "|".join(FORMATS)))
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def probe(stream):
+    """Valida formato e dimensões lendo só o cabeçalho (não decodifica os pixels)"""
+    try:
+        image = Image.open(stream)
+    except UnidentifiedImageError as e:
+        raise InvalidImage("Arquivo não é uma imagem válida") from e
+    if image.format not in ACCEPTED_FORMATS:
+        raise InvalidImage("Formato de imagem não suportado")
+    if image.width * image.height > MAX_SOURCE_PIXELS:
+        raise InvalidImage("Imagem grande demais")
+    return image
+
+
+def load_image(stream):
+    """Decodifica o upload uma vez, já reduzido ao tamanho da maior variante"""
+    image = probe(stream)
+    largest = max(VARIANTS.values())
+    # JPEG: decodifica direto em escala reduzida (DCT), bem mais barato que abrir em tamanho cheio
+    image.draft("RGB", (largest, largest))
+    try:
+        image.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise InvalidImage("Imagem corrompida ou grande demais") from e
+
+    # Aplica a rotação do EXIF; os metadados não são copiados para as variantes
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+    return image
+
+
+def _flatten(image):
+    """JPEG não tem transparência: aplica sobre fundo branco"""
+    if image.mode != "RGBA":
+        return image
+    background = Image.new("RGB", image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel("A"))
+    return background
+
+
+def render_variants(image, folder, base_name):
+    """Grava todas as variantes; retorna {variante: {formato: nome_do_arquivo, "width": px}}"""
+    rendered = {}
+    os.makedirs(os.path.dirname(os.path.join(folder, base_name)) or folder, exist_ok=True)
+    current = image
+    # Da maior para a menor: cada redução parte da anterior, não do original
+    for variant, size in sorted(VARIANTS.items(), key=lambda pair: -pair[1]):
+        current = current.copy()
+        current.thumbnail((size, size), Image.LANCZOS)
+        files = {"width": current.width, "height": current.height}
+        for ext, (pil_format, options) in FORMATS.items():
+            filename = f"{base_name}_{variant}.{ext}"
+            target = current if pil_format == "WEBP" else _flatten(current)
+            path = os.path.join(folder, filename)
+            # Grava num temporário e troca: ninguém lê um arquivo pela metade
+            target.save(f"{path}.{os.getpid()}.tmp", pil_format, **options)
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+            files[ext] = filename
+        rendered[variant] = files
+    return rendered
+
+
+def process_file(path, folder, base_name):
+    """Decodifica o arquivo e grava as variantes (executado no pool de processos)"""
+    with open(path, "rb") as f:
+        return render_variants(load_image(f), folder, base_name)
+
+
+def variant_url(url, variant, ext=None):
+    """URL de outra variante da mesma imagem; URLs que não seguem o padrão voltam inalteradas"""
+    if not url:
+        return url
+    folder, _, filename = url.rpartition("/")
+    match = _VARIANT_RE.match(filename)
+    if not match:
+        return url
+    return f"{folder}/{match['base']}_{variant}.{ext or match['ext']}"
+
+
+def thumbnail_url(url):
+    return variant_url(url, "thumbnail")
+
+
+def srcset(url_prefix, rendered):
+    """Mapa de srcset por formato, ex: {"webp": "/uploads/a_thumbnail.webp 160w, ..."}"""
+    return {
+        ext: ", ".join(f"{url_prefix}{files[ext]} {files['width']}w"
+                       for _, files in sorted(rendered.items(), key=lambda pair: pair[1]["width"]))
+        for ext in FORMATS
+    }
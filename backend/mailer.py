@@ -0,0 +1,227 @@
+"""
+Caixa de saída dos emails automáticos.
+
+queue_email só renderiza a mensagem e a adiciona à sessão: ela entra no
+commit da mudança de assinatura que a gerou (ou some junto no rollback) e
+nenhuma requisição espera pelo SMTP. O worker (`flask email-worker`) pega os
+pendentes em blocos e envia tudo por uma única conexão SMTP, reaproveitada
+entre os blocos, respeitando MAIL_RATE_PER_MINUTE. Cada mensagem termina
+"sent", volta para "pending" com espera exponencial em falhas temporárias
+(conexão, respostas 4xx) ou vai para "dead" quando o servidor recusa de vez
+(5xx) ou as tentativas acabam.
+"""
+
+import smtplib
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+from flask import current_app
+from sqlalchemy import update
+from models import db, EmailOutbox
+from pagseguro_config import get_automated_message
+
+MAX_ATTEMPTS = 6
+BASE_DELAY = 60  # segundos; dobra a cada tentativa
+MAX_DELAY = 6 * 3600
+STALE_AFTER = timedelta(minutes=10)  # "sending" há mais tempo que isso volta para a fila
+BATCH_SIZE = 50
+SMTP_TIMEOUT = 30
+
+
+def queue_email(to_email, event_type, **kwargs):
+    """Adiciona o email à sessão atual (o commit fica com quem chama); None se o evento não tem template"""
+    message = get_automated_message(event_type, **kwargs)
+    if message is None:
+        return None
+    email = EmailOutbox(
+        to_email=to_email,
+        event_type=event_type,
+        subject=message["subject"][:255],
+        body=message["body"],
+        next_attempt_at=datetime.utcnow()
+    )
+    db.session.add(email)
+    return email
+
+
+class SMTPConnection:
+    """Uma conexão SMTP aberta sob demanda e reaproveitada; reconecta se o servidor derrubar"""
+
+    def __init__(self, host, port, use_tls=False, username=None, password=None, sender=None):
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.username = username
+        self.password = password
+        self.sender = sender
+        self._smtp = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get("MAIL_SERVER", "localhost"), config.get("MAIL_PORT", 25),
+                   config.get("MAIL_USE_TLS", False), config.get("MAIL_USERNAME"),
+                   config.get("MAIL_PASSWORD"), config.get("MAIL_DEFAULT_SENDER") or config.get("SUPPORT_EMAIL"))
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        if self.use_tls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        self._smtp = smtp
+
+    def send(self, email):
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = email.to_email
+        message["Subject"] = email.subject
+        message["Date"] = formatdate(localtime=True)
+        message["Message-ID"] = make_msgid(idstring=f"outbox-{email.id}")
+        message.set_content(email.body)
+
+        # Conexão parada pode ter sido fechada pelo servidor: uma reconexão antes de desistir
+        for retry in (False, True):
+            if self._smtp is None:
+                self._connect()
+            try:
+                self._smtp.send_message(message)
+                return
+            except smtplib.SMTPServerDisconnected:
+                self._smtp = None
+                if retry:
+                    raise
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+
+class RateLimiter:
+    """Espaça os envios para não passar de per_minute mensagens por minuto"""
+
+    def __init__(self, per_minute, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 60.0 / per_minute if per_minute else 0
+        self.clock = clock
+        self.sleep = sleep
+        self._next = 0.0
+
+    def wait(self):
+        now = self.clock()
+        if now < self._next:
+            self.sleep(self._next - now)
+            now = self._next
+        self._next = now + self.interval
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(BASE_DELAY * 2 ** (attempts - 1), MAX_DELAY))
+
+
+def is_permanent(error):
+    """Recusa definitiva do servidor (5xx); o resto é tratado como temporário"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def claim_batch(now, limit=BATCH_SIZE):
+    """Reivindica até `limit` emails vencidos, num único commit; retorna só os que este worker pegou"""
+    table = EmailOutbox.__table__
+    ids = [row.id for row in db.session.query(EmailOutbox.id)
+           .filter(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+           .order_by(EmailOutbox.id).limit(limit)]
+    claimed = []
+    for email_id in ids:
+        # Em "sending", next_attempt_at guarda o início do envio (ver requeue_stale)
+        if db.session.execute(
+            update(table)
+            .where(table.c.id == email_id, table.c.status == "pending")
+            .values(status="sending", attempts=table.c.attempts + 1, next_attempt_at=now)
+        ).rowcount == 1:
+            claimed.append(email_id)
+    db.session.commit()
+    if not claimed:
+        return []
+    return EmailOutbox.query.filter(EmailOutbox.id.in_(claimed)).order_by(EmailOutbox.id).all()
+
+
+def deliver(batch, connection, limiter, now):
+    """Envia o bloco e grava o resultado de cada mensagem; retorna {resultado: quantidade}"""
+    table = EmailOutbox.__table__
+    results = {}
+    sent = []
+    for email in batch:
+        limiter.wait()
+        try:
+            connection.send(email)
+        except (smtplib.SMTPException, OSError) as e:
+            message = str(e)[:255]
+            if is_permanent(e) or email.attempts >= MAX_ATTEMPTS:
+                outcome = "dead"
+                values = {"status": "dead", "last_error": message}
+            else:
+                outcome = "retry"
+                values = {"status": "pending", "last_error": message,
+                          "next_attempt_at": now + retry_delay(email.attempts)}
+            db.session.execute(update(table).where(table.c.id == email.id).values(**values))
+        else:
+            outcome = "sent"
+            sent.append(email.id)
+        results[outcome] = results.get(outcome, 0) + 1
+
+    if sent:
+        db.session.execute(
+            update(table).where(table.c.id.in_(sent))
+            .values(status="sent", sent_at=datetime.utcnow(), last_error=None)
+        )
+    db.session.commit()
+    return results
+
+
+def run_pending(connection=None, limiter=None, limit=None):
+    """Envia os emails vencidos em blocos; retorna {resultado: quantidade}"""
+    own_connection = connection is None
+    if own_connection:
+        connection = SMTPConnection.from_config(current_app.config)
+    limiter = limiter or RateLimiter(current_app.config.get("MAIL_RATE_PER_MINUTE", 60))
+
+    results = {}
+    processed = 0
+    try:
+        while limit is None or processed < limit:
+            now = datetime.utcnow()
+            size = BATCH_SIZE if limit is None else min(BATCH_SIZE, limit - processed)
+            batch = claim_batch(now, size)
+            if not batch:
+                break
+            for outcome, count in deliver(batch, connection, limiter, now).items():
+                results[outcome] = results.get(outcome, 0) + count
+            processed += len(batch)
+            db.session.expunge_all()
+    finally:
+        if own_connection:
+            connection.close()
+    return results
+
+
+def requeue_stale(now=None):
+    """Devolve à fila emails "sending" abandonados (worker reiniciado no meio do bloco)"""
+    cutoff = (now or datetime.utcnow()) - STALE_AFTER
+    table = EmailOutbox.__table__
+    count = db.session.execute(
+        update(table)
+        .where(table.c.status == "sending", table.c.next_attempt_at < cutoff)
+        .values(status="pending")
+    ).rowcount
+    db.session.commit()
+    return count
+
+
+def status_counts():
+    return dict(db.session.query(EmailOutbox.status, db.func.count(EmailOutbox.id))
+                .group_by(EmailOutbox.status).all())
@@ -0,0 +1,43 @@
+"""Add advertiser rating aggregates
+
+Revision ID: 22f28986bbea
+Revises: d54c79e9e85f
+Create Date: 2026-10-18 10:03:17.284551
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '22f28986bbea'
+down_revision = 'd54c79e9e85f'
+branch_labels = None
+depends_on = None
+
+RATING_COLUMNS = ['rating_sum', 'rating_count', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+
+
+def upgrade():
+    with op.batch_alter_table('advertiser', schema=None) as batch_op:
+        for column in RATING_COLUMNS:
+            batch_op.add_column(sa.Column(column, sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('rating_average', sa.Float(), nullable=False, server_default='0'))
+
+    # Preencher a partir das avaliações existentes (equivalente a `flask ratings-repair`)
+    for column, expression in [
+        ('rating_sum', 'SUM(review.rating)'),
+        ('rating_count', 'COUNT(*)'),
+        ('rating_average', 'AVG(review.rating)'),
+    ] + [('rating_%d' % stars, 'SUM(CASE WHEN review.rating = %d THEN 1 ELSE 0 END)' % stars) for stars in range(1, 6)]:
+        op.execute(
+            "UPDATE advertiser SET %s = COALESCE((SELECT %s FROM review "
+            "WHERE review.advertiser_id = advertiser.id), 0)" % (column, expression)
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('advertiser', schema=None) as batch_op:
+        batch_op.drop_column('rating_average')
+        for column in reversed(RATING_COLUMNS):
+            batch_op.drop_column(column)
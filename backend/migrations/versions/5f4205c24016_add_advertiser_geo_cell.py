@@ -0,0 +1,47 @@
+"""Add advertiser geo cell for proximity search
+
+Revision ID: 5f4205c24016
+Revises: bc40e7045ef4
+Create Date: 2026-10-18 11:26:09.441873
+
+"""
+import math
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f4205c24016'
+down_revision = 'bc40e7045ef4'
+branch_labels = None
+depends_on = None
+
+# Mesma grade de geo.py (CELL_SIZE_DEG = 0.2)
+CELL_SIZE_DEG = 0.2
+GRID_COLUMNS = int(round(360 / CELL_SIZE_DEG))
+
+
+def upgrade():
+    with op.batch_alter_table('advertiser', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('geo_cell', sa.Integer(), nullable=True))
+    op.create_index('ix_advertiser_active_geo_cell', 'advertiser', ['is_active', 'geo_cell'], unique=False)
+
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        "SELECT id, latitude, longitude FROM advertiser "
+        "WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+    )).fetchall()
+    updates = [{
+        'id': advertiser_id,
+        'geo_cell': int(math.floor((latitude + 90) / CELL_SIZE_DEG)) * GRID_COLUMNS
+                    + int(math.floor((longitude + 180) / CELL_SIZE_DEG)) % GRID_COLUMNS
+    } for advertiser_id, latitude, longitude in rows]
+    if updates:
+        bind.execute(sa.text("UPDATE advertiser SET geo_cell = :geo_cell WHERE id = :id"), updates)
+
+
+def downgrade():
+    op.drop_index('ix_advertiser_active_geo_cell', table_name='advertiser')
+    with op.batch_alter_table('advertiser', schema=None) as batch_op:
+        batch_op.drop_column('geo_cell')
@@ -0,0 +1,36 @@
+"""Add daily stats
+
+Revision ID: 8a1e35ce6f07
+Revises: c168da174414
+Create Date: 2026-10-18 18:02:11.304517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a1e35ce6f07'
+down_revision = 'c168da174414'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Contadores do painel do administrador, uma linha por dia (preenchida por `flask stats-rollup`)
+    op.create_table('daily_stats',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('total_users', sa.Integer(), nullable=False),
+        sa.Column('total_advertisers', sa.Integer(), nullable=False),
+        sa.Column('active_advertisers', sa.Integer(), nullable=False),
+        sa.Column('pending_reports', sa.Integer(), nullable=False),
+        sa.Column('new_signups', sa.Integer(), nullable=False),
+        sa.Column('new_subscriptions', sa.Integer(), nullable=False),
+        sa.Column('new_reports', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('day')
+    )
+
+
+def downgrade():
+    op.drop_table('daily_stats')
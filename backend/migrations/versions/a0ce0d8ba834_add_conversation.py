@@ -0,0 +1,94 @@
+"""Add conversation table and chat_message.conversation_id
+
+Revision ID: a0ce0d8ba834
+Revises: a1a7bea3a7b0
+Create Date: 2026-10-18 13:42:07.118524
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a0ce0d8ba834'
+down_revision = 'a1a7bea3a7b0'
+branch_labels = None
+depends_on = None
+
+# Mensagens antigas: do consumidor (sender_id = consumidor, advertiser_id = anunciante) ou
+# do anunciante (is_from_advertiser, com os dois campos invertidos - mesmo critério da consulta antiga)
+CONSUMER_MESSAGES = "(is_from_advertiser = 0 OR is_from_advertiser IS NULL)"
+ADVERTISER_MESSAGES = "is_from_advertiser = 1"
+
+
+def upgrade():
+    op.create_table('conversation',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('advertiser_id', sa.Integer(), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), nullable=True),
+        sa.Column('last_message_at', sa.DateTime(), nullable=False),
+        sa.Column('user_unread', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('advertiser_unread', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['advertiser_id'], ['advertiser.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'advertiser_id', name='unique_user_advertiser_conversation')
+    )
+    op.create_index('ix_conversation_advertiser_activity', 'conversation',
+                    ['advertiser_id', 'last_message_at', 'id'], unique=False)
+    op.create_index('ix_conversation_user_activity', 'conversation',
+                    ['user_id', 'last_message_at', 'id'], unique=False)
+
+    with op.batch_alter_table('chat_message', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('conversation_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_chat_message_conversation_id', 'conversation', ['conversation_id'], ['id'])
+        batch_op.create_index('ix_chat_message_conversation_id', ['conversation_id', 'id'], unique=False)
+        # sender_id ganha índice próprio antes de sair o índice composto da consulta com OR
+        batch_op.create_index('ix_chat_message_sender_id', ['sender_id'], unique=False)
+        batch_op.drop_index('ix_chat_message_conversation')
+
+    # Uma conversa por par (consumidor, anunciante) que já trocou mensagens
+    op.execute(f"""
+        INSERT INTO conversation (user_id, advertiser_id, last_message_at, user_unread, advertiser_unread, created_at)
+        SELECT user_id, advertiser_id, COALESCE(MAX(created_at), CURRENT_TIMESTAMP), 0, 0, MIN(created_at)
+        FROM (
+            SELECT sender_id AS user_id, advertiser_id, created_at FROM chat_message WHERE {CONSUMER_MESSAGES}
+            UNION ALL
+            SELECT advertiser_id AS user_id, sender_id AS advertiser_id, created_at FROM chat_message
+            WHERE {ADVERTISER_MESSAGES}
+        ) pairs
+        GROUP BY user_id, advertiser_id
+    """)
+    op.execute(f"""
+        UPDATE chat_message SET conversation_id = (
+            SELECT c.id FROM conversation c
+            WHERE c.user_id = chat_message.sender_id AND c.advertiser_id = chat_message.advertiser_id
+        ) WHERE {CONSUMER_MESSAGES}
+    """)
+    op.execute(f"""
+        UPDATE chat_message SET conversation_id = (
+            SELECT c.id FROM conversation c
+            WHERE c.user_id = chat_message.advertiser_id AND c.advertiser_id = chat_message.sender_id
+        ) WHERE {ADVERTISER_MESSAGES}
+    """)
+    op.execute("""
+        UPDATE conversation SET last_message_id = (
+            SELECT MAX(m.id) FROM chat_message m WHERE m.conversation_id = conversation.id
+        )
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('chat_message', schema=None) as batch_op:
+        batch_op.create_index('ix_chat_message_conversation', ['sender_id', 'advertiser_id', 'created_at'],
+                              unique=False)
+        batch_op.drop_index('ix_chat_message_sender_id')
+        batch_op.drop_index('ix_chat_message_conversation_id')
+        batch_op.drop_constraint('fk_chat_message_conversation_id', type_='foreignkey')
+        batch_op.drop_column('conversation_id')
+
+    op.drop_index('ix_conversation_user_activity', table_name='conversation')
+    op.drop_index('ix_conversation_advertiser_activity', table_name='conversation')
+    op.drop_table('conversation')
@@ -0,0 +1,43 @@
+"""Add subscription notice and advertiser grace_period_end
+
+Revision ID: a146347793ef
+Revises: eb27e6fc52d0
+Create Date: 2026-10-18 15:41:07.218534
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a146347793ef'
+down_revision = 'eb27e6fc52d0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('advertiser', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('grace_period_end', sa.DateTime(), nullable=True))
+        # Suspensões e cancelamentos automáticos: status + fim da carência (ver dunning.py)
+        batch_op.create_index('ix_advertiser_status_grace_period_end', ['subscription_status', 'grace_period_end'],
+                              unique=False)
+
+    op.create_table('subscription_notice',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('advertiser_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=30), nullable=False),
+        sa.Column('period_end', sa.DateTime(), nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['advertiser_id'], ['advertiser.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        # Um aviso de cada tipo por ciclo de assinatura
+        sa.UniqueConstraint('advertiser_id', 'kind', 'period_end', name='unique_advertiser_notice')
+    )
+
+
+def downgrade():
+    op.drop_table('subscription_notice')
+    with op.batch_alter_table('advertiser', schema=None) as batch_op:
+        batch_op.drop_index('ix_advertiser_status_grace_period_end')
+        batch_op.drop_column('grace_period_end')
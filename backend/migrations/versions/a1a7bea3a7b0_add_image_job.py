@@ -0,0 +1,42 @@
+"""Add image job queue
+
+Revision ID: a1a7bea3a7b0
+Revises: a46a891efb0a
+Create Date: 2026-10-18 12:31:40.512207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1a7bea3a7b0'
+down_revision = 'a46a891efb0a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('image_job',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('source_hash', sa.String(length=64), nullable=False),
+        sa.Column('base_name', sa.String(length=200), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('error', sa.String(length=255), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    # Fila (status + ordem de chegada) e reaproveitamento de arquivos já processados
+    op.create_index('ix_image_job_status_created', 'image_job', ['status', 'created_at'], unique=False)
+    op.create_index('ix_image_job_source_hash', 'image_job', ['source_hash', 'status'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_image_job_source_hash', table_name='image_job')
+    op.drop_index('ix_image_job_status_created', table_name='image_job')
+    op.drop_table('image_job')
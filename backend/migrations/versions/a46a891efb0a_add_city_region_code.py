@@ -0,0 +1,30 @@
+"""Add city region code and advertiser scope index
+
+Revision ID: a46a891efb0a
+Revises: 5f4205c24016
+Create Date: 2026-10-18 11:52:31.208114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a46a891efb0a'
+down_revision = '5f4205c24016'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Microrregião/região imediata do IBGE - preenchida com `flask regions-import`
+    with op.batch_alter_table('city', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('region_code', sa.Integer(), nullable=True))
+    # Filtro de visibilidade por escopo: (ad_scope, city_id IN (...)) dos anúncios ativos
+    op.create_index('ix_advertiser_active_scope_city', 'advertiser', ['is_active', 'ad_scope', 'city_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_advertiser_active_scope_city', table_name='advertiser')
+    with op.batch_alter_table('city', schema=None) as batch_op:
+        batch_op.drop_column('region_code')
@@ -0,0 +1,48 @@
+"""Add webhook event inbox
+
+Revision ID: abfdc9504b1e
+Revises: a0ce0d8ba834
+Create Date: 2026-10-18 14:20:53.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'abfdc9504b1e'
+down_revision = 'a0ce0d8ba834'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('webhook_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('provider', sa.String(length=20), nullable=False),
+        sa.Column('event_id', sa.String(length=100), nullable=False),
+        sa.Column('event_type', sa.String(length=50), nullable=True),
+        sa.Column('reference', sa.String(length=255), nullable=True),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.String(length=255), nullable=True),
+        sa.Column('occurred_at', sa.DateTime(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('received_at', sa.DateTime(), nullable=True),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        # Deduplicação: o mesmo evento reenviado pelo provedor não entra duas vezes
+        sa.UniqueConstraint('provider', 'event_id', name='unique_provider_event')
+    )
+    # Fila do worker e ordem de aplicação por anunciante
+    op.create_index('ix_webhook_event_status_next_attempt', 'webhook_event',
+                    ['status', 'next_attempt_at'], unique=False)
+    op.create_index('ix_webhook_event_reference_status', 'webhook_event',
+                    ['reference', 'status', 'occurred_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_webhook_event_reference_status', table_name='webhook_event')
+    op.drop_index('ix_webhook_event_status_next_attempt', table_name='webhook_event')
+    op.drop_table('webhook_event')
@@ -0,0 +1,52 @@
+"""Add indexes for hot filter and join columns
+
+Revision ID: bc40e7045ef4
+Revises: 22f28986bbea
+Create Date: 2026-10-18 10:48:55.917320
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'bc40e7045ef4'
+down_revision = '22f28986bbea'
+branch_labels = None
+depends_on = None
+
+# (nome, tabela, colunas) - conferir os planos com `flask explain-check`
+INDEXES = [
+    # Busca pública: is_active + filtros de cidade/categoria; ordenação por avaliação
+    ('ix_advertiser_active_city_category', 'advertiser', ['is_active', 'city_id', 'category_id']),
+    ('ix_advertiser_active_category', 'advertiser', ['is_active', 'category_id']),
+    ('ix_advertiser_active_rating', 'advertiser', ['is_active', 'rating_average', 'rating_count']),
+    # Top 10 mais recentes e cadastros do dia no painel
+    ('ix_advertiser_active_created', 'advertiser', ['is_active', 'created_at']),
+    ('ix_advertiser_created_at', 'advertiser', ['created_at']),
+    # Vencimento de assinaturas e novas assinaturas do dia
+    ('ix_advertiser_active_subscription_end', 'advertiser', ['is_active', 'subscription_end']),
+    ('ix_advertiser_subscription_start', 'advertiser', ['subscription_start']),
+    # Chaves estrangeiras usadas em joins (o MySQL já cria, o SQLite não)
+    ('ix_advertiser_user_id', 'advertiser', ['user_id']),
+    ('ix_advertiser_category_id', 'advertiser', ['category_id']),
+    ('ix_city_state_id', 'city', ['state_id']),
+    ('ix_item_advertiser_order', 'item', ['advertiser_id', 'order']),
+    ('ix_review_advertiser_id', 'review', ['advertiser_id']),
+    ('ix_favorite_advertiser_id', 'favorite', ['advertiser_id']),
+    ('ix_report_advertiser_id', 'report', ['advertiser_id']),
+    # Denúncias pendentes (a PK entra no índice, então serve a paginação por id)
+    ('ix_report_status', 'report', ['status']),
+    # Histórico do chat: os dois lados do OR usam (sender_id, advertiser_id)
+    ('ix_chat_message_conversation', 'chat_message', ['sender_id', 'advertiser_id', 'created_at']),
+    ('ix_chat_message_advertiser_id', 'chat_message', ['advertiser_id']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
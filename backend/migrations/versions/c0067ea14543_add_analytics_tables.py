@@ -0,0 +1,52 @@
+"""Add analytics tables
+
+Revision ID: c0067ea14543
+Revises: 8a1e35ce6f07
+Create Date: 2026-10-18 19:11:40.826153
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c0067ea14543'
+down_revision = '8a1e35ce6f07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Contagens brutas descarregadas pelos workers, consolidadas por `flask analytics-rollup`
+    op.create_table('analytics_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('advertiser_id', sa.Integer(), nullable=False),
+        sa.Column('event', sa.String(length=20), nullable=False),
+        sa.Column('hour', sa.DateTime(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('analytics_hourly',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('advertiser_id', sa.Integer(), nullable=False),
+        sa.Column('hour', sa.DateTime(), nullable=False),
+        sa.Column('event', sa.String(length=20), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('advertiser_id', 'hour', 'event', name='unique_analytics_hourly')
+    )
+    op.create_table('analytics_daily',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('advertiser_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('event', sa.String(length=20), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('advertiser_id', 'day', 'event', name='unique_analytics_daily')
+    )
+
+
+def downgrade():
+    op.drop_table('analytics_daily')
+    op.drop_table('analytics_hourly')
+    op.drop_table('analytics_event')
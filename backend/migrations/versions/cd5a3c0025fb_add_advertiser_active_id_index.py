@@ -0,0 +1,26 @@
+"""Add advertiser (is_active, id) index
+
+Revision ID: cd5a3c0025fb
+Revises: c0067ea14543
+Create Date: 2026-10-18 20:05:37.512904
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'cd5a3c0025fb'
+down_revision = 'c0067ea14543'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Busca sem texto: is_active = 1 ORDER BY id, paginada por cursor (ver pagination.py)
+    with op.batch_alter_table('advertiser', schema=None) as batch_op:
+        batch_op.create_index('ix_advertiser_active_id', ['is_active', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('advertiser', schema=None) as batch_op:
+        batch_op.drop_index('ix_advertiser_active_id')
@@ -0,0 +1,48 @@
+"""Add advertiser search index
+
+Revision ID: d54c79e9e85f
+Revises: c6328a421238
+Create Date: 2026-10-18 09:12:41.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd54c79e9e85f'
+down_revision = 'c6328a421238'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tabela de busca textual: FTS5 no SQLite, FULLTEXT no MySQL.
+    # Depois de aplicar, popular com `flask search-reindex`.
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE advertiser_search USING fts5("
+            "name, category, description, items, tokenize='unicode61')"
+        )
+    elif dialect == 'mysql':
+        op.execute(
+            "CREATE TABLE advertiser_search ("
+            "advertiser_id INTEGER NOT NULL PRIMARY KEY, "
+            "name TEXT, category TEXT, description TEXT, items TEXT, "
+            "FULLTEXT INDEX ix_advertiser_search_fulltext (name, category, description, items)"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+        )
+    else:
+        op.create_table('advertiser_search',
+        sa.Column('advertiser_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.Text(), nullable=True),
+        sa.Column('category', sa.Text(), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('items', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('advertiser_id')
+        )
+
+
+def downgrade():
+    op.execute("DROP TABLE advertiser_search")
@@ -0,0 +1,37 @@
+"""Add advertiser subscription_status
+
+Revision ID: eb27e6fc52d0
+Revises: abfdc9504b1e
+Create Date: 2026-10-18 14:58:12.930461
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'eb27e6fc52d0'
+down_revision = 'abfdc9504b1e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('advertiser', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('subscription_status', sa.String(length=20), server_default='active',
+                                      nullable=False))
+        # Varredura do motor de expiração: status + vencimento (ver expiry.py)
+        batch_op.create_index('ix_advertiser_status_subscription_end', ['subscription_status', 'subscription_end'],
+                              unique=False)
+
+    # Quem já está inativo com a assinatura vencida conta como expirado
+    op.execute("""
+        UPDATE advertiser SET subscription_status = 'expired'
+        WHERE is_active = 0 AND subscription_end <= CURRENT_TIMESTAMP
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('advertiser', schema=None) as batch_op:
+        batch_op.drop_index('ix_advertiser_status_subscription_end')
+        batch_op.drop_column('subscription_status')
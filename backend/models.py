@@ -1,7 +1,8 @@
 from datetime import datetime, date
-from app import db, bcrypt
-from sqlalchemy import Enum
+from app import db
+from sqlalchemy import Enum, func, case, update, bindparam
 import enum
+import passwords
 
 class UserType(enum.Enum):
     CONSUMER = "consumer"
@@ -36,10 +37,11 @@ class User(db.Model):
     reports_made = db.relationship("Report", foreign_keys="Report.reporter_id", backref="reporter", lazy=True)
     
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode("utf-8")
+        self.password_hash = passwords.hash_password(password)
     
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        """Verificação no pool limitado de passwords.py (pode levantar PasswordVerifierBusy)"""
+        return passwords.verify_password(self.password_hash, password)
 
 class State(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -51,7 +53,8 @@ class State(db.Model):
 class City(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    state_id = db.Column(db.Integer, db.ForeignKey("state.id"), nullable=False)
+    state_id = db.Column(db.Integer, db.ForeignKey("state.id"), nullable=False, index=True)
+    region_code = db.Column(db.Integer, nullable=True)  # Microrregião/região imediata do IBGE (ver regions.py)
     
     advertisers = db.relationship("Advertiser", backref="city", lazy=True)
 
@@ -73,6 +76,7 @@ class Advertiser(db.Model):
     address = db.Column(db.String(500), nullable=True)
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
+    geo_cell = db.Column(db.Integer, nullable=True)  # Célula da grade de proximidade (ver geo.py)
     logo = db.Column(db.String(255), nullable=True)
     
     # Dados pessoais para verificação de idade
@@ -88,9 +92,22 @@ class Advertiser(db.Model):
     subscription_plan = db.Column(Enum(SubscriptionPlan), nullable=False, default=SubscriptionPlan.TRIAL)
     subscription_start = db.Column(db.DateTime, default=datetime.utcnow)
     subscription_end = db.Column(db.DateTime, nullable=True)
+    # trial, active, payment_pending, suspended, cancelled, expired (ver SUBSCRIPTION_STATUS em pagseguro_config.py)
+    subscription_status = db.Column(db.String(20), nullable=False, default="active", server_default="active")
+    grace_period_end = db.Column(db.DateTime, nullable=True)  # Fim da carência após falha no pagamento
     is_active = db.Column(db.Boolean, default=True)
     has_had_trial = db.Column(db.Boolean, default=False) # Para controlar o teste gratuito
     
+    # Agregados de avaliação mantidos a cada alteração de Review (ver apply_review_change)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_average = db.Column(db.Float, nullable=False, default=0, server_default="0")
+    rating_1 = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_2 = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_3 = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_4 = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_5 = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -100,6 +117,24 @@ class Advertiser(db.Model):
     favorites = db.relationship("Favorite", backref="advertiser", lazy=True)
     reports_received = db.relationship("Report", foreign_keys="Report.advertiser_id", backref="advertiser", lazy=True)
     
+    # Índices pensados nas consultas de routes.py / webhook_handler.py (ver explain_check.py)
+    __table_args__ = (
+        db.Index("ix_advertiser_active_city_category", "is_active", "city_id", "category_id"),
+        db.Index("ix_advertiser_active_category", "is_active", "category_id"),
+        db.Index("ix_advertiser_active_scope_city", "is_active", "ad_scope", "city_id"),
+        db.Index("ix_advertiser_active_created", "is_active", "created_at"),
+        db.Index("ix_advertiser_active_rating", "is_active", "rating_average", "rating_count"),
+        db.Index("ix_advertiser_active_id", "is_active", "id"),  # Ordem padrão da busca paginada por id
+        db.Index("ix_advertiser_active_subscription_end", "is_active", "subscription_end"),
+        db.Index("ix_advertiser_status_subscription_end", "subscription_status", "subscription_end"),
+        db.Index("ix_advertiser_status_grace_period_end", "subscription_status", "grace_period_end"),
+        db.Index("ix_advertiser_active_geo_cell", "is_active", "geo_cell"),
+        db.Index("ix_advertiser_subscription_start", "subscription_start"),
+        db.Index("ix_advertiser_created_at", "created_at"),
+        db.Index("ix_advertiser_user_id", "user_id"),
+        db.Index("ix_advertiser_category_id", "category_id"),
+    )
+    
     @property
     def age(self):
         today = date.today()
@@ -111,19 +146,106 @@ class Advertiser(db.Model):
     
     @property
     def average_rating(self):
-        if not self.reviews:
-            return 0
-        return sum(review.rating for review in self.reviews) / len(self.reviews)
+        return self.rating_average or 0
+    
+    @property
+    def rating_histogram(self):
+        return {str(stars): getattr(self, f"rating_{stars}") or 0 for stars in range(1, 6)}
+    
+    @staticmethod
+    def apply_review_change(advertiser_id, old_rating=None, new_rating=None):
+        """
+        Atualiza os agregados de avaliação com um UPDATE atômico na transação atual.
+        old_rating=None representa uma avaliação nova; new_rating=None, uma removida.
+        """
+        sum_delta = (new_rating or 0) - (old_rating or 0)
+        count_delta = (new_rating is not None) - (old_rating is not None)
+        histogram = {}
+        if old_rating is not None:
+            histogram[f"rating_{old_rating}"] = -1
+        if new_rating is not None:
+            histogram[f"rating_{new_rating}"] = histogram.get(f"rating_{new_rating}", 0) + 1
+
+        new_sum = Advertiser.rating_sum + sum_delta
+        new_count = Advertiser.rating_count + count_delta
+        # rating_average vem primeiro: o MySQL avalia o SET da esquerda para a direita
+        values = [
+            (Advertiser.rating_average, case((new_count > 0, new_sum * 1.0 / new_count), else_=0)),
+            (Advertiser.rating_sum, new_sum),
+            (Advertiser.rating_count, new_count)
+        ]
+        values += [(getattr(Advertiser, column), getattr(Advertiser, column) + delta)
+                   for column, delta in histogram.items() if delta]
+
+        db.session.execute(
+            update(Advertiser)
+            .where(Advertiser.id == advertiser_id)
+            .ordered_values(*values)
+            .execution_options(synchronize_session=False)
+        )
+    
+    @staticmethod
+    def touch(advertiser_id):
+        """
+        Marca o perfil como alterado (updated_at) sem carregar a linha. Para
+        remoções de itens: elas não mudam a data máxima dos itens, e o
+        Last-Modified do perfil (http_cache.py) ficaria para trás.
+        """
+        db.session.execute(
+            update(Advertiser)
+            .where(Advertiser.id == advertiser_id)
+            .values(updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+
+    @staticmethod
+    def recompute_ratings():
+        """Recalcula os agregados de todos os anunciantes com um único GROUP BY"""
+        totals = db.session.query(
+            Review.advertiser_id,
+            func.sum(Review.rating),
+            func.count(Review.id),
+            *[func.sum(case((Review.rating == stars, 1), else_=0)) for stars in range(1, 6)]
+        ).group_by(Review.advertiser_id).all()
+
+        zeros = {"rating_sum": 0, "rating_count": 0, "rating_average": 0,
+                 "rating_1": 0, "rating_2": 0, "rating_3": 0, "rating_4": 0, "rating_5": 0}
+        db.session.execute(update(Advertiser).values(**zeros).execution_options(synchronize_session=False))
+
+        rows = [{
+            "b_id": advertiser_id,
+            "rating_sum": total,
+            "rating_count": count,
+            "rating_average": total / count,
+            **{f"rating_{stars}": histogram[stars - 1] for stars in range(1, 6)}
+        } for advertiser_id, total, count, *histogram in totals]
+        if rows:
+            db.session.execute(
+                update(Advertiser.__table__)
+                .where(Advertiser.__table__.c.id == bindparam("b_id"))
+                .values({column: bindparam(column) for column in zeros}),
+                rows
+            )
+        return len(rows)
     
     @property
     def can_receive_reviews(self):
-        return self.subscription_plan in [SubscriptionPlan.BIANNUAL, SubscriptionPlan.ANNUAL]
+        return Advertiser.plan_receives_reviews(self.subscription_plan)
+    
+    @staticmethod
+    def plan_receives_reviews(plan):
+        return plan in [SubscriptionPlan.BIANNUAL, SubscriptionPlan.ANNUAL]
     
     @property
     def max_items(self):
-        if self.subscription_plan == SubscriptionPlan.ANNUAL:
+        return Advertiser.plan_max_items(self.subscription_plan)
+    
+    @staticmethod
+    def plan_max_items(plan):
+        """Limite de itens do plano (também vai como claim no JWT, ver auth.py)"""
+        if plan == SubscriptionPlan.ANNUAL:
             return 25
-        elif self.subscription_plan == SubscriptionPlan.MONTHLY:
+        elif plan == SubscriptionPlan.MONTHLY:
             return 5 # Novo limite para plano mensal
         return 10 # Limite padrão para trial e semestral
 
@@ -138,6 +260,8 @@ class Item(db.Model):
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.Index("ix_item_advertiser_order", "advertiser_id", "order"),)
 
 class Review(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -150,7 +274,10 @@ class Review(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Constraint para evitar múltiplas avaliações do mesmo usuário para o mesmo anunciante
-    __table_args__ = (db.UniqueConstraint("user_id", "advertiser_id", name="unique_user_advertiser_review"),)
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "advertiser_id", name="unique_user_advertiser_review"),
+        db.Index("ix_review_advertiser_id", "advertiser_id"),
+    )
 
 class Favorite(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -160,10 +287,38 @@ class Favorite(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Constraint para evitar favoritos duplicados
-    __table_args__ = (db.UniqueConstraint("user_id", "advertiser_id", name="unique_user_advertiser_favorite"),)
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "advertiser_id", name="unique_user_advertiser_favorite"),
+        db.Index("ix_favorite_advertiser_id", "advertiser_id"),
+    )
+
+class Conversation(db.Model):
+    """Conversa entre um consumidor e um anunciante; as mensagens do chat pertencem a ela"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)  # Consumidor
+    advertiser_id = db.Column(db.Integer, db.ForeignKey("advertiser.id"), nullable=False)
+    # Ponteiro para a última mensagem (mantido por conversations.add_message, sem FK para evitar ciclo)
+    last_message_id = db.Column(db.Integer, nullable=True)
+    last_message_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Mensagens ainda não lidas por cada lado
+    user_unread = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    advertiser_unread = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    user = db.relationship("User", foreign_keys=[user_id])
+    advertiser = db.relationship("Advertiser", foreign_keys=[advertiser_id])
+
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "advertiser_id", name="unique_user_advertiser_conversation"),
+        # Caixas de entrada ordenadas por última atividade (o id desempata a paginação)
+        db.Index("ix_conversation_advertiser_activity", "advertiser_id", "last_message_at", "id"),
+        db.Index("ix_conversation_user_activity", "user_id", "last_message_at", "id"),
+    )
 
 class ChatMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey("conversation.id"), nullable=True)
     sender_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     advertiser_id = db.Column(db.Integer, db.ForeignKey("advertiser.id"), nullable=False)
     message = db.Column(db.Text, nullable=False)
@@ -173,6 +328,13 @@ class ChatMessage(db.Model):
     
     sender = db.relationship("User", foreign_keys=[sender_id], backref="sent_messages")
     advertiser = db.relationship("Advertiser", foreign_keys=[advertiser_id], backref="chat_messages")
+    
+    __table_args__ = (
+        # Histórico por conversa: conversation_id = ? AND id > since, já na ordem do índice
+        db.Index("ix_chat_message_conversation_id", "conversation_id", "id"),
+        db.Index("ix_chat_message_sender_id", "sender_id"),
+        db.Index("ix_chat_message_advertiser_id", "advertiser_id"),
+    )
 
 class Report(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -181,8 +343,132 @@ class Report(db.Model):
     reason = db.Column(db.Text, nullable=False)
     status = db.Column(db.String(50), default="pending") # pending, reviewed, resolved
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index("ix_report_status", "status"),
+        db.Index("ix_report_advertiser_id", "advertiser_id"),
+    )
+
+class ImageJob(db.Model):
+    """Processamento de imagem enviado para segundo plano (ver image_jobs.py)"""
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex, devolvido ao cliente
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    source_hash = db.Column(db.String(64), nullable=False)  # sha256 do arquivo na área de staging
+    base_name = db.Column(db.String(200), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued, processing, done, failed
+    result = db.Column(db.Text, nullable=True)  # JSON com URLs das variantes e srcset
+    error = db.Column(db.String(255), nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_image_job_status_created", "status", "created_at"),
+        db.Index("ix_image_job_source_hash", "source_hash", "status"),
+    )
+
+
+class WebhookEvent(db.Model):
+    """Notificação recebida do provedor de pagamento, processada depois pelo worker (ver webhook_inbox.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    provider = db.Column(db.String(20), nullable=False, default="pagseguro")
+    event_id = db.Column(db.String(100), nullable=False)  # Id do evento no provedor: a chave da deduplicação
+    event_type = db.Column(db.String(50), nullable=True)
+    reference = db.Column(db.String(255), nullable=True)  # referenceId: eventos do mesmo anunciante, em ordem
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending, processing, done, superseded, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(255), nullable=True)
+    occurred_at = db.Column(db.DateTime, nullable=False)  # Data do evento no provedor (ou do recebimento)
+    next_attempt_at = db.Column(db.DateTime, nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint("provider", "event_id", name="unique_provider_event"),
+        db.Index("ix_webhook_event_status_next_attempt", "status", "next_attempt_at"),
+        db.Index("ix_webhook_event_reference_status", "reference", "status", "occurred_at"),
+    )
+
+
+class SubscriptionNotice(db.Model):
+    """Aviso de cobrança já enviado/aplicado, para o agendador não repetir (ver dunning.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    advertiser_id = db.Column(db.Integer, db.ForeignKey("advertiser.id"), nullable=False)
+    kind = db.Column(db.String(30), nullable=False)  # reminder_7, reminder_3, ..., suspended, cancelled
+    period_end = db.Column(db.DateTime, nullable=False)  # Vencimento/carência a que o aviso se refere
+    sent_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Um aviso de cada tipo por ciclo: renovar a assinatura muda o period_end e libera novos lembretes
+        db.UniqueConstraint("advertiser_id", "kind", "period_end", name="unique_advertiser_notice"),
+    )
+
+class EmailOutbox(db.Model):
+    """Email automático gravado na mesma transação da mudança que o gerou, enviado pelo worker (ver mailer.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    to_email = db.Column(db.String(120), nullable=False)
+    event_type = db.Column(db.String(50), nullable=False)  # Chave em AUTOMATED_MESSAGES
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending, sending, sent, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(255), nullable=True)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+class DailyStats(db.Model):
+    """Contadores do painel do administrador por dia (ver stats.py)"""
+    day = db.Column(db.Date, primary_key=True)
+    # Totais no momento da última atualização do dia
+    total_users = db.Column(db.Integer, nullable=False, default=0)
+    total_advertisers = db.Column(db.Integer, nullable=False, default=0)
+    active_advertisers = db.Column(db.Integer, nullable=False, default=0)
+    pending_reports = db.Column(db.Integer, nullable=False, default=0)
+    # Movimento do dia
+    new_signups = db.Column(db.Integer, nullable=False, default=0)
+    new_subscriptions = db.Column(db.Integer, nullable=False, default=0)
+    new_reports = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# Estatísticas de desempenho dos anunciantes (ver analytics.py). Sem FK para advertiser:
+# as linhas são gravadas fora da requisição e não impedem apagar o anunciante.
+class AnalyticsEvent(db.Model):
+    """Contagens descarregadas pelo buffer dos workers, ainda não consolidadas"""
+    id = db.Column(db.Integer, primary_key=True)
+    advertiser_id = db.Column(db.Integer, nullable=False)
+    event = db.Column(db.String(20), nullable=False)  # view, impression, share, share_click, chat_start
+    hour = db.Column(db.DateTime, nullable=False)  # Início da hora (UTC)
+    count = db.Column(db.Integer, nullable=False)
+
+class AnalyticsHourly(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    advertiser_id = db.Column(db.Integer, nullable=False)
+    hour = db.Column(db.DateTime, nullable=False)
+    event = db.Column(db.String(20), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Também serve a leitura do relatório (anunciante + faixa de horas)
+        db.UniqueConstraint("advertiser_id", "hour", "event", name="unique_analytics_hourly"),
+    )
+
+class AnalyticsDaily(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    advertiser_id = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    event = db.Column(db.String(20), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
 
+    __table_args__ = (
+        db.UniqueConstraint("advertiser_id", "day", "event", name="unique_analytics_daily"),
+    )
 
 
 class PlanPricing(db.Model):
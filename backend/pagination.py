@@ -0,0 +1,101 @@
+"""
+Paginação por cursor (keyset) para os endpoints de listagem.
+
+Em vez de OFFSET, cada página continua a partir dos valores da chave de
+ordenação da última linha entregue, então o custo de uma página não cresce
+com a profundidade. O corpo da resposta continua sendo a lista de resultados;
+o cursor da próxima página vai nos cabeçalhos X-Next-Cursor e Link.
+"""
+
+import base64
+import json
+from datetime import datetime
+from urllib.parse import urlencode
+from flask import request, jsonify
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100  # Limite rígido, mesmo que o cliente peça mais
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(values):
+    """Serializa os valores da chave de ordenação em um token opaco"""
+    payload = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, size):
+    """Lê um cursor gerado por encode_cursor; levanta InvalidCursor se for inválido"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != size:
+            raise InvalidCursor(token)
+        return [_decode_value(v) for v in values]
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise InvalidCursor(token) from e
+
+
+def page_limit(default=DEFAULT_PAGE_SIZE):
+    """Lê o parâmetro `limit` da requisição, limitado a MAX_PAGE_SIZE"""
+    limit = request.args.get("limit", default, type=int)
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_page(query, keys, limit=None, cursor=None):
+    """
+    Aplica ordenação, filtro de cursor e limite a uma consulta.
+
+    keys: lista de (atributo da linha, expressão SQL, descendente?) que forma
+    uma ordenação total - a última chave deve ser única (normalmente o id).
+    Retorna (linhas da página, cursor da próxima página ou None).
+    """
+    limit = page_limit() if limit is None else limit
+    cursor = request.args.get("cursor") if cursor is None else cursor
+
+    if cursor:
+        values = decode_cursor(cursor, len(keys))
+        # (k1, k2, ...) "depois de" (v1, v2, ...) respeitando a direção de cada chave
+        conditions = []
+        for position, (_, expression, descending) in enumerate(keys):
+            equal_prefix = [keys[i][1] == values[i] for i in range(position)]
+            after = expression < values[position] if descending else expression > values[position]
+            conditions.append(and_(*equal_prefix, after))
+        query = query.filter(or_(*conditions))
+
+    query = query.order_by(*[expression.desc() if descending else expression.asc()
+                             for _, expression, descending in keys])
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], name) for name, _, _ in keys])
+    return rows, next_cursor
+
+
+def paginated_response(results, next_cursor):
+    """Resposta JSON com a lista da página e os cabeçalhos do próximo cursor"""
+    response = jsonify(results)
+    if next_cursor:
+        args = [(key, value) for key, value in request.args.items(multi=True) if key != "cursor"]
+        args.append(("cursor", next_cursor))
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response, 200
@@ -2,6 +2,8 @@
 Configurações para integração com PagSeguro - Sistema de Cobrança Automática
 """
 
+from string import Formatter
+
 # Configurações dos planos com botões PagSeguro
 PAGSEGURO_PLANS = {
     "monthly": {
@@ -211,20 +213,87 @@ Todas as suas funcionalidades já estão liberadas novamente.
 
 Bem-vindo de volta ao Tudo Mais!
 
+Equipe Tudo Mais
+tudomaisapp@hotmail.com
+        """
+    },
+    "subscription_reminder": {
+        "subject": "⏰ Sua assinatura vence em {days_left} dia(s) - Tudo Mais",
+        "body": """
+Olá {user_name}!
+
+Sua assinatura do plano {plan_name} vence em {expiry_date}.
+
+Para continuar aparecendo nas buscas sem interrupção, renove em:
+{renewal_url}
+
+Precisa de ajuda? Entre em contato: tudomaisapp@hotmail.com
+
+Equipe Tudo Mais
+        """
+    },
+    "subscription_suspended": {
+        "subject": "🚫 Assinatura Suspensa - Tudo Mais",
+        "body": """
+Olá {user_name}!
+
+O período de carência terminou e não identificamos o pagamento do plano {plan_name}.
+Seu anúncio foi suspenso e não aparece mais nas buscas.
+
+Regularize o pagamento em até {cancel_after} dias para reativar sua conta:
+{payment_update_url}
+
+Equipe Tudo Mais
+tudomaisapp@hotmail.com
+        """
+    },
+    "subscription_auto_cancelled": {
+        "subject": "Assinatura Cancelada por Falta de Pagamento - Tudo Mais",
+        "body": """
+Olá {user_name}!
+
+Sua assinatura foi cancelada após {cancel_after} dias suspensa sem pagamento.
+
+Seus dados serão mantidos por 90 dias. Para voltar a anunciar, assine novamente em:
+{reactivation_url}
+
 Equipe Tudo Mais
 tudomaisapp@hotmail.com
         """
     }
 }
 
+def compile_template(template):
+    """
+    Separa uma vez o texto fixo dos campos {nome}; renderizar vira só um join.
+    Só campos simples: especificadores de formato falham aqui, na importação.
+    """
+    parts = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        if spec or conversion:
+            raise ValueError(f"Campo com formatação não suportado no template: {{{field}}}")
+        parts.append((literal, field))
+
+    def render(values):
+        return "".join([literal + (str(values[field]) if field is not None else "")
+                        for literal, field in parts])
+    return render
+
+# Templates compilados na importação (ver compile_template)
+COMPILED_MESSAGES = {
+    event_type: (compile_template(template["subject"]), compile_template(template["body"]))
+    for event_type, template in AUTOMATED_MESSAGES.items()
+}
+
 def get_automated_message(event_type, **kwargs):
     """Retorna mensagem automática formatada para um evento"""
-    message_template = AUTOMATED_MESSAGES.get(event_type)
-    if not message_template:
+    compiled = COMPILED_MESSAGES.get(event_type)
+    if not compiled:
         return None
     
+    subject, body = compiled
     return {
-        "subject": message_template["subject"].format(**kwargs),
-        "body": message_template["body"].format(**kwargs)
+        "subject": subject(kwargs),
+        "body": body(kwargs)
     }
 
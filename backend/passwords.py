@@ -0,0 +1,258 @@
+"""
+Senhas: hash bcrypt com custo configurável, verificação num pool limitado e
+limite de tentativas de login.
+
+O custo e a versão do hash vêm de BCRYPT_LOG_ROUNDS / BCRYPT_HASH_PREFIX
+(os mesmos do Flask-Bcrypt). Um hash gravado com outro custo ou versão é
+refeito no próximo login bem-sucedido (needs_rehash), então mudar a
+configuração não exige resetar senhas.
+
+A verificação roda num ThreadPoolExecutor com PASSWORD_VERIFY_WORKERS
+threads (o bcrypt libera o GIL): uma rajada de logins ocupa no máximo esse
+número de núcleos e o resto das rotas continua respondendo. Passando de
+PASSWORD_VERIFY_QUEUE verificações na fila, o login é recusado na hora
+(PasswordVerifierBusy) em vez de acumular requisições presas.
+
+Antes de qualquer bcrypt, o login passa pelo LoginThrottle: janela
+deslizante de falhas por email e por IP, em memória por worker (padrão) ou
+num servidor compatível com Redis compartilhado entre os workers
+(LOGIN_THROTTLE_BACKEND = "redis").
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from flask import current_app
+from app import bcrypt
+
+try:
+    import redis
+except ImportError:  # Opcional: só necessário com LOGIN_THROTTLE_BACKEND = "redis"
+    redis = None
+
+DEFAULT_LOG_ROUNDS = 12
+DEFAULT_PREFIX = "2b"
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE = 16
+VERIFY_TIMEOUT = 10  # segundos esperando a verificação antes de desistir
+DEFAULT_WINDOW = 15 * 60
+DEFAULT_MAX_PER_EMAIL = 5
+DEFAULT_MAX_PER_IP = 20
+MAX_TRACKED_KEYS = 10000  # Limite de chaves no backend em memória (LRU)
+
+
+class PasswordVerifierBusy(Exception):
+    pass
+
+
+def hash_password(password):
+    return bcrypt.generate_password_hash(password).decode("utf-8")
+
+
+def _check(password_hash, password):
+    try:
+        return bcrypt.check_password_hash(password_hash, password)
+    except ValueError:  # Hash que não é bcrypt (ex: importado de outro sistema)
+        return False
+
+
+def needs_rehash(password_hash):
+    """O hash foi gerado com outro custo ou outra versão do bcrypt?"""
+    config = current_app.config
+    rounds = config.get("BCRYPT_LOG_ROUNDS", DEFAULT_LOG_ROUNDS)
+    prefix = config.get("BCRYPT_HASH_PREFIX", DEFAULT_PREFIX)
+    # Formato: $<versão>$<custo>$<salt+hash>
+    parts = (password_hash or "").split("$")
+    if len(parts) != 4:
+        return True
+    return parts[1] != prefix or parts[2] != f"{rounds:02d}"
+
+
+class PasswordVerifier:
+    """Pool limitado para o trabalho de bcrypt"""
+
+    def __init__(self, workers=DEFAULT_WORKERS, queue_max=DEFAULT_QUEUE):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        # Vagas = em execução + na fila; sem vaga, recusa sem esperar
+        self._slots = threading.BoundedSemaphore(workers + queue_max)
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordVerifierBusy()
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=VERIFY_TIMEOUT)
+        except FuturesTimeout:
+            raise PasswordVerifierBusy()
+
+
+def get_verifier():
+    return current_app.extensions["password_verifier"]
+
+
+def verify_password(password_hash, password):
+    """Confere a senha no pool (levanta PasswordVerifierBusy com o pool lotado)"""
+    return get_verifier().run(_check, password_hash, password)
+
+
+def rehash_if_needed(user, password):
+    """Depois de um login certo: regrava o hash se o custo/versão mudou (o commit fica com quem chama)"""
+    if not needs_rehash(user.password_hash):
+        return False
+    user.password_hash = get_verifier().run(hash_password, password)
+    return True
+
+
+class ThrottleBackend:
+    """Interface comum dos backends do limite de tentativas"""
+
+    def count(self, key, window, now):
+        """Falhas registradas para a chave nos últimos `window` segundos"""
+        raise NotImplementedError
+
+    def oldest(self, key, window, now):
+        """Momento da falha mais antiga ainda dentro da janela (ou None)"""
+        raise NotImplementedError
+
+    def add(self, key, window, now):
+        raise NotImplementedError
+
+    def reset(self, key):
+        raise NotImplementedError
+
+
+class MemoryThrottleBackend(ThrottleBackend):
+    """Falhas por chave em memória; cada worker tem as suas"""
+
+    def __init__(self, max_keys=MAX_TRACKED_KEYS):
+        self.max_keys = max_keys
+        self._hits = OrderedDict()  # key -> deque de timestamps
+        self._lock = threading.Lock()
+
+    def _prune(self, key, window, now):
+        hits = self._hits.get(key)
+        if hits is None:
+            return None
+        while hits and hits[0] <= now - window:
+            hits.popleft()
+        if not hits:
+            del self._hits[key]
+            return None
+        return hits
+
+    def count(self, key, window, now):
+        with self._lock:
+            hits = self._prune(key, window, now)
+            return len(hits) if hits else 0
+
+    def oldest(self, key, window, now):
+        with self._lock:
+            hits = self._prune(key, window, now)
+            return hits[0] if hits else None
+
+    def add(self, key, window, now):
+        with self._lock:
+            hits = self._prune(key, window, now)
+            if hits is None:
+                hits = self._hits[key] = deque()
+            hits.append(now)
+            self._hits.move_to_end(key)
+            while len(self._hits) > self.max_keys:
+                self._hits.popitem(last=False)
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+
+class RedisThrottleBackend(ThrottleBackend):
+    """Sorted set por chave (score = momento da falha) num servidor compatível com Redis"""
+
+    def __init__(self, url, prefix="tudo_mais:login:"):
+        if redis is None:
+            raise RuntimeError("LOGIN_THROTTLE_BACKEND = 'redis' exige o pacote redis instalado")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def count(self, key, window, now):
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(self.prefix + key, 0, now - window)
+        pipe.zcard(self.prefix + key)
+        return pipe.execute()[1]
+
+    def oldest(self, key, window, now):
+        entries = self.client.zrangebyscore(self.prefix + key, now - window, "+inf", start=0, num=1,
+                                            withscores=True)
+        return entries[0][1] if entries else None
+
+    def add(self, key, window, now):
+        pipe = self.client.pipeline()
+        pipe.zadd(self.prefix + key, {uuid.uuid4().hex: now})
+        pipe.expire(self.prefix + key, int(window) + 1)
+        pipe.execute()
+
+    def reset(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class LoginThrottle:
+    """Janela deslizante de falhas de login por email e por IP"""
+
+    def __init__(self, backend, window=DEFAULT_WINDOW, max_per_email=DEFAULT_MAX_PER_EMAIL,
+                 max_per_ip=DEFAULT_MAX_PER_IP, clock=time.time):
+        self.backend = backend
+        self.window = window
+        self.limits = {"email": max_per_email, "ip": max_per_ip}
+        self.clock = clock
+
+    @staticmethod
+    def _keys(email, ip):
+        return {"email": f"email:{email.strip().lower()}", "ip": f"ip:{ip}"}
+
+    def retry_after(self, email, ip):
+        """Segundos até poder tentar de novo, ou 0 se a tentativa está liberada"""
+        now = self.clock()
+        wait = 0
+        for kind, key in self._keys(email, ip).items():
+            if self.backend.count(key, self.window, now) >= self.limits[kind]:
+                oldest = self.backend.oldest(key, self.window, now)
+                wait = max(wait, int(oldest + self.window - now) + 1 if oldest else 1)
+        return wait
+
+    def failure(self, email, ip):
+        now = self.clock()
+        for key in self._keys(email, ip).values():
+            self.backend.add(key, self.window, now)
+
+    def success(self, email, ip):
+        # O IP continua contando: um atacante com uma conta própria não zera o limite do IP
+        self.backend.reset(self._keys(email, ip)["email"])
+
+
+def get_throttle():
+    return current_app.extensions["login_throttle"]
+
+
+def init_app(app):
+    """Pool de verificação e limite de tentativas conforme a configuração"""
+    config = app.config
+    app.extensions["password_verifier"] = PasswordVerifier(
+        config.get("PASSWORD_VERIFY_WORKERS", DEFAULT_WORKERS), config.get("PASSWORD_VERIFY_QUEUE", DEFAULT_QUEUE)
+    )
+    if config.get("LOGIN_THROTTLE_BACKEND", "memory") == "redis":
+        backend = RedisThrottleBackend(config["LOGIN_THROTTLE_REDIS_URL"])
+    else:
+        backend = MemoryThrottleBackend()
+    app.extensions["login_throttle"] = LoginThrottle(
+        backend,
+        window=config.get("LOGIN_THROTTLE_WINDOW", DEFAULT_WINDOW),
+        max_per_email=config.get("LOGIN_MAX_FAILURES_PER_EMAIL", DEFAULT_MAX_PER_EMAIL),
+        max_per_ip=config.get("LOGIN_MAX_FAILURES_PER_IP", DEFAULT_MAX_PER_IP)
+    )
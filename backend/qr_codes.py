@@ -0,0 +1,140 @@
+"""
+Geração de QR Codes com cache.
+
+O mesmo link (perfil do anunciante, página do beta) é pedido muitas vezes e
+o QR Code de uma URL nunca muda: cada combinação (url, tamanho, correção de
+erro, formato) é renderizada uma vez, fica num LRU limitado em memória e num
+cache em disco compartilhado entre os workers (QR_CACHE_FOLDER). A chave é
+também o ETag, então o navegador revalida sem nenhuma renderização.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from flask import current_app
+import qrcode
+import qrcode.image.svg
+
+CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "qr_cache")
+DEFAULT_MAX_ENTRIES = 256
+
+MAX_URL_LENGTH = 2048
+DEFAULT_SIZE = 10  # pixels por módulo
+SIZES = range(1, 21)
+BORDER = 4
+ERROR_CORRECTION = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+# Muda quando a renderização muda, para não servir arquivos antigos do disco
+RENDER_VERSION = 1
+
+
+class InvalidQRRequest(ValueError):
+    pass
+
+
+def cache_key(url, size=DEFAULT_SIZE, ec="L", fmt="png"):
+    """Chave (e ETag) de um QR Code; valida os parâmetros"""
+    if not url or len(url) > MAX_URL_LENGTH:
+        raise InvalidQRRequest(f"URL vazia ou maior que {MAX_URL_LENGTH} caracteres")
+    if size not in SIZES:
+        raise InvalidQRRequest(f"Tamanho deve estar entre {SIZES.start} e {SIZES.stop - 1}")
+    if ec not in ERROR_CORRECTION:
+        raise InvalidQRRequest("Correção de erro deve ser L, M, Q ou H")
+    if fmt not in FORMATS:
+        raise InvalidQRRequest("Formato deve ser png ou svg")
+    raw = f"{RENDER_VERSION}|{fmt}|{ec}|{size}|{url}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def render(url, size=DEFAULT_SIZE, ec="L", fmt="png"):
+    """Renderiza o QR Code sem cache; retorna os bytes do arquivo"""
+    qr = qrcode.QRCode(
+        error_correction=ERROR_CORRECTION[ec],
+        box_size=size,
+        border=BORDER,
+        image_factory=qrcode.image.svg.SvgPathImage if fmt == "svg" else None,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    img = qr.make_image()  # Preto sobre branco
+    if fmt == "svg":
+        return img.to_string(encoding="unicode").encode("utf-8")
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class QRCache:
+    """LRU limitado em memória na frente de um cache em disco"""
+
+    def __init__(self, folder=CACHE_FOLDER, max_entries=DEFAULT_MAX_ENTRIES):
+        self.folder = folder
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key, fmt):
+        return os.path.join(self.folder, key[:2], f"{key}.{fmt}")
+
+    def get(self, url, size=DEFAULT_SIZE, ec="L", fmt="png"):
+        """Retorna (key, bytes), renderizando só se não estiver em memória nem em disco"""
+        key = cache_key(url, size, ec, fmt)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return key, data
+
+        path = self._path(key, fmt)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            self.disk_hits += 1
+        except FileNotFoundError:
+            data = render(url, size, ec, fmt)
+            self.misses += 1
+            self._write(path, data)
+
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return key, data
+
+    def _write(self, path, data):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Grava num temporário e troca: outro worker nunca lê o arquivo pela metade
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass  # Sem disco o cache em memória continua valendo
+
+    def stats(self):
+        return {"entries": len(self._entries), "max_entries": self.max_entries,
+                "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses}
+
+
+def get_cache():
+    """Cache do processo, criado no primeiro uso com QR_CACHE_FOLDER / QR_CACHE_MAX_ENTRIES"""
+    cache = current_app.extensions.get("qr_cache")
+    if cache is None:
+        cache = current_app.extensions.setdefault("qr_cache", QRCache(
+            current_app.config.get("QR_CACHE_FOLDER", CACHE_FOLDER),
+            current_app.config.get("QR_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)))
+    return cache
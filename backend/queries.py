@@ -0,0 +1,141 @@
+"""
+Camada de consultas compartilhada pelos endpoints de listagem.
+
+Cada função carrega apenas as colunas que a resposta usa, com joins e
+agregados materializados, para que o número de SELECTs por requisição seja
+constante, independente de quantos anunciantes são retornados.
+"""
+
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
+from models import db, Advertiser, City, State, Category, Item, User, Favorite, Report
+
+
+def average_rating_column():
+    """Média de avaliações materializada no anunciante (não toca a tabela review)"""
+    return Advertiser.rating_average.label("average_rating")
+
+
+def advertiser_cards(*columns):
+    """Anunciante + nome da cidade + nome da categoria em um único SELECT"""
+    return (
+        db.session.query(
+            Advertiser.id,
+            Advertiser.business_name,
+            Advertiser.logo,
+            City.name.label("city"),
+            Category.name.label("category"),
+            *columns
+        )
+        .join(City, City.id == Advertiser.city_id)
+        .join(Category, Category.id == Advertiser.category_id)
+    )
+
+
+def search_cards():
+    """Colunas usadas pela busca pública (/advertiser/)"""
+    return advertiser_cards(
+        Advertiser.description,
+        Advertiser.phone,
+        average_rating_column(),
+        Advertiser.rating_count
+    ).filter(Advertiser.is_active == True)
+
+
+def recent_cards(limit):
+    """Anunciantes ativos mais recentes, com estado, para a vitrine da Home"""
+    return (
+        advertiser_cards(
+            Advertiser.description,
+            Advertiser.phone,
+            Advertiser.website,
+            Advertiser.created_at,
+            State.name.label("state"),
+            average_rating_column()
+        )
+        .join(State, State.id == City.state_id)
+        .filter(Advertiser.is_active == True)
+        .order_by(Advertiser.created_at.desc())
+        .limit(limit)
+    )
+
+
+def favorite_cards(user_id):
+    """Favoritos de um usuário com os dados do anunciante"""
+    return (
+        advertiser_cards(Favorite.id.label("favorite_id"))
+        .join(Favorite, Favorite.advertiser_id == Advertiser.id)
+        .filter(Favorite.user_id == user_id)
+    )
+
+
+def admin_advertiser_rows():
+    """Linhas da listagem administrativa de anunciantes (com email do usuário)"""
+    return db.session.query(
+        Advertiser.id,
+        Advertiser.business_name,
+        User.email,
+        Advertiser.cpf,
+        Advertiser.subscription_plan,
+        Advertiser.is_active,
+        Advertiser.created_at
+    ).join(User, User.id == Advertiser.user_id)
+
+
+def items_by_advertiser(advertiser_ids, per_advertiser=None):
+    """
+    Carrega os itens de vários anunciantes em uma única consulta e
+    devolve {advertiser_id: [itens]} respeitando a ordenação personalizada.
+    """
+    grouped = {advertiser_id: [] for advertiser_id in advertiser_ids}
+    if not grouped:
+        return grouped
+
+    rows = (
+        db.session.query(Item.id, Item.advertiser_id, Item.title, Item.price, Item.image)
+        .filter(Item.advertiser_id.in_(list(grouped)))
+        .order_by(Item.advertiser_id, Item.order, Item.id)
+    )
+    for row in rows:
+        items = grouped[row.advertiser_id]
+        if per_advertiser is None or len(items) < per_advertiser:
+            items.append(row)
+    return grouped
+
+
+def advertiser_version(advertiser_id):
+    """
+    Marcadores de versão do perfil público (sem carregar os itens): datas de
+    atualização do anunciante e dos itens, contagem de itens (remoções não
+    mudam a data máxima) e agregados de avaliação. None se não existir.
+    """
+    return (
+        db.session.query(
+            Advertiser.updated_at,
+            func.max(Item.updated_at).label("items_updated_at"),
+            func.count(Item.id).label("item_count"),
+            Advertiser.rating_sum,
+            Advertiser.rating_count
+        )
+        .outerjoin(Item, Item.advertiser_id == Advertiser.id)
+        .filter(Advertiser.id == advertiser_id)
+        .group_by(Advertiser.id, Advertiser.updated_at, Advertiser.rating_sum, Advertiser.rating_count)
+        .first()
+    )
+
+
+def pending_report_rows():
+    """Denúncias pendentes com nome do anunciante e email do denunciante"""
+    reporter = aliased(User)
+    return (
+        db.session.query(
+            Report.id,
+            Report.reason,
+            Report.created_at,
+            Advertiser.business_name.label("advertiser_name"),
+            reporter.email.label("reporter_email")
+        )
+        .join(Advertiser, Advertiser.id == Report.advertiser_id)
+        .join(reporter, reporter.id == Report.reporter_id)
+        .filter(Report.status == "pending")
+    )
@@ -0,0 +1,148 @@
+"""
+Visibilidade dos anúncios por escopo (AdScope) a partir da cidade do consumidor.
+
+A vizinhança entre estados vem de um arquivo fixo (data/estados_vizinhos.csv) e a
+região de cada cidade vem de City.region_code (microrregião/região imediata do
+IBGE, importada com `flask regions-import`); cidade sem região usa o próprio estado.
+Tudo é carregado uma vez por processo em memória, e a busca vira um único filtro
+por listas IN de city_id servido pelo índice (is_active, ad_scope, city_id).
+"""
+
+import csv
+import os
+import threading
+from sqlalchemy import and_, or_, update, bindparam
+from models import db, Advertiser, AdScope, City, State
+from search_index import strip_accents
+
+NEIGHBORS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "estados_vizinhos.csv")
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def load_state_neighbors(path=NEIGHBORS_FILE):
+    """Lê o arquivo de fronteiras: {UF: {UFs vizinhas}} (simétrico)"""
+    neighbors = {}
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            code = row["uf"].strip().upper()
+            neighbors.setdefault(code, set())
+            for other in filter(None, (uf.strip().upper() for uf in row["vizinhos"].split(";"))):
+                neighbors[code].add(other)
+                neighbors.setdefault(other, set()).add(code)
+    return neighbors
+
+
+class RegionIndex:
+    """Tabelas de consulta: cidade -> cidades da região e cidade -> cidades da região + estados vizinhos"""
+
+    def __init__(self, cities, state_codes, state_neighbors):
+        # cities: [(city_id, state_id, region_code)]; state_codes: {state_id: UF}
+        self.state_of = {}
+        self.region_of = {}
+        region_members = {}
+        state_members = {}
+        for city_id, state_id, region_code in cities:
+            region = ("region", region_code) if region_code else ("state", state_id)
+            self.state_of[city_id] = state_id
+            self.region_of[city_id] = region
+            region_members.setdefault(region, []).append(city_id)
+            state_members.setdefault(state_id, []).append(city_id)
+
+        self.region_cities = {region: tuple(sorted(ids)) for region, ids in region_members.items()}
+
+        ids_by_code = {code: state_id for state_id, code in state_codes.items()}
+        self.wide_states = {}
+        for state_id, code in state_codes.items():
+            nearby = {state_id} | {ids_by_code[uf] for uf in state_neighbors.get(code, ()) if uf in ids_by_code}
+            self.wide_states[state_id] = tuple(sorted(nearby))
+        self.state_cities = {state_id: tuple(sorted(ids)) for state_id, ids in state_members.items()}
+        self._wide_cache = {}
+
+    def cities_in_region(self, city_id):
+        """Cidades da mesma região (inclui a própria cidade)"""
+        region = self.region_of.get(city_id)
+        return self.region_cities.get(region, (city_id,))
+
+    def cities_in_wide_region(self, city_id):
+        """Cidades da região + todas as cidades do estado e dos estados vizinhos"""
+        key = (self.region_of.get(city_id, city_id), self.state_of.get(city_id))
+        if key not in self._wide_cache:
+            ids = set(self.cities_in_region(city_id))
+            for other in self.wide_states.get(key[1], ()):
+                ids.update(self.state_cities.get(other, ()))
+            self._wide_cache[key] = tuple(sorted(ids))
+        return self._wide_cache[key]
+
+
+def build_index(session=None):
+    """Monta o RegionIndex com uma leitura de city e state"""
+    session = session or db.session
+    cities = session.query(City.id, City.state_id, City.region_code).all()
+    state_codes = dict(session.query(State.id, State.code).all())
+    return RegionIndex(cities, state_codes, load_state_neighbors())
+
+
+def get_index():
+    """Índice do processo, montado no primeiro uso"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = build_index()
+    return _index
+
+
+def reset_index():
+    """Descarta o índice em memória (após importar regiões ou cadastrar cidades)"""
+    global _index
+    _index = None
+
+
+def _city_key(state_code, name):
+    return state_code.strip().upper(), " ".join(strip_accents(name).lower().split())
+
+
+def import_regions(rows, session=None):
+    """
+    Grava City.region_code a partir de linhas {uf, municipio, regiao}
+    (ex: exportação da DTB do IBGE). Retorna (atualizadas, não encontradas).
+    """
+    session = session or db.session
+    cities = {
+        _city_key(code, name): city_id
+        for city_id, name, code in session.query(City.id, City.name, State.code).join(State, State.id == City.state_id)
+    }
+    updates, missing = [], []
+    for row in rows:
+        city_id = cities.get(_city_key(row["uf"], row["municipio"]))
+        if city_id is None:
+            missing.append(f"{row['municipio']}/{row['uf']}")
+        else:
+            updates.append({"city_key": city_id, "region": int(row["regiao"])})
+    if updates:
+        session.execute(
+            update(City.__table__).where(City.__table__.c.id == bindparam("city_key"))
+            .values(region_code=bindparam("region")),
+            updates
+        )
+    reset_index()
+    return len(updates), missing
+
+
+def scope_filter(city_id, region_city_ids, wide_city_ids):
+    """Condição SQL: anúncios ativos cujo escopo alcança a cidade do consumidor"""
+    # is_active repetido em cada ramo para que cada um use o índice (is_active, ad_scope, city_id)
+    active = Advertiser.is_active == True
+    return or_(
+        and_(active, Advertiser.ad_scope == AdScope.CITY, Advertiser.city_id == city_id),
+        and_(active, Advertiser.ad_scope == AdScope.CITY_REGION, Advertiser.city_id.in_(region_city_ids)),
+        and_(active, Advertiser.ad_scope == AdScope.CITY_REGION_OTHER_STATES, Advertiser.city_id.in_(wide_city_ids))
+    )
+
+
+def visible_in_city(city_id):
+    """Filtro de visibilidade para consumidores da cidade informada"""
+    index = get_index()
+    return scope_filter(city_id, index.cities_in_region(city_id), index.cities_in_wide_region(city_id))
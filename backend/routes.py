@@ -1,11 +1,31 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-from flask import Blueprint, request, jsonify
-from models import User, Advertiser, UserType, SubscriptionPlan, db, Report, AdScope
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
+from models import User, Advertiser, UserType, SubscriptionPlan, db, Report, AdScope, Review, Favorite, ChatMessage, Conversation, ImageJob, WebhookEvent, Item
 from datetime import date, timedelta, datetime
 from app import jwt
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from auth import authorize, current_identity, issue_tokens, owner_tokens, user_claims, admin_claims, refreshed_claims, can_manage, row_exists, item_quota, ADMIN_USER_ID
+from search_index import match_advertisers
+import queries
+from pagination import keyset_page, paginated_response, page_limit, InvalidCursor
+import geo
+import regions
+import images
+import image_jobs
+import storage
+import qr_codes
+import share_kit
+import chat_push
+import conversations
+import webhook_inbox
+import mailer
+import passwords
+import stats
+import analytics
+from cache import cached, invalidate_advertiser, invalidate_plans, get_cache
+from http_cache import conditional, cache_control, advertiser_validator, not_modified
 
 auth_bp = Blueprint("auth_bp", __name__, url_prefix="/auth")
 
@@ -54,6 +74,8 @@ def register():
         phone=data["phone"],
         website=data.get("website"),
         address=data.get("address"),
+        latitude=data.get("latitude"),
+        longitude=data.get("longitude"),
         cpf=data["cpf"],
         birth_date=birth_date_obj,
         city_id=data["city_id"],
@@ -66,11 +88,13 @@ def register():
     db.session.add(new_advertiser)
 
     try:
+        stats.bump(total_users=1, total_advertisers=1, active_advertisers=1, new_signups=1, new_subscriptions=1)
         db.session.commit()
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+    invalidate_advertiser(new_advertiser.id)
     return jsonify({"message": "Anunciante cadastrado com sucesso! Período de teste de 7 dias iniciado."}), 201
 
 @auth_bp.route("/login", methods=["POST"])
@@ -79,28 +103,61 @@ def login():
     if not data or not data.get("email") or not data.get("password"):
         return jsonify({"error": "Email e senha são obrigatórios"}), 400
 
+    # Limite de tentativas antes de qualquer trabalho de bcrypt
+    throttle = passwords.get_throttle()
+    client_ip = request.remote_addr or "-"
+    retry_after = throttle.retry_after(data["email"], client_ip)
+    if retry_after:
+        response = jsonify({"error": "Muitas tentativas de login. Tente novamente mais tarde."})
+        response.headers["Retry-After"] = str(retry_after)
+        return response, 429
+
     # Acesso especial para o administrador
     if data["email"] == "edfrancope" and data["password"] == "ngc1987@":
-        access_token = create_access_token(identity={
-            "user_id": 0, # ID reservado para admin
-            "user_type": "admin"
-        })
-        return jsonify(access_token=access_token), 200
+        return jsonify(issue_tokens(ADMIN_USER_ID, admin_claims())), 200
 
     user = User.query.filter_by(email=data["email"]).first()
 
-    if user and user.check_password(data["password"]):
-        access_token = create_access_token(identity={
-            "user_id": user.id,
-            "user_type": user.user_type.value
-        })
-        return jsonify(access_token=access_token), 200
+    try:
+        valid = user is not None and user.check_password(data["password"])
+    except passwords.PasswordVerifierBusy:
+        return jsonify({"error": "Servidor ocupado. Tente novamente em instantes."}), 503
+
+    if valid:
+        throttle.success(data["email"], client_ip)
+        # Custo do bcrypt mudou desde o último login: regrava o hash (falhar aqui não impede o login)
+        try:
+            if passwords.rehash_if_needed(user, data["password"]):
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+
+        return jsonify(issue_tokens(user.id, user_claims(user))), 200
 
+    throttle.failure(data["email"], client_ip)
     return jsonify({"error": "Email ou senha inválidos"}), 401
 
+# Troca o refresh token por um token de acesso novo, com as claims relidas do banco
+@auth_bp.route("/refresh", methods=["POST"])
+@jwt_required(refresh=True)
+def refresh_token():
+    user_id = int(get_jwt_identity())
+    claims = refreshed_claims(user_id)
+    if claims is None:
+        return jsonify({"error": "Conta não encontrada ou desativada"}), 401
+    return jsonify(issue_tokens(user_id, claims, refresh=False)), 200
+
 advertiser_bp = Blueprint("advertiser_bp", __name__, url_prefix="/advertiser")
 
+@advertiser_bp.app_errorhandler(InvalidCursor)
+def handle_invalid_cursor(e):
+    return jsonify({"error": "Cursor de paginação inválido"}), 400
+
 @advertiser_bp.route("/<int:advertiser_id>", methods=["GET"])
+@analytics.track(analytics.profile_events)
+@cache_control(public=True, max_age=60)
+@conditional(advertiser_validator)
+@cached("advertiser", ttl=300, tags=lambda advertiser_id: (f"advertiser:{advertiser_id}",))
 def get_advertiser(advertiser_id):
     advertiser = Advertiser.query.get_or_404(advertiser_id)
     return jsonify({
@@ -114,6 +171,8 @@ def get_advertiser(advertiser_id):
         "city": advertiser.city.name,
         "category": advertiser.category.name,
         "average_rating": advertiser.average_rating,
+        "rating_count": advertiser.rating_count,
+        "rating_histogram": advertiser.rating_histogram,
         "max_items": advertiser.max_items,
         "is_active": advertiser.is_active,
         "items": [{
@@ -126,41 +185,73 @@ def get_advertiser(advertiser_id):
     }), 200
 
 @advertiser_bp.route("/", methods=["GET"])
+@analytics.track(analytics.search_events)
+@cache_control(public=True, max_age=30)
+@cached("search", ttl=60)
 def search_advertisers():
     query = request.args.get("query")
     category_id = request.args.get("category_id")
-    city_id = request.args.get("city_id")
+    city_id = request.args.get("city_id", type=int)
+    min_rating = request.args.get("min_rating", type=float)
+    sort = request.args.get("sort")
+    # Modo "perto de mim": lat/lng do consumidor e raio em km
+    latitude = request.args.get("lat", type=float)
+    longitude = request.args.get("lng", type=float)
+    radius_km = request.args.get("radius_km", geo.DEFAULT_RADIUS_KM, type=float)
 
-    advertisers = Advertiser.query.filter_by(is_active=True)
+    advertisers = queries.search_cards()
+    sort_keys = [("id", Advertiser.id, False)]
 
     if query:
-        advertisers = advertisers.filter(Advertiser.business_name.like(f"%{query}%") | Advertiser.description.like(f"%{query}%"))
+        # Busca no índice textual (sem acentos, por radical) ordenada por relevância
+        match = match_advertisers(db.session.connection(), query)
+        if match is not None:
+            advertisers = advertisers.join(match, match.c.advertiser_id == Advertiser.id).add_columns(match.c.score)
+            sort_keys = [("score", match.c.score, True), ("id", Advertiser.id, False)]
     if category_id:
-        advertisers = advertisers.filter_by(category_id=category_id)
+        advertisers = advertisers.filter(Advertiser.category_id == category_id)
     if city_id:
-        advertisers = advertisers.filter_by(city_id=city_id)
+        # Anúncios visíveis para quem está na cidade, conforme o escopo de cada um
+        advertisers = advertisers.filter(regions.visible_in_city(city_id))
+    if min_rating is not None:
+        advertisers = advertisers.filter(Advertiser.rating_average >= min_rating)
+    if sort == "rating":
+        # Ordenação pelos agregados materializados, antes da relevância textual
+        sort_keys = [("average_rating", Advertiser.rating_average, True),
+                     ("rating_count", Advertiser.rating_count, True),
+                     ("id", Advertiser.id, False)]
+
+    if latitude is not None and longitude is not None:
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or not 0 < radius_km <= geo.MAX_RADIUS_KM:
+            return jsonify({"error": f"Coordenadas inválidas ou raio fora do limite (máximo {geo.MAX_RADIUS_KM} km)."}), 400
+        nearby, next_cursor = geo.nearby_page(advertisers, latitude, longitude, radius_km, page_limit(),
+                                              request.args.get("cursor"))
+        page = [adv for _, adv in nearby]
+        distances = {adv.id: distance for distance, adv in nearby}
+    else:
+        page, next_cursor = keyset_page(advertisers, sort_keys)
+        distances = {}
 
     results = []
-    for adv in advertisers.all():
+    for adv in page:
         results.append({
             "id": adv.id,
             "business_name": adv.business_name,
             "description": adv.description,
             "phone": adv.phone,
-            "logo": adv.logo,
-            "city": adv.city.name,
-            "category": adv.category.name,
-            "average_rating": adv.average_rating
+            "logo": images.thumbnail_url(adv.logo),
+            "city": adv.city,
+            "category": adv.category,
+            "average_rating": float(adv.average_rating),
+            "rating_count": adv.rating_count
         })
-    return jsonify(results), 200
+        if adv.id in distances:
+            results[-1]["distance_km"] = distances[adv.id]
+    return paginated_response(results, next_cursor)
 
 @advertiser_bp.route("/<int:advertiser_id>", methods=["PUT"])
-@jwt_required()
+@authorize(owner="advertiser_id")
 def update_advertiser(advertiser_id):
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_id"] != advertiser_id and current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
     data = request.get_json()
     advertiser = Advertiser.query.get_or_404(advertiser_id)
 
@@ -169,6 +260,8 @@ def update_advertiser(advertiser_id):
     if "phone" in data: advertiser.phone = data["phone"]
     if "website" in data: advertiser.website = data["website"]
     if "address" in data: advertiser.address = data["address"]
+    if "latitude" in data: advertiser.latitude = data["latitude"]
+    if "longitude" in data: advertiser.longitude = data["longitude"]
     if "logo" in data: advertiser.logo = data["logo"] # TODO: Implementar upload de imagem real
     if "city_id" in data: advertiser.city_id = data["city_id"]
     if "category_id" in data: advertiser.category_id = data["category_id"]
@@ -176,23 +269,22 @@ def update_advertiser(advertiser_id):
 
     try:
         db.session.commit()
+        invalidate_advertiser(advertiser_id)
         return jsonify({"message": "Anunciante atualizado com sucesso!"}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 @advertiser_bp.route("/<int:advertiser_id>", methods=["DELETE"])
-@jwt_required()
+@authorize(owner="advertiser_id")
 def delete_advertiser(advertiser_id):
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_id"] != advertiser_id and current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
     advertiser = Advertiser.query.get_or_404(advertiser_id)
 
     try:
+        stats.bump(**stats.removal_deltas(advertiser))
         db.session.delete(advertiser)
         db.session.commit()
+        invalidate_advertiser(advertiser_id)
         return jsonify({"message": "Anunciante deletado com sucesso!"}), 200
     except Exception as e:
         db.session.rollback()
@@ -201,23 +293,23 @@ def delete_advertiser(advertiser_id):
 
 # Rotas para Itens (Produtos/Serviços)
 @advertiser_bp.route("/<int:advertiser_id>/items", methods=["POST"])
-@jwt_required()
+@authorize(owner="advertiser_id")
 def add_item(advertiser_id):
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_id"] != advertiser_id and current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
     data = request.get_json()
-    advertiser = Advertiser.query.get_or_404(advertiser_id)
+    # Limite pelo plano atual no banco: a claim do token pode ser de antes de uma troca de plano
+    max_items = item_quota(advertiser_id)
+    if max_items is None:
+        return jsonify({"error": "Anunciante não encontrado"}), 404
 
     if not data or not data.get("title"):
         return jsonify({"error": "Título do item é obrigatório"}), 400
 
-    if len(advertiser.items) >= advertiser.max_items:
-        return jsonify({"error": f"Limite de itens atingido para o seu plano ({advertiser.max_items} itens)."}), 400
+    item_count = db.session.query(db.func.count(Item.id)).filter(Item.advertiser_id == advertiser_id).scalar()
+    if item_count >= max_items:
+        return jsonify({"error": f"Limite de itens atingido para o seu plano ({max_items} itens)."}), 400
 
     new_item = Item(
-        advertiser_id=advertiser.id,
+        advertiser_id=advertiser_id,
         title=data["title"],
         description=data.get("description"),
         price=data.get("price"),
@@ -227,17 +319,18 @@ def add_item(advertiser_id):
 
     try:
         db.session.commit()
+        invalidate_advertiser(advertiser_id)
         return jsonify({"message": "Item adicionado com sucesso!"}), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 @advertiser_bp.route("/items/<int:item_id>", methods=["PUT"])
-@jwt_required()
+@authorize()
 def update_item(item_id):
-    current_user_identity = get_jwt_identity()
     item = Item.query.get_or_404(item_id)
-    if current_user_identity["user_id"] != item.advertiser.user_id and current_user_identity["user_type"] != "admin":
+    # Dono pela claim advertiser_id, sem carregar o anunciante
+    if not can_manage(current_identity(), item.advertiser_id):
         return jsonify({"error": "Não autorizado"}), 403
 
     data = request.get_json()
@@ -249,22 +342,26 @@ def update_item(item_id):
 
     try:
         db.session.commit()
+        invalidate_advertiser(item.advertiser_id)
         return jsonify({"message": "Item atualizado com sucesso!"}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 @advertiser_bp.route("/items/<int:item_id>", methods=["DELETE"])
-@jwt_required()
+@authorize()
 def delete_item(item_id):
-    current_user_identity = get_jwt_identity()
     item = Item.query.get_or_404(item_id)
-    if current_user_identity["user_id"] != item.advertiser.user_id and current_user_identity["user_type"] != "admin":
+    # Dono pela claim advertiser_id, sem carregar o anunciante
+    if not can_manage(current_identity(), item.advertiser_id):
         return jsonify({"error": "Não autorizado"}), 403
 
+    advertiser_id = item.advertiser_id
     try:
         db.session.delete(item)
+        Advertiser.touch(advertiser_id)
         db.session.commit()
+        invalidate_advertiser(advertiser_id)
         return jsonify({"message": "Item deletado com sucesso!"}), 200
     except Exception as e:
         db.session.rollback()
@@ -274,12 +371,8 @@ def delete_item(item_id):
 
 # Rotas para Assinaturas
 @advertiser_bp.route("/<int:advertiser_id>/subscribe", methods=["POST"])
-@jwt_required()
+@authorize(owner="advertiser_id")
 def subscribe_advertiser(advertiser_id):
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_id"] != advertiser_id and current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
     data = request.get_json()
     if not data or not data.get("plan"):
         return jsonify({"error": "Plano de assinatura é obrigatório"}), 400
@@ -297,6 +390,8 @@ def subscribe_advertiser(advertiser_id):
     payment_successful = True # Simulação
 
     if payment_successful:
+        # A recontagem conta uma assinatura por anunciante no dia (subscription_start de hoje)
+        subscribed_today = stats.is_today(advertiser.subscription_start)
         advertiser.subscription_plan = new_plan
         advertiser.subscription_start = datetime.utcnow()
         if new_plan == SubscriptionPlan.MONTHLY:
@@ -306,11 +401,16 @@ def subscribe_advertiser(advertiser_id):
         elif new_plan == SubscriptionPlan.ANNUAL:
             advertiser.subscription_end = datetime.utcnow() + timedelta(days=365)
         
+        was_active = advertiser.is_active
         advertiser.is_active = True # Ativa o anunciante se ele estava inativo por falta de pagamento
 
         try:
+            stats.bump(new_subscriptions=0 if subscribed_today else 1, active_advertisers=0 if was_active else 1)
             db.session.commit()
-            return jsonify({"message": f"Assinatura atualizada para {new_plan.value} com sucesso!"}), 200
+            invalidate_advertiser(advertiser_id)
+            # Token novo com o plano e a quota atualizados (as claims do atual ficaram defasadas)
+            return jsonify({"message": f"Assinatura atualizada para {new_plan.value} com sucesso!",
+                            **owner_tokens(current_identity(), advertiser)}), 200
         except Exception as e:
             db.session.rollback()
             return jsonify({"error": str(e)}), 500
@@ -318,20 +418,20 @@ def subscribe_advertiser(advertiser_id):
         return jsonify({"error": "Pagamento falhou."}), 400
 
 @advertiser_bp.route("/<int:advertiser_id>/cancel_subscription", methods=["POST"])
-@jwt_required()
+@authorize(owner="advertiser_id")
 def cancel_subscription(advertiser_id):
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_id"] != advertiser_id and current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
     advertiser = Advertiser.query.get_or_404(advertiser_id)
 
     advertiser.subscription_plan = SubscriptionPlan.TRIAL # Ou um status de "cancelado" ou "pendente"
+    was_active = advertiser.is_active
     advertiser.is_active = False # Desativa o anunciante ao cancelar a assinatura
 
     try:
+        stats.bump(active_advertisers=-1 if was_active else 0)
         db.session.commit()
-        return jsonify({"message": "Assinatura cancelada com sucesso!"}), 200
+        invalidate_advertiser(advertiser_id)
+        return jsonify({"message": "Assinatura cancelada com sucesso!",
+                        **owner_tokens(current_identity(), advertiser)}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
@@ -341,76 +441,68 @@ def cancel_subscription(advertiser_id):
 admin_bp = Blueprint("admin_bp", __name__, url_prefix="/admin")
 
 @admin_bp.route("/dashboard", methods=["GET"])
-@jwt_required()
+@authorize("admin")
 def admin_dashboard():
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
-    total_users = User.query.count()
-    total_advertisers = Advertiser.query.count()
-    active_advertisers = Advertiser.query.filter_by(is_active=True).count()
-    new_subscriptions_today = Advertiser.query.filter(Advertiser.subscription_start >= date.today()).count()
-    pending_reports = Report.query.filter_by(status="pending").count()
+    # Uma leitura pela chave primária (ver stats.py)
+    counters = stats.today()
 
     return jsonify({
-        "total_users": total_users,
-        "total_advertisers": total_advertisers,
-        "active_advertisers": active_advertisers,
-        "new_subscriptions_today": new_subscriptions_today,
-        "pending_reports": pending_reports
+        "total_users": counters.total_users,
+        "total_advertisers": counters.total_advertisers,
+        "active_advertisers": counters.active_advertisers,
+        "new_subscriptions_today": counters.new_subscriptions,
+        "pending_reports": counters.pending_reports
     }), 200
 
+# Movimento diário (cadastros, assinaturas, denúncias) dos últimos ?days= dias
+@admin_bp.route("/stats/daily", methods=["GET"])
+@authorize("admin")
+def daily_stats():
+    days = request.args.get("days", 30, type=int)
+    return jsonify({"days": [stats.as_dict(row) for row in stats.history(max(days, 1))]}), 200
+
 @admin_bp.route("/advertisers", methods=["GET"])
-@jwt_required()
+@authorize("admin")
 def list_advertisers():
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
-    advertisers = Advertiser.query.all()
+    advertisers, next_cursor = keyset_page(queries.admin_advertiser_rows(), [("id", Advertiser.id, False)])
     results = []
     for adv in advertisers:
         results.append({
             "id": adv.id,
             "business_name": adv.business_name,
-            "email": adv.user.email,
+            "email": adv.email,
             "cpf": adv.cpf,
             "subscription_plan": adv.subscription_plan.value,
             "is_active": adv.is_active,
             "created_at": adv.created_at.isoformat()
         })
-    return jsonify(results), 200
+    return paginated_response(results, next_cursor)
 
 @admin_bp.route("/advertisers/<int:advertiser_id>/toggle_active", methods=["PUT"])
-@jwt_required()
+@authorize("admin")
 def toggle_advertiser_active(advertiser_id):
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
     advertiser = Advertiser.query.get_or_404(advertiser_id)
     advertiser.is_active = not advertiser.is_active
     try:
+        stats.bump(active_advertisers=1 if advertiser.is_active else -1)
         db.session.commit()
+        invalidate_advertiser(advertiser_id)
         return jsonify({"message": "Status do anunciante atualizado com sucesso!"}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/advertisers/<int:advertiser_id>/delete", methods=["DELETE"])
-@jwt_required()
+@authorize("admin")
 def delete_advertiser_admin(advertiser_id):
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
     advertiser = Advertiser.query.get_or_404(advertiser_id)
     user = User.query.get_or_404(advertiser.user_id)
     try:
+        stats.bump(total_users=-1, **stats.removal_deltas(advertiser))
         db.session.delete(advertiser)
         db.session.delete(user)
         db.session.commit()
+        invalidate_advertiser(advertiser_id)
         return jsonify({"message": "Anunciante e usuário deletados permanentemente!"}), 200
     except Exception as e:
         db.session.rollback()
@@ -419,34 +511,28 @@ def delete_advertiser_admin(advertiser_id):
 
 # Rotas para Denúncias
 @admin_bp.route("/reports", methods=["GET"])
-@jwt_required()
+@authorize("admin")
 def list_reports():
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
-    reports = Report.query.filter_by(status="pending").all()
+    reports, next_cursor = keyset_page(queries.pending_report_rows(), [("id", Report.id, False)])
     results = []
     for report in reports:
         results.append({
             "id": report.id,
-            "advertiser_name": report.advertiser.business_name,
-            "reporter_email": report.reporter.email,
+            "advertiser_name": report.advertiser_name,
+            "reporter_email": report.reporter_email,
             "reason": report.reason,
             "created_at": report.created_at.isoformat()
         })
-    return jsonify(results), 200
+    return paginated_response(results, next_cursor)
 
 @admin_bp.route("/reports/<int:report_id>/resolve", methods=["PUT"])
-@jwt_required()
+@authorize("admin")
 def resolve_report(report_id):
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
     report = Report.query.get_or_404(report_id)
+    was_pending = report.status == "pending"
     report.status = "resolved"
     try:
+        stats.bump(pending_reports=-1 if was_pending else 0)
         db.session.commit()
         return jsonify({"message": "Denúncia marcada como resolvida."}), 200
     except Exception as e:
@@ -474,6 +560,7 @@ def register_consumer():
     db.session.add(new_user)
 
     try:
+        stats.bump(total_users=1)
         db.session.commit()
     except Exception as e:
         db.session.rollback()
@@ -482,26 +569,22 @@ def register_consumer():
     return jsonify({"message": "Usuário consumidor cadastrado com sucesso!"}), 201
 
 @user_bp.route("/<int:user_id>/favorites", methods=["POST"])
-@jwt_required()
+@authorize(owner="user_id")
 def add_favorite(user_id):
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_id"] != user_id and current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
     data = request.get_json()
     if not data or not data.get("advertiser_id"):
         return jsonify({"error": "ID do anunciante é obrigatório"}), 400
 
-    user = User.query.get_or_404(user_id)
-    advertiser = Advertiser.query.get_or_404(data["advertiser_id"])
+    advertiser_id = data["advertiser_id"]
+    if not row_exists(User.id == user_id) or not row_exists(Advertiser.id == advertiser_id):
+        return jsonify({"error": "Usuário ou anunciante não encontrado"}), 404
 
-    existing_favorite = Favorite.query.filter_by(user_id=user.id, advertiser_id=advertiser.id).first()
-    if existing_favorite:
+    if row_exists(Favorite.user_id == user_id, Favorite.advertiser_id == advertiser_id):
         return jsonify({"message": "Anunciante já está nos favoritos."}), 409
 
     new_favorite = Favorite(
-        user_id=user.id,
-        advertiser_id=advertiser.id
+        user_id=user_id,
+        advertiser_id=advertiser_id
     )
     db.session.add(new_favorite)
 
@@ -513,16 +596,14 @@ def add_favorite(user_id):
         return jsonify({"error": str(e)}), 500
 
 @user_bp.route("/<int:user_id>/favorites/<int:advertiser_id>", methods=["DELETE"])
-@jwt_required()
+@authorize(owner="user_id")
 def remove_favorite(user_id, advertiser_id):
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_id"] != user_id and current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
-    favorite = Favorite.query.filter_by(user_id=user_id, advertiser_id=advertiser_id).first_or_404()
-
     try:
-        db.session.delete(favorite)
+        # DELETE direto pela chave única; nenhuma linha = não estava nos favoritos
+        removed = Favorite.query.filter_by(user_id=user_id, advertiser_id=advertiser_id).delete()
+        if not removed:
+            db.session.rollback()
+            return jsonify({"error": "Favorito não encontrado"}), 404
         db.session.commit()
         return jsonify({"message": "Anunciante removido dos favoritos!"}), 200
     except Exception as e:
@@ -530,162 +611,202 @@ def remove_favorite(user_id, advertiser_id):
         return jsonify({"error": str(e)}), 500
 
 @user_bp.route("/<int:user_id>/favorites", methods=["GET"])
-@jwt_required()
+@authorize(owner="user_id")
 def get_favorites(user_id):
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_id"] != user_id and current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
-    user = User.query.get_or_404(user_id)
+    if not row_exists(User.id == user_id):
+        return jsonify({"error": "Usuário não encontrado"}), 404
+    page, next_cursor = keyset_page(queries.favorite_cards(user_id), [("favorite_id", Favorite.id, False)])
     favorites = []
-    for fav in user.favorites:
+    for adv in page:
         favorites.append({
-            "id": fav.advertiser.id,
-            "business_name": fav.advertiser.business_name,
-            "logo": fav.advertiser.logo,
-            "city": fav.advertiser.city.name,
-            "category": fav.advertiser.category.name
+            "id": adv.id,
+            "business_name": adv.business_name,
+            "logo": images.thumbnail_url(adv.logo),
+            "city": adv.city,
+            "category": adv.category
         })
-    return jsonify(favorites), 200
+    return paginated_response(favorites, next_cursor)
+
+def parse_rating(value):
+    """Valida a nota da avaliação (inteiro de 1 a 5); retorna None se inválida"""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return None
+    try:
+        rating = int(value)
+    except ValueError:
+        return None
+    return rating if 1 <= rating <= 5 else None
 
 @user_bp.route("/<int:user_id>/reviews", methods=["POST"])
-@jwt_required()
+@authorize(owner="user_id")
 def add_review(user_id):
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_id"] != user_id and current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
     data = request.get_json()
     if not all(key in data for key in ["advertiser_id", "rating"]):
         return jsonify({"error": "ID do anunciante e avaliação são obrigatórios"}), 400
 
-    advertiser = Advertiser.query.get_or_404(data["advertiser_id"])
-    if not advertiser.can_receive_reviews:
+    rating = parse_rating(data["rating"])
+    if rating is None:
+        return jsonify({"error": "A avaliação deve ser um número inteiro de 1 a 5."}), 400
+
+    advertiser_id = data["advertiser_id"]
+    plan = db.session.query(Advertiser.subscription_plan).filter(Advertiser.id == advertiser_id).scalar()
+    if plan is None:
+        return jsonify({"error": "Anunciante não encontrado"}), 404
+    if not Advertiser.plan_receives_reviews(plan):
         return jsonify({"error": "Este anunciante não pode receber avaliações."}), 400
 
     # TODO: Implementar filtro de palavras ofensivas para data["comment"]
 
     new_review = Review(
         user_id=user_id,
-        advertiser_id=data["advertiser_id"],
-        rating=data["rating"],
+        advertiser_id=advertiser_id,
+        rating=rating,
         comment=data.get("comment")
     )
     db.session.add(new_review)
 
     try:
+        Advertiser.apply_review_change(advertiser_id, new_rating=rating)
         db.session.commit()
+        invalidate_advertiser(advertiser_id)
         return jsonify({"message": "Avaliação adicionada com sucesso!"}), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 @user_bp.route("/<int:user_id>/reviews/<int:review_id>", methods=["PUT"])
-@jwt_required()
+@authorize(owner="user_id")
 def update_review(user_id, review_id):
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_id"] != user_id and current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
     data = request.get_json()
     review = Review.query.get_or_404(review_id)
 
     if review.user_id != user_id:
         return jsonify({"error": "Você não tem permissão para editar esta avaliação."}), 403
 
-    if "rating" in data: review.rating = data["rating"]
+    old_rating = review.rating
+    if "rating" in data:
+        rating = parse_rating(data["rating"])
+        if rating is None:
+            return jsonify({"error": "A avaliação deve ser um número inteiro de 1 a 5."}), 400
+        review.rating = rating
     if "comment" in data: review.comment = data["comment"] # TODO: Implementar filtro de palavras ofensivas
 
     try:
+        if review.rating != old_rating:
+            Advertiser.apply_review_change(review.advertiser_id, old_rating=old_rating, new_rating=review.rating)
         db.session.commit()
+        invalidate_advertiser(review.advertiser_id)
         return jsonify({"message": "Avaliação atualizada com sucesso!"}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 @user_bp.route("/<int:user_id>/reviews/<int:review_id>", methods=["DELETE"])
-@jwt_required()
+@authorize(owner="user_id")
 def delete_review(user_id, review_id):
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_id"] != user_id and current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
     review = Review.query.get_or_404(review_id)
 
     if review.user_id != user_id:
         return jsonify({"error": "Você não tem permissão para deletar esta avaliação."}), 403
 
+    advertiser_id = review.advertiser_id
     try:
         db.session.delete(review)
+        Advertiser.apply_review_change(advertiser_id, old_rating=review.rating)
         db.session.commit()
+        invalidate_advertiser(advertiser_id)
         return jsonify({"message": "Avaliação deletada com sucesso!"}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 @user_bp.route("/<int:user_id>/chat/<int:advertiser_id>", methods=["POST"])
-@jwt_required()
+@authorize(owner="user_id")
 def send_chat_message(user_id, advertiser_id):
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_id"] != user_id and current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
     data = request.get_json()
     if not data or not data.get("message"):
         return jsonify({"error": "Mensagem é obrigatória"}), 400
 
     # TODO: Implementar filtro de palavras ofensivas para data["message"]
 
-    new_message = ChatMessage(
-        sender_id=user_id,
-        advertiser_id=advertiser_id,
-        message=data["message"],
-        is_from_advertiser=False # Mensagem enviada pelo consumidor
-    )
-    db.session.add(new_message)
-
     try:
+        conversation, created = conversations.get_or_create(user_id, advertiser_id)
+        new_message = conversations.add_message(conversation, user_id, data["message"],
+                                                from_advertiser=False)  # Mensagem enviada pelo consumidor
         db.session.commit()
-        return jsonify({"message": "Mensagem enviada com sucesso!"}), 201
+        if created:
+            # Conversa aberta pela primeira mensagem conta como início de chat, como em /chat/start
+            analytics.record(analytics.CHAT_START, advertiser_id)
+        chat_push.publish(user_id, advertiser_id, new_message.id)
+        return jsonify({"message": "Mensagem enviada com sucesso!", "message_id": new_message.id,
+                        "conversation_id": conversation.id}), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+# Histórico da conversa; ?since=<id> traz só as mensagens posteriores a esse id
 @user_bp.route("/<int:user_id>/chat/<int:advertiser_id>", methods=["GET"])
-@jwt_required()
+@authorize(owner="user_id")
 def get_chat_messages(user_id, advertiser_id):
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_id"] != user_id and current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
+    current_user_identity = current_identity()
+    conversation = conversations.find(user_id, advertiser_id)
+    if conversation is None:
+        return paginated_response([], None)
+
+    messages, next_cursor = keyset_page(
+        conversations.messages_query(conversation.id, request.args.get("since", 0, type=int)),
+        [("id", ChatMessage.id, False)]
+    )
+    if current_user_identity["user_id"] == user_id and conversations.mark_read(conversation.id, "user"):
+        db.session.commit()
 
-    messages = ChatMessage.query.filter(
-        ((ChatMessage.sender_id == user_id) & (ChatMessage.advertiser_id == advertiser_id)) |
-        ((ChatMessage.sender_id == advertiser_id) & (ChatMessage.advertiser_id == user_id) & (ChatMessage.is_from_advertiser == True))
-    ).order_by(ChatMessage.created_at).all()
+    return paginated_response([conversations.message_payload(msg) for msg in messages], next_cursor)
 
-    results = []
-    for msg in messages:
-        results.append({
-            "id": msg.id,
-            "sender_id": msg.sender_id,
-            "advertiser_id": msg.advertiser_id,
-            "message": msg.message,
-            "is_from_advertiser": msg.is_from_advertiser,
-            "created_at": msg.created_at.isoformat()
-        })
-    return jsonify(results), 200
+def chat_poll_response(user_id, advertiser_id):
+    """Long-poll: responde assim que chegar mensagem com id > since (ou [] no timeout)"""
+    since = request.args.get("since", 0, type=int)
+    timeout = request.args.get("timeout", chat_push.DEFAULT_TIMEOUT, type=int)
+    timeout = max(0, min(timeout, chat_push.MAX_TIMEOUT))
+
+    messages = chat_push.long_poll(user_id, advertiser_id, since, timeout)
+    return jsonify({
+        "messages": messages,
+        "last_id": messages[-1]["id"] if messages else since
+    }), 200
+
+def chat_stream_response(user_id, advertiser_id):
+    """Server-Sent Events (o EventSource reconecta sozinho com Last-Event-ID)"""
+    since = request.headers.get("Last-Event-ID", type=int)
+    if since is None:
+        since = request.args.get("since", 0, type=int)
+
+    response = current_app.response_class(
+        stream_with_context(chat_push.event_stream(user_id, advertiser_id, since)),
+        mimetype="text/event-stream"
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # nginx não deve segurar os eventos
+    return response
+
+# Mensagens novas por long-poll, pelo lado do consumidor (o anunciante usa /chat/<chat_id>/poll)
+@user_bp.route("/<int:user_id>/chat/<int:advertiser_id>/poll", methods=["GET"])
+@authorize(owner="user_id")
+def poll_chat_messages(user_id, advertiser_id):
+    return chat_poll_response(user_id, advertiser_id)
+
+# Mensagens novas por SSE, pelo lado do consumidor (o anunciante usa /chat/<chat_id>/stream)
+@user_bp.route("/<int:user_id>/chat/<int:advertiser_id>/stream", methods=["GET"])
+@authorize(owner="user_id")
+def stream_chat_messages(user_id, advertiser_id):
+    return chat_stream_response(user_id, advertiser_id)
 
 
 
 
 # Rotas para gerenciamento de preços dos planos
 @admin_bp.route("/pricing", methods=["GET"])
-@jwt_required()
+@authorize("admin")
 def get_plan_pricing():
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
     pricing = PlanPricing.query.filter_by(is_active=True).all()
     results = []
     for p in pricing:
@@ -699,12 +820,8 @@ def get_plan_pricing():
     return jsonify(results), 200
 
 @admin_bp.route("/pricing", methods=["POST"])
-@jwt_required()
+@authorize("admin")
 def update_plan_pricing():
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
     data = request.get_json()
     if not data or not data.get("plan_type") or not data.get("price"):
         return jsonify({"error": "Tipo de plano e preço são obrigatórios"}), 400
@@ -728,37 +845,107 @@ def update_plan_pricing():
 
     try:
         db.session.commit()
+        invalidate_plans()
         return jsonify({"message": f"Preço do plano {plan_type.value} atualizado com sucesso!"}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+@admin_bp.route("/cache-stats", methods=["GET"])
+@authorize("admin")
+def get_cache_stats():
+    cache = get_cache()
+    return jsonify(cache.stats() if cache else {}), 200
+
+# Webhooks que esgotaram as tentativas (ou outro status via ?status=)
+@admin_bp.route("/webhooks", methods=["GET"])
+@authorize("admin")
+def get_webhook_events():
+    status = request.args.get("status", "dead")
+    events, next_cursor = keyset_page(WebhookEvent.query.filter(WebhookEvent.status == status),
+                                      [("id", WebhookEvent.id, True)])
+    return paginated_response([webhook_inbox.event_payload(event) for event in events], next_cursor)
+
+@admin_bp.route("/webhooks/stats", methods=["GET"])
+@authorize("admin")
+def get_webhook_stats():
+    return jsonify(webhook_inbox.status_counts()), 200
+
+@admin_bp.route("/emails/stats", methods=["GET"])
+@authorize("admin")
+def get_email_stats():
+    return jsonify(mailer.status_counts()), 200
+
+@admin_bp.route("/webhooks/<int:event_id>/retry", methods=["POST"])
+@authorize("admin")
+def retry_webhook_event(event_id):
+    try:
+        if not webhook_inbox.retry_dead(event_id):
+            db.session.rollback()
+            return jsonify({"error": "Evento não encontrado ou não está na fila de falhas"}), 404
+        db.session.commit()
+        return jsonify({"message": "Evento devolvido à fila"}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+# Kit de divulgação (link, texto e QR Code) de todos os anunciantes ativos, em ZIP
+@admin_bp.route("/share-kit", methods=["GET"])
+@authorize("admin")
+def download_share_kit():
+    qr_format = request.args.get("format", "png")
+    if qr_format not in qr_codes.FORMATS:
+        return jsonify({"error": "Formato deve ser png ou svg"}), 400
+    plan = request.args.get("plan")
+    try:
+        plan = SubscriptionPlan(plan) if plan else None
+    except ValueError:
+        return jsonify({"error": "Plano inválido"}), 400
+
+    rows = share_kit.advertiser_rows(
+        city_id=request.args.get("city_id", type=int),
+        state_id=request.args.get("state_id", type=int),
+        category_id=request.args.get("category_id", type=int),
+        plan=plan
+    )
+    archive = share_kit.stream_archive(
+        rows, request.host_url.rstrip('/'), qr_format,
+        workers=current_app.config.get("SHARE_KIT_WORKERS", share_kit.DEFAULT_WORKERS)
+    )
+    response = current_app.response_class(stream_with_context(archive), mimetype="application/zip")
+    response.headers["Content-Disposition"] = (
+        f"attachment; filename=kit_divulgacao_{datetime.utcnow():%Y%m%d_%H%M}.zip")
+    return response
+
 # Rota para Top 10 empresas mais recentes
 @advertiser_bp.route("/top10", methods=["GET"])
+@cache_control(public=True, max_age=120)
+@cached("top10", ttl=120)
 def get_top10_recent():
-    advertisers = Advertiser.query.filter_by(is_active=True).order_by(Advertiser.created_at.desc()).limit(10).all()
+    advertisers = queries.recent_cards(10).all()
+    # Pegar apenas os primeiros 3 itens de cada anunciante para o resumo (uma consulta só)
+    items_by_advertiser = queries.items_by_advertiser([adv.id for adv in advertisers], per_advertiser=3)
     
     results = []
     for adv in advertisers:
-        # Pegar apenas os primeiros 3 itens para o resumo
-        featured_items = adv.items[:3] if adv.items else []
+        featured_items = items_by_advertiser[adv.id]
         
         results.append({
             "id": adv.id,
             "business_name": adv.business_name,
             "description": adv.description[:150] + "..." if adv.description and len(adv.description) > 150 else adv.description,
-            "logo": adv.logo,
-            "city": adv.city.name,
-            "state": adv.city.state.name,
-            "category": adv.category.name,
-            "average_rating": adv.average_rating,
+            "logo": images.thumbnail_url(adv.logo),
+            "city": adv.city,
+            "state": adv.state,
+            "category": adv.category,
+            "average_rating": float(adv.average_rating),
             "phone": adv.phone,
             "website": adv.website,
             "featured_items": [{
                 "id": item.id,
                 "title": item.title,
                 "price": item.price,
-                "image": item.image
+                "image": images.thumbnail_url(item.image)
             } for item in featured_items],
             "created_at": adv.created_at.isoformat()
         })
@@ -769,21 +956,18 @@ def get_top10_recent():
 # Importar configurações PagSeguro
 from pagseguro_config import get_all_plans, get_plan_config, get_plan_price
 # from webhook_handler import PagSeguroWebhookHandler
-import os
-from werkzeug.utils import secure_filename
 
 # Configuração para upload de arquivos
-UPLOAD_FOLDER = 'uploads'
+UPLOAD_FOLDER = storage.UPLOAD_FOLDER
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 # Rotas para sistema de pagamentos PagSeguro
 @advertiser_bp.route("/plans", methods=["GET"])
+@cache_control(public=True, max_age=3600)
+@cached("plans", ttl=3600, tags=("plans",))
 def get_available_plans():
     """Retorna todos os planos disponíveis com botões PagSeguro"""
     plans = get_all_plans()
@@ -808,18 +992,14 @@ def get_available_plans():
     return jsonify(plans), 200
 
 @advertiser_bp.route("/subscribe/<plan_type>", methods=["POST"])
-@jwt_required()
+@authorize("advertiser")
 def initiate_subscription(plan_type):
     """Inicia processo de assinatura - retorna dados do plano e botão PagSeguro"""
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_type"] != "advertiser":
-        return jsonify({"error": "Não autorizado"}), 403
-
     plan_config = get_plan_config(plan_type)
     if not plan_config:
         return jsonify({"error": "Plano não encontrado"}), 404
 
-    advertiser_id = current_user_identity["user_id"]
+    advertiser_id = current_identity()["advertiser_id"]
     advertiser = Advertiser.query.get(advertiser_id)
     if not advertiser:
         return jsonify({"error": "Anunciante não encontrado"}), 404
@@ -836,6 +1016,28 @@ def initiate_subscription(plan_type):
 
     return jsonify(subscription_data), 200
 
+# Webhook do PagSeguro: confere a assinatura, grava na caixa de entrada e responde na hora;
+# o processamento fica com `flask webhook-worker` (ver webhook_inbox.py)
+webhook_bp = Blueprint("webhook_bp", __name__, url_prefix="/webhook")
+
+@webhook_bp.route("/pagseguro", methods=["POST"])
+def pagseguro_webhook():
+    raw_body = request.get_data()
+    if not webhook_inbox.verify_signature(raw_body, request.headers.get(webhook_inbox.SIGNATURE_HEADER)):
+        return jsonify({"error": "Assinatura inválida"}), 403
+
+    try:
+        event, created = webhook_inbox.ingest(raw_body)
+        db.session.commit()
+    except webhook_inbox.InvalidWebhook as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+    # Reenvio de evento já recebido também é confirmado, para o PagSeguro parar de tentar
+    return jsonify({"received": True, "duplicate": not created}), 200
+
 # Webhook do PagSeguro
 # Rota para webhook do PagSeguro
 
@@ -908,13 +1110,9 @@ def initiate_subscription(plan_type):
 
 # Rota para verificar status da assinatura
 @advertiser_bp.route("/subscription-status", methods=["GET"])
-@jwt_required()
+@authorize("advertiser")
 def get_subscription_status():
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_type"] != "advertiser":
-        return jsonify({"error": "Não autorizado"}), 403
-
-    advertiser_id = current_user_identity["user_id"]
+    advertiser_id = current_identity()["advertiser_id"]
     advertiser = Advertiser.query.get(advertiser_id)
     if not advertiser:
         return jsonify({"error": "Anunciante não encontrado"}), 404
@@ -939,8 +1137,11 @@ def get_subscription_status():
         "last_payment_amount": float(advertiser.last_payment_amount) if hasattr(advertiser, 'last_payment_amount') and advertiser.last_payment_amount else None
     }), 200
 
+# Rotas fora dos prefixos (/subscription-success, /api/...)
+api_bp = Blueprint("api_bp", __name__)
+
 # Rota para página de sucesso após pagamento
-@app.route("/subscription-success", methods=["GET"])
+@api_bp.route("/subscription-success", methods=["GET"])
 def subscription_success():
     return jsonify({
         "message": "Pagamento processado! Você receberá uma confirmação por email em breve.",
@@ -949,12 +1150,9 @@ def subscription_success():
 
 # Rotas para upload de imagens
 @advertiser_bp.route("/upload-image", methods=["POST"])
-@jwt_required()
+@authorize("advertiser")
 def upload_image():
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_type"] != "advertiser":
-        return jsonify({"error": "Não autorizado"}), 403
-
+    current_user_identity = current_identity()
     if 'file' not in request.files:
         return jsonify({"error": "Nenhum arquivo enviado"}), 400
 
@@ -963,141 +1161,165 @@ def upload_image():
         return jsonify({"error": "Nenhum arquivo selecionado"}), 400
 
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        # Adicionar timestamp para evitar conflitos
-        timestamp = int(datetime.utcnow().timestamp())
-        filename = f"{timestamp}_{filename}"
-        
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
-        
-        # Retornar URL relativa para o frontend
-        image_url = f"/uploads/{filename}"
-        
-        return jsonify({
-            "message": "Imagem enviada com sucesso",
-            "image_url": image_url,
-            "filename": filename
-        }), 200
+        # Grava em blocos na área de staging (nome = sha256) e valida só o cabeçalho
+        source_hash, staged = image_jobs.stage_upload(file)
+        try:
+            with open(staged, "rb") as f:
+                images.probe(f)
+        except images.InvalidImage as e:
+            image_jobs.discard_staged(source_hash)
+            return jsonify({"error": str(e)}), 400
+
+        try:
+            job = image_jobs.enqueue(current_user_identity["user_id"], source_hash)
+        except image_jobs.QueueFull:
+            response = jsonify({"error": "Muitas imagens em processamento. Tente novamente em instantes."})
+            response.headers["Retry-After"] = "10"
+            return response, 503
+
+        # Processamento em segundo plano: o cliente acompanha pelo id do job
+        payload = image_jobs.job_payload(job)
+        payload["status_url"] = f"/advertiser/upload-image/{job.id}"
+        return jsonify(payload), 200 if job.status == "done" else 202
     
     return jsonify({"error": "Tipo de arquivo não permitido"}), 400
 
+@advertiser_bp.route("/upload-image/<job_id>", methods=["GET"])
+@authorize()
+def get_upload_status(job_id):
+    current_user_identity = current_identity()
+    job = ImageJob.query.get_or_404(job_id)
+    if current_user_identity["user_id"] != job.user_id and current_user_identity["user_type"] != "admin":
+        return jsonify({"error": "Não autorizado"}), 403
+
+    return jsonify(image_jobs.job_payload(job)), 200
+
 # Rota para servir imagens uploadadas
-@advertiser_bp.route("/uploads/<filename>", methods=["GET"])
+@advertiser_bp.route("/uploads/<path:filename>", methods=["GET"])
 def serve_uploaded_file(filename):
-    return send_from_directory(UPLOAD_FOLDER, filename)
+    return storage.send_upload(filename)
 
-# Rotas para sistema de chat
+# Rotas para sistema de chat (chat_id = id da Conversation)
 @user_bp.route("/chat/start", methods=["POST"])
-@jwt_required()
+@authorize()
 def start_chat():
-    current_user_identity = get_jwt_identity()
+    current_user_identity = current_identity()
     data = request.get_json()
     
     if not data or not data.get("advertiser_id"):
         return jsonify({"error": "ID do anunciante é obrigatório"}), 400
 
     # Verificar se já existe um chat entre estes usuários
-    existing_chat = ChatMessage.query.filter_by(
-        user_id=current_user_identity["user_id"],
-        advertiser_id=data["advertiser_id"]
-    ).first()
-
+    existing_chat = conversations.find(current_user_identity["user_id"], data["advertiser_id"])
     if existing_chat:
         return jsonify({"message": "Chat já existe", "chat_id": existing_chat.id}), 200
 
-    # Criar nova conversa
-    chat = ChatMessage(
-        user_id=current_user_identity["user_id"],
-        advertiser_id=data["advertiser_id"],
-        message="Conversa iniciada",
-        sender_type="system",
-        created_at=datetime.utcnow()
-    )
-
     try:
-        db.session.add(chat)
+        chat, created = conversations.get_or_create(current_user_identity["user_id"], data["advertiser_id"])
         db.session.commit()
+        if not created:
+            # Criado por outra requisição entre a consulta acima e esta
+            return jsonify({"message": "Chat já existe", "chat_id": chat.id}), 200
+        analytics.record(analytics.CHAT_START, chat.advertiser_id)
         return jsonify({"message": "Chat iniciado", "chat_id": chat.id}), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 @user_bp.route("/chat/<int:chat_id>/messages", methods=["GET"])
-@jwt_required()
-def get_chat_messages(chat_id):
-    current_user_identity = get_jwt_identity()
-    
-    messages = ChatMessage.query.filter_by(
-        id=chat_id
-    ).order_by(ChatMessage.created_at.asc()).all()
+@authorize()
+def get_chat_messages_by_id(chat_id):
+    current_user_identity = current_identity()
 
-    if not messages:
+    conversation = db.session.get(Conversation, chat_id)
+    if not conversation:
         return jsonify({"error": "Chat não encontrado"}), 404
 
     # Verificar se o usuário tem acesso a este chat
-    first_message = messages[0]
-    if (current_user_identity["user_id"] != first_message.user_id and 
-        current_user_identity["user_id"] != first_message.advertiser_id):
+    side = conversations.side_of(conversation, current_user_identity)
+    if side is None and current_user_identity["user_type"] != "admin":
         return jsonify({"error": "Não autorizado"}), 403
 
-    results = []
-    for msg in messages:
-        results.append({
-            "id": msg.id,
-            "message": msg.message,
-            "sender_type": msg.sender_type,
-            "created_at": msg.created_at.isoformat()
-        })
+    messages, next_cursor = keyset_page(
+        conversations.messages_query(chat_id, request.args.get("since", 0, type=int)),
+        [("id", ChatMessage.id, False)]
+    )
+    if side and conversations.mark_read(chat_id, side):
+        db.session.commit()
 
-    return jsonify(results), 200
+    return paginated_response([conversations.message_payload(msg) for msg in messages], next_cursor)
 
 @user_bp.route("/chat/<int:chat_id>/send", methods=["POST"])
-@jwt_required()
-def send_chat_message(chat_id):
-    current_user_identity = get_jwt_identity()
+@authorize()
+def send_chat_message_by_id(chat_id):
+    current_user_identity = current_identity()
     data = request.get_json()
     
     if not data or not data.get("message"):
         return jsonify({"error": "Mensagem é obrigatória"}), 400
 
     # Verificar se o chat existe e o usuário tem acesso
-    existing_chat = ChatMessage.query.filter_by(id=chat_id).first()
-    if not existing_chat:
+    conversation = db.session.get(Conversation, chat_id)
+    if not conversation:
         return jsonify({"error": "Chat não encontrado"}), 404
 
-    if (current_user_identity["user_id"] != existing_chat.user_id and 
-        current_user_identity["user_id"] != existing_chat.advertiser_id):
+    side = conversations.side_of(conversation, current_user_identity)
+    if side is None:
         return jsonify({"error": "Não autorizado"}), 403
 
-    # Determinar tipo do remetente
-    sender_type = "consumer" if current_user_identity["user_type"] == "consumer" else "advertiser"
-
-    new_message = ChatMessage(
-        user_id=existing_chat.user_id,
-        advertiser_id=existing_chat.advertiser_id,
-        message=data["message"],
-        sender_type=sender_type,
-        created_at=datetime.utcnow()
-    )
-
     try:
-        db.session.add(new_message)
+        new_message = conversations.add_message(conversation, current_user_identity["user_id"], data["message"],
+                                                from_advertiser=(side == "advertiser"))
         db.session.commit()
+        chat_push.publish(conversation.user_id, conversation.advertiser_id, new_message.id)
         return jsonify({"message": "Mensagem enviada", "message_id": new_message.id}), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+# Push pela conversa: consumidor e anunciante esperam no mesmo canal (ver chat_push.channel)
+@user_bp.route("/chat/<int:chat_id>/poll", methods=["GET"])
+@authorize()
+def poll_chat_messages_by_id(chat_id):
+    conversation = db.session.get(Conversation, chat_id)
+    if not conversation:
+        return jsonify({"error": "Chat não encontrado"}), 404
+    if conversations.side_of(conversation, current_identity()) is None:
+        return jsonify({"error": "Não autorizado"}), 403
+
+    return chat_poll_response(conversation.user_id, conversation.advertiser_id)
+
+@user_bp.route("/chat/<int:chat_id>/stream", methods=["GET"])
+@authorize()
+def stream_chat_messages_by_id(chat_id):
+    conversation = db.session.get(Conversation, chat_id)
+    if not conversation:
+        return jsonify({"error": "Chat não encontrado"}), 404
+    if conversations.side_of(conversation, current_identity()) is None:
+        return jsonify({"error": "Não autorizado"}), 403
+
+    return chat_stream_response(conversation.user_id, conversation.advertiser_id)
+
+# Caixa de entrada do anunciante: conversas por última atividade, com prévia e não lidas
+@advertiser_bp.route("/inbox", methods=["GET"])
+@authorize("advertiser")
+def get_advertiser_inbox():
+    inbox = conversations.inbox_query(current_identity()["advertiser_id"])
+    if request.args.get("unread") == "true":
+        inbox = inbox.filter(Conversation.advertiser_unread > 0)
+
+    rows, next_cursor = keyset_page(inbox, [
+        ("last_message_at", Conversation.last_message_at, True),
+        ("id", Conversation.id, True)
+    ])
+
+    return paginated_response([conversations.inbox_payload(row) for row in rows], next_cursor)
+
 # Rota para gerar link compartilhável
 @advertiser_bp.route("/share-link", methods=["GET"])
-@jwt_required()
+@authorize("advertiser")
 def generate_share_link():
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_type"] != "advertiser":
-        return jsonify({"error": "Não autorizado"}), 403
-
-    advertiser_id = current_user_identity["user_id"]
+    advertiser_id = current_identity()["advertiser_id"]
     
     # Buscar dados do anunciante
     advertiser = Advertiser.query.get(advertiser_id)
@@ -1106,48 +1328,60 @@ def generate_share_link():
 
     # Gerar link compartilhável
     base_url = request.host_url.rstrip('/')
-    share_link = f"{base_url}/advertiser/{advertiser_id}"
+    share_link = share_kit.share_link(base_url, advertiser_id)
+    analytics.record(analytics.SHARE, advertiser_id)
     
     # Gerar texto para compartilhamento
-    share_text = f"""
-🏢 {advertiser.business_name}
-
-📍 {advertiser.city.name}, {advertiser.city.state.name}
-📱 {advertiser.phone}
-{'🌐 ' + advertiser.website if advertiser.website else ''}
-
-{advertiser.description[:100] + '...' if advertiser.description and len(advertiser.description) > 100 else advertiser.description or ''}
-
-👆 Veja mais detalhes e entre em contato:
-{share_link}
-
-#TudoMais #Serviços #Local
-    """.strip()
+    share_text = share_kit.share_text({
+        "business_name": advertiser.business_name,
+        "city_name": advertiser.city.name,
+        "state_name": advertiser.city.state.name,
+        "phone": advertiser.phone,
+        "website": advertiser.website,
+        "description": advertiser.description
+    }, share_link)
 
     return jsonify({
         "share_link": share_link,
         "share_text": share_text,
         "qr_code_url": f"{base_url}/api/qr-code?url={share_link}",
-        "social_media": {
-            "whatsapp": f"https://wa.me/?text={share_text.replace(' ', '%20')}",
-            "telegram": f"https://t.me/share/url?url={share_link}&text={share_text.replace(' ', '%20')}",
-            "facebook": f"https://www.facebook.com/sharer/sharer.php?u={share_link}",
-            "twitter": f"https://twitter.com/intent/tweet?text={share_text.replace(' ', '%20')}"
-        }
+        "qr_code_image_url": f"{base_url}/api/qr-code?format=svg&url={share_link}",
+        "social_media": share_kit.social_links(share_link, share_text)
     }), 200
 
 
+# Relatório de desempenho (plano anual): ?granularity=daily&days=30 ou ?granularity=hourly&hours=48
+@advertiser_bp.route("/<int:advertiser_id>/analytics", methods=["GET"])
+@authorize(owner="advertiser_id")
+def advertiser_analytics(advertiser_id):
+    identity = current_identity()
+    if identity["user_type"] != "admin" and identity["plan"] not in analytics.REPORT_PLANS:
+        return jsonify({"error": "Relatórios de desempenho estão disponíveis no plano anual."}), 403
+
+    granularity = request.args.get("granularity", "daily")
+    now = datetime.utcnow()
+    if granularity == "hourly":
+        hours = min(max(request.args.get("hours", 48, type=int), 1), analytics.HOURLY_RETENTION_DAYS * 24)
+        end = analytics.hour_of(now) + timedelta(hours=1)
+        start = end - timedelta(hours=hours)
+    elif granularity == "daily":
+        days = min(max(request.args.get("days", 30, type=int), 1), 366)
+        end = datetime.combine(now.date(), datetime.min.time()) + timedelta(days=1)
+        start = end - timedelta(days=days)
+    else:
+        return jsonify({"error": "granularity deve ser 'daily' ou 'hourly'"}), 400
+
+    return jsonify(analytics.report(advertiser_id, granularity, start, end)), 200
+
 # Importar configurações beta
 from beta_config import (
     is_beta_mode, get_beta_message, get_migration_notice, 
     get_qr_code_content, get_beta_features, BETA_USER_CONFIG
 )
-import qrcode
-from io import BytesIO
 import base64
 
 # Rota para verificar status beta
-@app.route("/api/beta-status", methods=["GET"])
+@api_bp.route("/api/beta-status", methods=["GET"])
 def get_beta_status():
     return jsonify({
         "is_beta": is_beta_mode(),
@@ -1157,41 +1391,43 @@ def get_beta_status():
     }), 200
 
 # Rota para gerar QR Code
-@app.route("/api/qr-code", methods=["GET"])
+# format=png|svg devolve a imagem direto (mais leve que base64 em JSON); sem format, o JSON antigo
+@api_bp.route("/api/qr-code", methods=["GET"])
 def generate_qr_code():
     url = request.args.get('url', request.host_url)
-    
-    # Gerar QR Code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
-    
-    # Criar imagem
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Converter para base64
-    buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    
-    return jsonify({
-        "qr_code": f"data:image/png;base64,{img_str}",
-        "url": url,
-        "content": get_qr_code_content(url)
-    }), 200
+    fmt = request.args.get('format', 'json')
+    size = request.args.get('size', qr_codes.DEFAULT_SIZE, type=int)
+    ec = request.args.get('ec', 'L').upper()
+
+    try:
+        etag = qr_codes.cache_key(url, size, ec, 'png' if fmt == 'json' else fmt)
+    except qr_codes.InvalidQRRequest as e:
+        return jsonify({"error": str(e)}), 400
+    if fmt == 'json':
+        etag += '-json'  # Representação diferente do PNG puro
+
+    # O QR Code de uma URL nunca muda: revalidação sem renderizar
+    if not_modified(etag, None):
+        response = current_app.response_class(status=304)
+    elif fmt == 'json':
+        _, png = qr_codes.get_cache().get(url, size, ec, 'png')
+        response = jsonify({
+            "qr_code": f"data:image/png;base64,{base64.b64encode(png).decode()}",
+            "url": url,
+            "content": get_qr_code_content(url)
+        })
+    else:
+        _, data = qr_codes.get_cache().get(url, size, ec, fmt)
+        response = current_app.response_class(data, mimetype=qr_codes.FORMATS[fmt])
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    return response
 
 # Rota para informações de divulgação beta
 @admin_bp.route("/beta-promotion", methods=["GET"])
-@jwt_required()
+@authorize("admin")
 def get_beta_promotion_materials():
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
     
     base_url = request.host_url.rstrip('/')
     qr_content = get_qr_code_content(base_url)
@@ -1199,6 +1435,7 @@ def get_beta_promotion_materials():
     return jsonify({
         "beta_url": base_url,
         "qr_code_api": f"{base_url}/api/qr-code?url={base_url}",
+        "qr_code_image_url": f"{base_url}/api/qr-code?format=png&size=20&ec=H&url={base_url}",
         "promotion_materials": {
             "qr_code_text": qr_content["text"],
             "social_media_text": qr_content["social_text"],
@@ -1254,7 +1491,7 @@ def register_advertiser_beta():
         return jsonify({"error": "Email já cadastrado"}), 400
 
     # Hash da senha
-    password_hash = bcrypt.generate_password_hash(data["password"]).decode('utf-8')
+    password_hash = passwords.hash_password(data["password"])
 
     # Criar novo anunciante
     new_advertiser = Advertiser(
@@ -1291,7 +1528,9 @@ def register_advertiser_beta():
 
     try:
         db.session.add(new_advertiser)
+        stats.bump(total_advertisers=1, active_advertisers=1, new_signups=1, new_subscriptions=1)
         db.session.commit()
+        invalidate_advertiser(new_advertiser.id)
         
         # TODO: Enviar notificação para admin sobre novo cadastro
         
@@ -1302,33 +1541,17 @@ def register_advertiser_beta():
 
 # Rota para notificações do administrador
 @admin_bp.route("/notifications", methods=["GET"])
-@jwt_required()
+@authorize("admin")
 def get_admin_notifications():
-    current_user_identity = get_jwt_identity()
-    if current_user_identity["user_type"] != "admin":
-        return jsonify({"error": "Não autorizado"}), 403
-
-    # Buscar notificações recentes
-    today = datetime.utcnow().date()
-    
-    # Novos cadastros hoje
-    new_signups_today = Advertiser.query.filter(
-        db.func.date(Advertiser.created_at) == today
-    ).count()
-    
-    # Novas denúncias pendentes
-    pending_reports = Report.query.filter_by(status="pending").count()
-    
-    # Estatísticas gerais
-    total_advertisers = Advertiser.query.count()
-    active_advertisers = Advertiser.query.filter_by(is_active=True).count()
+    # Contadores do dia, uma leitura pela chave primária (ver stats.py)
+    counters = stats.today()
     
     return jsonify({
         "notifications": {
-            "new_signups_today": new_signups_today,
-            "pending_reports": pending_reports,
-            "total_advertisers": total_advertisers,
-            "active_advertisers": active_advertisers
+            "new_signups_today": counters.new_signups,
+            "pending_reports": counters.pending_reports,
+            "total_advertisers": counters.total_advertisers,
+            "active_advertisers": counters.active_advertisers
         },
         "sounds_enabled": {
             "new_signup": True,
@@ -0,0 +1,296 @@
+"""
+Índice de busca textual dos anunciantes - FTS5 no SQLite, FULLTEXT no MySQL
+"""
+
+import re
+import unicodedata
+from sqlalchemy import event, inspect, text, Integer, Float
+from sqlalchemy.orm import Session
+from models import db, Advertiser, Item, Category
+
+SEARCH_TABLE = "advertiser_search"
+
+# Colunas indexadas e o peso de cada uma no ranking (nome pesa mais que descrição)
+SEARCH_COLUMNS = ("name", "category", "description", "items")
+SEARCH_WEIGHTS = {"name": 10.0, "category": 4.0, "description": 1.0, "items": 2.0}
+
+# Tamanho do lote usado na reindexação completa
+REINDEX_BATCH_SIZE = 500
+
+STOPWORDS = {
+    "a", "ao", "aos", "as", "com", "da", "das", "de", "do", "dos", "e", "em",
+    "na", "nas", "no", "nos", "o", "os", "ou", "para", "pela", "pelo", "por",
+    "que", "se", "sem", "um", "uma", "uns", "umas"
+}
+
+# Sufixos removidos pelo stemmer, do mais longo para o mais curto em cada etapa
+PLURAL_SUFFIXES = (("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"),
+                   ("ois", "ol"), ("res", "r"), ("zes", "z"), ("ns", "m"), ("s", ""))
+DIMINUTIVE_SUFFIXES = (("zinhos", ""), ("zinho", ""), ("zinha", ""), ("inho", ""),
+                       ("inha", ""), ("ito", ""), ("ita", ""))
+NOUN_SUFFIXES = (("amentos", ""), ("imentos", ""), ("amento", ""), ("imento", ""),
+                 ("acao", ""), ("icao", ""), ("idade", ""), ("mente", ""),
+                 ("ismo", ""), ("ista", ""), ("aria", ""), ("eria", ""),
+                 ("eiro", ""), ("eira", ""), ("ador", ""), ("adora", ""))
+FEMININE_SUFFIXES = (("ona", "ao"), ("ora", "or"), ("osa", "oso"), ("iva", "ivo"),
+                     ("ica", "ico"), ("ada", "ado"), ("ida", "ido"), ("a", "o"))
+
+MIN_STEM_LENGTH = 3
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def strip_accents(value):
+    """Remove acentos e cedilha (ex: 'Açaí' -> 'Acai')"""
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _strip_suffix(word, suffixes):
+    for suffix, replacement in suffixes:
+        if word.endswith(suffix) and len(word) - len(suffix) + len(replacement) >= MIN_STEM_LENGTH:
+            return word[:len(word) - len(suffix)] + replacement
+    return word
+
+
+def stem(word):
+    """Stemmer leve para português (plural, diminutivo, sufixos nominais e feminino)"""
+    if len(word) <= MIN_STEM_LENGTH or word.isdigit():
+        return word
+    word = _strip_suffix(word, PLURAL_SUFFIXES)
+    word = _strip_suffix(word, DIMINUTIVE_SUFFIXES)
+    word = _strip_suffix(word, NOUN_SUFFIXES)
+    return _strip_suffix(word, FEMININE_SUFFIXES)
+
+
+def tokenize(value, drop_stopwords=True):
+    """Normaliza um texto (sem acentos, minúsculo) e retorna a lista de palavras"""
+    if not value:
+        return []
+    words = _TOKEN_RE.findall(strip_accents(value).lower())
+    if drop_stopwords:
+        words = [w for w in words if w not in STOPWORDS]
+    return words
+
+
+def normalize_field(value):
+    """
+    Converte um campo no texto que vai para o índice: cada palavra normalizada
+    seguida do seu radical, para casar tanto flexões ("pizzas" ~ "pizza") quanto
+    prefixos do que o usuário ainda está digitando ("padar" ~ "padaria").
+    """
+    terms = []
+    for word in tokenize(value):
+        terms.append(word)
+        root = stem(word)
+        if root != word:
+            terms.append(root)
+    return " ".join(terms)
+
+
+def _dialect(bind):
+    return bind.dialect.name
+
+
+# ---------------------------------------------------------------------------
+# Manutenção do índice
+# ---------------------------------------------------------------------------
+
+def create_search_table(bind):
+    """Cria a tabela de busca conforme o banco (usado na migração e no reindex)"""
+    dialect = _dialect(bind)
+    if dialect == "sqlite":
+        bind.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            "name, category, description, items, tokenize='unicode61')"
+        ))
+    elif dialect == "mysql":
+        bind.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+            "advertiser_id INTEGER NOT NULL PRIMARY KEY, "
+            "name TEXT, category TEXT, description TEXT, items TEXT, "
+            "FULLTEXT INDEX ix_advertiser_search_fulltext (name, category, description, items)"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+        ))
+    else:
+        bind.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+            "advertiser_id INTEGER NOT NULL PRIMARY KEY, "
+            "name TEXT, category TEXT, description TEXT, items TEXT)"
+        ))
+
+
+@event.listens_for(db.Model.metadata, "after_create")
+def _create_search_table_with_schema(target, connection, **kw):
+    # db.create_all() (desenvolvimento/testes) também cria a tabela de busca
+    create_search_table(connection)
+
+
+def _key_column(bind):
+    # No FTS5 o id do anunciante é o próprio rowid da tabela virtual
+    return "rowid" if _dialect(bind) == "sqlite" else "advertiser_id"
+
+
+def refresh_documents(bind, advertiser_ids):
+    """Recalcula os documentos de busca dos anunciantes informados"""
+    advertiser_ids = sorted({i for i in advertiser_ids if i is not None})
+    if not advertiser_ids:
+        return 0
+
+    key = _key_column(bind)
+    params = {f"id{n}": adv_id for n, adv_id in enumerate(advertiser_ids)}
+    in_list = ", ".join(f":id{n}" for n in range(len(advertiser_ids)))
+
+    bind.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE {key} IN ({in_list})"), params)
+
+    rows = bind.execute(text(
+        "SELECT advertiser.id, advertiser.business_name, advertiser.description, category.name "
+        "FROM advertiser LEFT JOIN category ON category.id = advertiser.category_id "
+        f"WHERE advertiser.id IN ({in_list})"
+    ), params).fetchall()
+    if not rows:
+        return 0
+
+    item_titles = {}
+    for advertiser_id, title in bind.execute(text(
+        f"SELECT advertiser_id, title FROM item WHERE advertiser_id IN ({in_list})"
+    ), params):
+        item_titles.setdefault(advertiser_id, []).append(title or "")
+
+    documents = [{
+        "advertiser_id": adv_id,
+        "name": normalize_field(business_name),
+        "category": normalize_field(category_name),
+        "description": normalize_field(description),
+        "items": normalize_field(" ".join(item_titles.get(adv_id, [])))
+    } for adv_id, business_name, description, category_name in rows]
+
+    bind.execute(text(
+        f"INSERT INTO {SEARCH_TABLE} ({key}, name, category, description, items) "
+        "VALUES (:advertiser_id, :name, :category, :description, :items)"
+    ), documents)
+    return len(documents)
+
+
+def rebuild_index(bind):
+    """Recria o índice inteiro em lotes (comando `flask search-reindex`)"""
+    create_search_table(bind)
+    bind.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+
+    total = 0
+    last_id = 0
+    while True:
+        ids = [row[0] for row in bind.execute(text(
+            "SELECT id FROM advertiser WHERE id > :last_id ORDER BY id LIMIT :limit"
+        ), {"last_id": last_id, "limit": REINDEX_BATCH_SIZE})]
+        if not ids:
+            break
+        total += refresh_documents(bind, ids)
+        last_id = ids[-1]
+
+    if _dialect(bind) == "sqlite":
+        bind.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')"))
+    return total
+
+
+def _changed(obj, *attrs):
+    state = inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_search_index(session, flush_context):
+    """Mantém o índice em dia na mesma transação das alterações de Advertiser/Item"""
+    advertiser_ids = set()
+    category_ids = set()
+
+    for obj in session.new:
+        if isinstance(obj, Advertiser):
+            advertiser_ids.add(obj.id)
+        elif isinstance(obj, Item):
+            advertiser_ids.add(obj.advertiser_id)
+
+    for obj in session.dirty:
+        if isinstance(obj, Advertiser) and _changed(obj, "business_name", "description", "category_id"):
+            advertiser_ids.add(obj.id)
+        elif isinstance(obj, Item) and _changed(obj, "title", "advertiser_id"):
+            history = inspect(obj).attrs.advertiser_id.history
+            advertiser_ids.update(history.deleted or ())
+            advertiser_ids.add(obj.advertiser_id)
+        elif isinstance(obj, Category) and _changed(obj, "name"):
+            category_ids.add(obj.id)
+
+    for obj in session.deleted:
+        if isinstance(obj, Advertiser):
+            advertiser_ids.add(obj.id)
+        elif isinstance(obj, Item):
+            advertiser_ids.add(obj.advertiser_id)
+
+    if not advertiser_ids and not category_ids:
+        return
+
+    bind = session.connection()
+    for category_id in category_ids:
+        advertiser_ids.update(row[0] for row in bind.execute(
+            text("SELECT id FROM advertiser WHERE category_id = :category_id"),
+            {"category_id": category_id}
+        ))
+
+    refresh_documents(bind, advertiser_ids)
+
+
+# ---------------------------------------------------------------------------
+# Consulta
+# ---------------------------------------------------------------------------
+
+def _query_terms(query):
+    words = tokenize(query)
+    if not words:
+        # Consulta só com stopwords ("de", "a"...): usa as palavras como vieram
+        words = tokenize(query, drop_stopwords=False)
+    return list(dict.fromkeys(words))
+
+
+def match_advertisers(bind, query):
+    """
+    Retorna uma subconsulta (advertiser_id, score) com os anunciantes que casam
+    com todos os termos da busca, ou None se a busca não tiver termos.
+    Palavras completas casam pelo radical; a última também por prefixo, para
+    a busca funcionar enquanto o usuário digita.
+    """
+    words = _query_terms(query)
+    if not words:
+        return None
+    complete, last = [stem(w) for w in words[:-1]], words[-1]
+    prefixes = list(dict.fromkeys([last, stem(last)]))
+
+    dialect = _dialect(bind)
+    if dialect == "sqlite":
+        last_expr = " OR ".join(f'"{p}"*' for p in prefixes)
+        match_expr = " AND ".join([f'"{term}"' for term in complete] + [f"({last_expr})"])
+        weights = ", ".join(str(SEARCH_WEIGHTS[column]) for column in SEARCH_COLUMNS)
+        stmt = text(
+            f"SELECT rowid AS advertiser_id, -bm25({SEARCH_TABLE}, {weights}) AS score "
+            f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match"
+        ).bindparams(match=match_expr)
+    elif dialect == "mysql":
+        last_expr = " ".join(f"{p}*" for p in prefixes)
+        match_expr = " ".join([f"+{term}" for term in complete] + [f"+({last_expr})"])
+        columns = ", ".join(SEARCH_COLUMNS)
+        stmt = text(
+            f"SELECT advertiser_id, MATCH ({columns}) AGAINST (:match IN BOOLEAN MODE) AS score "
+            f"FROM {SEARCH_TABLE} WHERE MATCH ({columns}) AGAINST (:match IN BOOLEAN MODE)"
+        ).bindparams(match=match_expr)
+    else:
+        # Bancos sem busca textual nativa: LIKE sobre o texto já normalizado
+        document = " || ' ' || ".join(SEARCH_COLUMNS)
+        conditions = [f"({document}) LIKE :term{n}" for n in range(len(complete))]
+        conditions.append("(" + " OR ".join(
+            f"({document}) LIKE :prefix{n}" for n in range(len(prefixes))) + ")")
+        params = {f"term{n}": f"%{term}%" for n, term in enumerate(complete)}
+        params.update({f"prefix{n}": f"%{p}%" for n, p in enumerate(prefixes)})
+        stmt = text(
+            f"SELECT advertiser_id, 0.0 AS score FROM {SEARCH_TABLE} WHERE {' AND '.join(conditions)}"
+        ).bindparams(**params)
+
+    return stmt.columns(advertiser_id=Integer, score=Float).subquery("search_match")
@@ -0,0 +1,219 @@
+"""
+Kit de divulgação em lote: link, texto de compartilhamento e QR Code de cada anunciante.
+
+Os anunciantes são lidos do banco em blocos (uma única consulta com join em
+cidade/estado) e o texto + QR Code de cada um é renderizado num pool de
+processos (SHARE_KIT_WORKERS), com um número limitado de tarefas em voo. O
+pool é criado na primeira exportação e reaproveitado pelas seguintes do
+mesmo processo (como em image_jobs.py); um kit de até INLINE_MAX anunciantes
+é renderizado no próprio processo, sem IPC. Os
+resultados vão direto para um ZIP escrito em sequência (sem seek), então a
+resposta HTTP ou o arquivo do `flask share-kit` é gerado aos poucos, sem
+montar o arquivo inteiro em memória. O ZIP termina com links.csv e
+relatorio.json (quantidade, tempo, kits por segundo).
+"""
+
+import csv
+import io
+import json
+import os
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+from models import db, Advertiser, City, State
+from analytics import SHARE_REF
+import qr_codes
+
+DEFAULT_WORKERS = os.cpu_count() or 2
+BATCH_SIZE = 25  # Anunciantes por tarefa do pool: amortiza o custo de IPC por tarefa
+IN_FLIGHT_PER_WORKER = 4  # Lotes em voo por worker: limita a memória com milhares de anunciantes
+FETCH_SIZE = 500
+INLINE_MAX = BATCH_SIZE  # Até um lote não há o que paralelizar
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def share_link(base_url, advertiser_id):
+    # ?ref= identifica o acesso pelo link de divulgação nos relatórios (ver analytics.py)
+    return f"{base_url}/advertiser/{advertiser_id}?ref={SHARE_REF}"
+
+
+def share_text(advertiser, link):
+    """Texto de divulgação; `advertiser` precisa de business_name, phone, website, description, city_name e state_name"""
+    description = advertiser["description"]
+    return f"""
+🏢 {advertiser["business_name"]}
+
+📍 {advertiser["city_name"]}, {advertiser["state_name"]}
+📱 {advertiser["phone"]}
+{'🌐 ' + advertiser["website"] if advertiser["website"] else ''}
+
+{description[:100] + '...' if description and len(description) > 100 else description or ''}
+
+👆 Veja mais detalhes e entre em contato:
+{link}
+
+#TudoMais #Serviços #Local
+    """.strip()
+
+
+def social_links(link, text):
+    return {
+        "whatsapp": f"https://wa.me/?text={text.replace(' ', '%20')}",
+        "telegram": f"https://t.me/share/url?url={link}&text={text.replace(' ', '%20')}",
+        "facebook": f"https://www.facebook.com/sharer/sharer.php?u={link}",
+        "twitter": f"https://twitter.com/intent/tweet?text={text.replace(' ', '%20')}"
+    }
+
+
+def advertiser_rows(city_id=None, state_id=None, category_id=None, plan=None):
+    """Anunciantes ativos (ou o filtro pedido) como dicts simples, lidos em blocos"""
+    query = (db.session.query(Advertiser.id, Advertiser.business_name, Advertiser.phone, Advertiser.website,
+                              Advertiser.description, City.name.label("city_name"),
+                              State.name.label("state_name"))
+             .join(City, City.id == Advertiser.city_id)
+             .join(State, State.id == City.state_id)
+             .filter(Advertiser.is_active == True))
+    if city_id:
+        query = query.filter(Advertiser.city_id == city_id)
+    if state_id:
+        query = query.filter(City.state_id == state_id)
+    if category_id:
+        query = query.filter(Advertiser.category_id == category_id)
+    if plan:
+        query = query.filter(Advertiser.subscription_plan == plan)
+    for row in query.order_by(Advertiser.id).yield_per(FETCH_SIZE):
+        yield dict(row._mapping)
+
+
+def render_kit(advertiser, base_url, qr_format="png"):
+    """Kit de um anunciante (executado no pool; não acessa o banco)"""
+    link = share_link(base_url, advertiser["id"])
+    text = share_text(advertiser, link)
+    return {
+        "id": advertiser["id"],
+        "business_name": advertiser["business_name"],
+        "share_link": link,
+        "share_text": text,
+        "social_media": social_links(link, text),
+        "qr_code": qr_codes.render(link, qr_codes.DEFAULT_SIZE, "M", qr_format),
+    }
+
+
+def render_batch(advertisers, base_url, qr_format="png"):
+    return [render_kit(advertiser, base_url, qr_format) for advertiser in advertisers]
+
+
+class _ChunkWriter(io.RawIOBase):
+    """Destino não posicionável do ZIP: acumula os bytes até o gerador entregá-los"""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _get_pool(workers):
+    global _pool, _pool_pid
+    with _pool_lock:
+        # Um pool por processo: workers do Gunicorn criados por fork não herdam o do pai
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _kits(rows, base_url, qr_format, workers):
+    """Kits na ordem dos anunciantes; com workers > 0, em lotes paralelos com no máximo N lotes em voo"""
+    rows = iter(rows)
+    head = list(islice(rows, INLINE_MAX))
+    if not workers or len(head) < INLINE_MAX:
+        for row in chain(head, rows):
+            yield render_kit(row, base_url, qr_format)
+        return
+
+    pool = _get_pool(workers)
+    pending = deque()
+    try:
+        for batch in _batches(chain(head, rows)):
+            pending.append(pool.submit(render_batch, batch, base_url, qr_format))
+            if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # Download interrompido: o pool é compartilhado, então só descarta os lotes deste kit
+        for future in pending:
+            future.cancel()
+
+
+def _write_kit(archive, kit, qr_format):
+    folder = f"anunciante_{kit['id']}"
+    archive.writestr(f"{folder}/qrcode.{qr_format}", kit["qr_code"])
+    archive.writestr(f"{folder}/compartilhar.txt", kit["share_text"])
+    archive.writestr(f"{folder}/links.json", json.dumps(
+        {"share_link": kit["share_link"], "social_media": kit["social_media"]}, ensure_ascii=False, indent=2))
+
+
+def stream_archive(rows, base_url, qr_format="png", workers=DEFAULT_WORKERS, report=None):
+    """
+    Gera os bytes do ZIP aos poucos. Ao final, `report` (dict, se passado)
+    recebe o relatório de vazão que também vai em relatorio.json.
+    """
+    started = time.perf_counter()
+    out = _ChunkWriter()
+    index = io.StringIO()
+    index_writer = csv.writer(index)
+    index_writer.writerow(["id", "empresa", "link", "whatsapp"])
+    count = 0
+
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for kit in _kits(rows, base_url, qr_format, workers):
+            _write_kit(archive, kit, qr_format)
+            index_writer.writerow([kit["id"], kit["business_name"], kit["share_link"],
+                                   kit["social_media"]["whatsapp"]])
+            count += 1
+            yield out.drain()
+
+        elapsed = time.perf_counter() - started
+        stats = {
+            "advertisers": count,
+            "workers": workers,
+            "qr_format": qr_format,
+            "seconds": round(elapsed, 3),
+            "kits_per_second": round(count / elapsed, 1) if elapsed else None,
+            "zip_bytes_before_index": out.size,
+        }
+        archive.writestr("links.csv", index.getvalue())
+        archive.writestr("relatorio.json", json.dumps(stats, indent=2))
+    if report is not None:
+        report.update(stats, zip_bytes=out.size)
+    yield out.drain()
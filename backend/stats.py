@@ -0,0 +1,154 @@
+"""
+Estatísticas do painel do administrador.
+
+O painel é consultado em polling; em vez de vários COUNT(*) por requisição,
+os números ficam numa linha de DailyStats por dia e a leitura é pela chave
+primária (o dia). A linha é mantida de dois jeitos:
+
+- bump(): as rotas que cadastram, ativam/desativam ou removem anunciantes e
+  resolvem denúncias somam/subtraem no contador do dia, na mesma transação
+  da mudança (UPDATE col = col + n, sem ler a linha);
+- rollup(): recontagem exata, com uma consulta agregada por tabela, rodada
+  periodicamente por `flask stats-rollup`. Corrige o que muda em massa fora
+  das rotas (expiração, cobrança, webhooks) ou um incremento que caiu no
+  meio de uma recontagem, e fecha o movimento do dia anterior.
+
+Se a linha de hoje ainda não existe, a primeira leitura do dia faz o rollup.
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import update, case
+from sqlalchemy.exc import IntegrityError
+from models import db, DailyStats, User, Advertiser, Report
+
+TOTALS = ("total_users", "total_advertisers", "active_advertisers", "pending_reports")
+DAILY = ("new_signups", "new_subscriptions", "new_reports")
+MAX_HISTORY_DAYS = 366
+
+
+def day_bounds(day):
+    """[início, fim) do dia, para filtrar por faixa em vez de DATE(coluna)"""
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+
+def _in_day(column, start, end):
+    return db.func.coalesce(db.func.sum(case(((column >= start) & (column < end), 1), else_=0)), 0)
+
+
+def compute(day):
+    """Recontagem do dia: uma consulta agregada por tabela"""
+    start, end = day_bounds(day)
+    advertisers = db.session.query(
+        db.func.count(Advertiser.id),
+        db.func.coalesce(db.func.sum(case((Advertiser.is_active.is_(True), 1), else_=0)), 0),
+        _in_day(Advertiser.created_at, start, end),
+        _in_day(Advertiser.subscription_start, start, end)
+    ).one()
+    reports = db.session.query(
+        db.func.coalesce(db.func.sum(case((Report.status == "pending", 1), else_=0)), 0),
+        _in_day(Report.created_at, start, end)
+    ).one()
+    return {
+        "total_users": db.session.query(db.func.count(User.id)).scalar(),
+        "total_advertisers": advertisers[0],
+        "active_advertisers": advertisers[1],
+        "pending_reports": reports[0],
+        "new_signups": advertisers[2],
+        "new_subscriptions": advertisers[3],
+        "new_reports": reports[1]
+    }
+
+
+def rollup(day=None, totals=True):
+    """
+    Regrava a linha do dia com a recontagem (o commit fica com quem chama).
+    totals=False só atualiza o movimento de um dia que já tem linha: os
+    totais de um dia passado ficam como estavam no fim dele.
+    """
+    day = day or datetime.utcnow().date()
+    row = db.session.get(DailyStats, day)
+    if row is None and not totals:
+        return None
+    values = compute(day)
+    if not totals:
+        values = {name: values[name] for name in DAILY}
+    if row is None:
+        row = DailyStats(day=day)
+        db.session.add(row)
+    for name, value in values.items():
+        setattr(row, name, value)
+    row.updated_at = datetime.utcnow()
+    return row
+
+
+def bump(**deltas):
+    """
+    Soma nos contadores de hoje, na transação de quem chama. Sem a linha de
+    hoje não faz nada: ela será criada já com a recontagem.
+    """
+    table = DailyStats.__table__
+    values = {name: table.c[name] + delta for name, delta in deltas.items() if delta}
+    if values:
+        db.session.execute(update(table).where(table.c.day == datetime.utcnow().date()).values(**values))
+
+
+def is_today(moment):
+    start, end = day_bounds(datetime.utcnow().date())
+    return moment is not None and start <= moment < end
+
+
+def removal_deltas(advertiser):
+    """
+    O que sai dos contadores ao remover o anunciante. A recontagem conta o
+    movimento do dia pelas linhas que existem, então quem entrou hoje sai
+    também de new_signups/new_subscriptions.
+    """
+    return dict(total_advertisers=-1, active_advertisers=-1 if advertiser.is_active else 0,
+                new_signups=-1 if is_today(advertiser.created_at) else 0,
+                new_subscriptions=-1 if is_today(advertiser.subscription_start) else 0)
+
+
+def today():
+    """Linha de hoje por chave primária; a primeira leitura do dia faz o rollup"""
+    day = datetime.utcnow().date()
+    row = db.session.get(DailyStats, day)
+    if row is not None:
+        return row
+    try:
+        row = rollup(day)
+        db.session.commit()
+    except IntegrityError:
+        # Outra requisição criou a linha ao mesmo tempo
+        db.session.rollback()
+        row = db.session.get(DailyStats, day)
+    return row
+
+
+def history(days):
+    """Linhas dos últimos `days` dias (faixa na chave primária), mais recente primeiro"""
+    start = datetime.utcnow().date() - timedelta(days=min(days, MAX_HISTORY_DAYS) - 1)
+    return DailyStats.query.filter(DailyStats.day >= start).order_by(DailyStats.day.desc()).all()
+
+
+def run_rollup(now=None):
+    """Recontagem de hoje e fechamento do movimento de ontem (para `flask stats-rollup`)"""
+    day = (now or datetime.utcnow()).date()
+    rollup(day - timedelta(days=1), totals=False)
+    db.session.commit()
+    try:
+        row = rollup(day)
+        db.session.commit()
+    except IntegrityError:
+        # A primeira leitura do dia criou a linha no meio da recontagem
+        db.session.rollback()
+        row = rollup(day)
+        db.session.commit()
+    return row
+
+
+def as_dict(row):
+    data = {name: getattr(row, name) for name in TOTALS + DAILY}
+    data["day"] = row.day.isoformat()
+    data["updated_at"] = row.updated_at.isoformat() if row.updated_at else None
+    return data
@@ -0,0 +1,171 @@
+"""
+Armazenamento das imagens por conteúdo (sha256), em diretórios fatiados.
+
+Cada upload vira <ab>/<cd>/<hash>_<variante>.<formato> dentro de uploads/, onde
+ab e cd são os primeiros caracteres do hash: arquivos idênticos são gravados
+uma vez só e nenhum diretório fica com centenas de milhares de entradas.
+As referências são contadas a partir de Advertiser.logo e Item.image;
+`flask uploads-gc` remove os blobs sem referência.
+
+Entrega (UPLOAD_SERVE_MODE): "x-sendfile" (Apache com mod_xsendfile) ou
+"x-accel" (nginx) delegam a transferência ao servidor web; "flask" (padrão)
+transmite pelo wsgi.file_wrapper do servidor WSGI, com suporte a Range.
+URLs com hash nunca mudam de conteúdo e vão com Cache-Control immutable.
+"""
+
+import mimetypes
+import os
+import re
+import time
+from datetime import timedelta
+from flask import current_app, request, abort
+from sqlalchemy import select, union_all
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+from models import db, Advertiser, Item, ImageJob
+import images
+
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+URL_PREFIX = "/uploads/"
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # URLs endereçadas por conteúdo
+LEGACY_MAX_AGE = 24 * 3600  # Arquivos antigos (timestamp_nome), que podem ser sobrescritos
+DEFAULT_ACCEL_PREFIX = "/protected-uploads/"
+
+# Uploads recentes ainda podem não estar ligados a um anunciante/item
+GC_GRACE_PERIOD = timedelta(hours=24)
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+_BLOB_URL_RE = re.compile(r"(?:^|/)([0-9a-f]{2})/([0-9a-f]{2})/(?P<hash>[0-9a-f]{64})_[a-z]+\.[a-z]+$")
+
+
+def upload_folder():
+    """Pasta dos uploads: UPLOAD_FOLDER da configuração ou uploads/ ao lado do código"""
+    return current_app.config.get("UPLOAD_FOLDER") or UPLOAD_FOLDER
+
+
+def blob_base(source_hash):
+    """Caminho base (sem variante/extensão) do blob, relativo a uploads/"""
+    return f"{source_hash[:2]}/{source_hash[2:4]}/{source_hash}"
+
+
+def blob_files(source_hash):
+    """Todos os arquivos de variantes de um hash"""
+    base = blob_base(source_hash)
+    return [f"{base}_{variant}.{ext}" for variant in images.VARIANTS for ext in images.FORMATS]
+
+
+def has_blob(source_hash, folder=None):
+    folder = folder or upload_folder()
+    return all(os.path.exists(os.path.join(folder, name)) for name in blob_files(source_hash))
+
+
+def touch_blob(source_hash, folder=None):
+    """Renova a data dos arquivos reaproveitados para o GC respeitar a carência"""
+    folder = folder or upload_folder()
+    for name in blob_files(source_hash):
+        os.utime(os.path.join(folder, name))
+
+
+def hash_from_url(url):
+    """Hash do blob referenciado por uma URL de upload (None para URLs externas ou antigas)"""
+    match = _BLOB_URL_RE.search(url or "")
+    return match["hash"] if match else None
+
+
+def reference_counts():
+    """{hash: número de referências} somando logos de anunciantes e imagens de itens"""
+    references = union_all(
+        select(Advertiser.logo.label("url")).where(Advertiser.logo.like(f"{URL_PREFIX}%")),
+        select(Item.image.label("url")).where(Item.image.like(f"{URL_PREFIX}%"))
+    )
+    counts = {}
+    for (url,) in db.session.execute(references):
+        source_hash = hash_from_url(url)
+        if source_hash:
+            counts[source_hash] = counts.get(source_hash, 0) + 1
+    return counts
+
+
+def stored_blobs(folder=None):
+    """{hash: [(caminho, tamanho, mtime)]} percorrendo só os diretórios fatiados"""
+    folder = folder or upload_folder()
+    blobs = {}
+    for first in os.listdir(folder):
+        first_path = os.path.join(folder, first)
+        if len(first) != 2 or not os.path.isdir(first_path):
+            continue
+        for second in os.listdir(first_path):
+            second_path = os.path.join(first_path, second)
+            if len(second) != 2 or not os.path.isdir(second_path):
+                continue
+            with os.scandir(second_path) as entries:
+                for entry in entries:
+                    source_hash = entry.name.split("_", 1)[0]
+                    if entry.is_file() and _HASH_RE.match(source_hash):
+                        stat = entry.stat()
+                        blobs.setdefault(source_hash, []).append((entry.path, stat.st_size, stat.st_mtime))
+    return blobs
+
+
+def collect_garbage(folder=None, grace_period=GC_GRACE_PERIOD, dry_run=False):
+    """
+    Remove blobs sem referência mais antigos que o período de carência.
+    Retorna (hashes removidos, bytes liberados).
+    """
+    folder = folder or upload_folder()
+    counts = reference_counts()
+    pending = {row.source_hash for row in db.session.query(ImageJob.source_hash)
+               .filter(ImageJob.status.in_(("queued", "processing")))}
+    cutoff = time.time() - grace_period.total_seconds()
+
+    removed, freed = [], 0
+    for source_hash, files in stored_blobs(folder).items():
+        if counts.get(source_hash) or source_hash in pending:
+            continue
+        if any(mtime > cutoff for _, _, mtime in files):
+            continue
+        removed.append(source_hash)
+        freed += sum(size for _, size, _ in files)
+        if not dry_run:
+            for path, _, _ in files:
+                os.remove(path)
+
+    if removed and not dry_run:
+        # Jobs concluídos desses arquivos não podem mais ser reaproveitados
+        for start in range(0, len(removed), 500):
+            ImageJob.query.filter(ImageJob.source_hash.in_(removed[start:start + 500]),
+                                  ImageJob.status == "done").delete(synchronize_session=False)
+        db.session.commit()
+    return removed, freed
+
+
+def send_upload(filename):
+    """Resposta para GET /uploads/<filename> conforme UPLOAD_SERVE_MODE"""
+    path = safe_join(upload_folder(), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mode = current_app.config.get("UPLOAD_SERVE_MODE", "flask")
+    immutable = hash_from_url(filename) is not None
+    max_age = IMMUTABLE_MAX_AGE if immutable else LEGACY_MAX_AGE
+
+    if mode == "x-accel":
+        # O nginx entrega o arquivo (Range incluso) a partir de uma location `internal`
+        response = current_app.response_class(mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream")
+        prefix = current_app.config.get("UPLOAD_ACCEL_PREFIX", DEFAULT_ACCEL_PREFIX)
+        response.headers["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + filename.lstrip("/")
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        response = send_file(
+            path, request.environ,
+            use_x_sendfile=(mode == "x-sendfile"),
+            response_class=current_app.response_class,
+            conditional=True,  # If-None-Match / If-Modified-Since e Range (206)
+            max_age=max_age
+        )
+        response.accept_ranges = "bytes"
+    if immutable:
+        response.cache_control.immutable = True
+    return response
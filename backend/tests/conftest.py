@@ -0,0 +1,135 @@
+import os
+
+# Antes de importar o app: banco em memória em vez do MySQL de produção
+os.environ["DATABASE_URL"] = "sqlite://"
+
+from datetime import date, datetime, timedelta
+
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, text
+
+import beta_config
+from app import app as flask_app, bcrypt
+from models import db, User, UserType, State, City, Category, Advertiser, SubscriptionPlan
+from auth import user_claims
+from search_index import SEARCH_TABLE
+
+
+@pytest.fixture
+def app():
+    flask_app.config.update(TESTING=True, CACHE_DISABLED=True, ANALYTICS_ENABLED=False,
+                            BCRYPT_LOG_ROUNDS=4)
+    bcrypt.init_app(flask_app)
+    flask_app.extensions["analytics_buffer"] = None
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+        # A tabela de busca não faz parte do metadata (ver search_index.py)
+        with db.engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def geo(app):
+    """Estado, cidade e categoria mínimos para cadastrar anunciantes"""
+    state = State(name="Pernambuco", code="PE")
+    db.session.add(state)
+    db.session.flush()
+    city = City(name="Recife", state_id=state.id)
+    category = Category(name="Alimentação")
+    db.session.add_all([city, category])
+    db.session.commit()
+    return {"city": city, "category": category}
+
+
+@pytest.fixture
+def make_advertiser(geo):
+    counter = iter(range(1, 100000))
+
+    def make(**fields):
+        n = next(counter)
+        user = User(email=fields.pop("email", f"anunciante{n}@teste.com"), name=f"Anunciante {n}",
+                    user_type=UserType.ADVERTISER, password_hash="x")
+        db.session.add(user)
+        db.session.flush()
+        values = dict(
+            user_id=user.id, business_name=f"Loja {n}", phone="81999999999", cpf=f"{n:011d}",
+            birth_date=date(1990, 1, 1), city_id=geo["city"].id, category_id=geo["category"].id,
+            subscription_plan=SubscriptionPlan.MONTHLY, subscription_status="active",
+            subscription_end=datetime.utcnow() + timedelta(days=30)
+        )
+        values.update(fields)
+        advertiser = Advertiser(**values)
+        db.session.add(advertiser)
+        db.session.commit()
+        return advertiser
+    return make
+
+
+@pytest.fixture
+def make_consumer(app):
+    counter = iter(range(1, 100000))
+
+    def make():
+        n = next(counter)
+        user = User(email=f"consumidor{n}@teste.com", name=f"Consumidor {n}",
+                    user_type=UserType.CONSUMER, password_hash="x")
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def uploads(app, tmp_path, monkeypatch):
+    """Pastas de uploads e de staging temporárias; devolve a de uploads"""
+    folder = tmp_path / "uploads"
+    folder.mkdir()
+    monkeypatch.setitem(app.config, "UPLOAD_FOLDER", str(folder))
+    monkeypatch.setitem(app.config, "UPLOAD_STAGING_FOLDER", str(tmp_path / "staging"))
+    return folder
+
+
+@pytest.fixture
+def beta_mode(monkeypatch):
+    """Liga/desliga o modo beta só durante o teste: `beta_mode(False)`"""
+    def set_mode(enabled):
+        monkeypatch.setitem(beta_config.BETA_CONFIG, "is_beta_mode", enabled)
+    return set_mode
+
+
+@pytest.fixture
+def auth_headers(app):
+    def headers(user):
+        token = create_access_token(identity=str(user.id), additional_claims=user_claims(user))
+        return {"Authorization": f"Bearer {token}"}
+    return headers
+
+
+@pytest.fixture
+def count_selects(app):
+    """Conta os SELECTs emitidos dentro do bloco: `with count_selects() as counter: ...; counter.count`"""
+    class Counter:
+        count = 0
+
+        def __call__(self, conn, cursor, statement, *args):
+            if statement.lstrip().upper().startswith("SELECT"):
+                self.count += 1
+
+        def __enter__(self):
+            self.count = 0
+            event.listen(db.engine, "before_cursor_execute", self)
+            return self
+
+        def __exit__(self, *exc):
+            event.remove(db.engine, "before_cursor_execute", self)
+
+    return Counter
@@ -0,0 +1,108 @@
+"""Relatórios de desempenho: buffer por worker, consolidação e endpoint"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import analytics
+from models import db, AnalyticsEvent, AnalyticsHourly, AnalyticsDaily, SubscriptionPlan
+
+NOW = datetime(2026, 10, 18, 14, 35)
+
+
+def test_buffer_aggregates_per_hour_and_keeps_counts_on_failure():
+    written, failing = [], [True]
+
+    def writer(counts):
+        if failing[0]:
+            raise RuntimeError("banco fora do ar")
+        written.append(dict(counts))
+
+    buffer = analytics.EventBuffer(writer, flush_seconds=3600, max_keys=2, clock=lambda: NOW)
+    buffer.add([(analytics.VIEW, 1), (analytics.VIEW, 1), (analytics.IMPRESSION, 1)])
+    # Limite de chaves: evento de uma chave nova é descartado
+    buffer.add([(analytics.VIEW, 2)])
+    assert buffer.dropped == 1
+
+    assert buffer.flush() == 0
+    failing[0] = False
+    buffer.add([(analytics.VIEW, 1)])
+    assert buffer.flush() == 2
+    assert written == [{(1, analytics.VIEW, NOW.replace(minute=0)): 3,
+                        (1, analytics.IMPRESSION, NOW.replace(minute=0)): 1}]
+    assert buffer.flush() == 0
+
+
+@pytest.fixture
+def tracking(app, monkeypatch):
+    """Buffer real gravando no banco; a descarga é chamada pelo teste"""
+    buffer = analytics.EventBuffer(analytics.database_writer(app), flush_events=10 ** 6, flush_seconds=3600)
+    monkeypatch.setitem(app.extensions, "analytics_buffer", buffer)
+    return buffer
+
+
+def test_routes_record_events(client, make_advertiser, tracking):
+    first, second = make_advertiser().id, make_advertiser().id
+    assert client.get(f"/advertiser/{first}").status_code == 200
+    assert client.get(f"/advertiser/{first}?ref=share").status_code == 200
+    assert client.get("/advertiser/").status_code == 200
+    # Nada no banco até a descarga
+    assert AnalyticsEvent.query.count() == 0
+
+    tracking.flush()
+    counts = {(row.advertiser_id, row.event): row.count for row in AnalyticsEvent.query}
+    assert counts == {(first, analytics.VIEW): 2, (first, analytics.SHARE_CLICK): 1,
+                      (first, analytics.IMPRESSION): 1, (second, analytics.IMPRESSION): 1}
+
+
+def test_rollup_merges_into_hourly_and_daily(app, make_advertiser):
+    advertiser_id = make_advertiser().id
+    hour = analytics.hour_of(NOW)
+
+    def raw(*rows):
+        db.session.add_all([AnalyticsEvent(advertiser_id=advertiser_id, event=event, hour=moment, count=count)
+                            for event, moment, count in rows])
+        db.session.commit()
+
+    raw((analytics.VIEW, hour, 3), (analytics.VIEW, hour, 2), (analytics.VIEW, hour - timedelta(hours=1), 1),
+        (analytics.VIEW, NOW - timedelta(days=20), 7))
+    assert analytics.rollup(now=NOW) == {"hourly": 3, "daily": 2, "pruned": 1}
+    assert AnalyticsEvent.query.count() == 0
+
+    # Segunda rodada soma nas linhas existentes em vez de duplicar
+    raw((analytics.VIEW, hour, 4))
+    result = app.test_cli_runner().invoke(args=["analytics-rollup", "--once"])
+    assert "1 linhas por hora" in result.output
+    hourly = {row.hour: row.count for row in AnalyticsHourly.query}
+    assert hourly == {hour: 9, hour - timedelta(hours=1): 1}
+    daily = {row.day: row.count for row in AnalyticsDaily.query}
+    assert daily == {NOW.date(): 10, (NOW - timedelta(days=20)).date(): 7}
+
+
+def test_report_endpoint(client, make_advertiser, auth_headers):
+    annual = make_advertiser(subscription_plan=SubscriptionPlan.ANNUAL)
+    today = datetime.utcnow()
+    db.session.add_all([
+        AnalyticsDaily(advertiser_id=annual.id, day=today.date(), event=analytics.VIEW, count=5),
+        AnalyticsDaily(advertiser_id=annual.id, day=(today - timedelta(days=1)).date(), event=analytics.VIEW,
+                       count=2),
+        AnalyticsDaily(advertiser_id=annual.id, day=(today - timedelta(days=60)).date(), event=analytics.VIEW,
+                       count=100),
+        AnalyticsHourly(advertiser_id=annual.id, hour=analytics.hour_of(today), event=analytics.SHARE, count=1),
+    ])
+    db.session.commit()
+    headers = auth_headers(annual.user)
+
+    daily = client.get(f"/advertiser/{annual.id}/analytics?days=7", headers=headers).get_json()
+    assert daily["totals"][analytics.VIEW] == 7
+    assert [point[analytics.VIEW] for point in daily["series"]] == [2, 5]
+    hourly = client.get(f"/advertiser/{annual.id}/analytics?granularity=hourly", headers=headers).get_json()
+    assert hourly["totals"] == dict.fromkeys(analytics.EVENTS, 0) | {analytics.SHARE: 1}
+    assert client.get(f"/advertiser/{annual.id}/analytics?granularity=weekly",
+                      headers=headers).status_code == 400
+
+    monthly = make_advertiser()
+    assert client.get(f"/advertiser/{monthly.id}/analytics",
+                      headers=auth_headers(monthly.user)).status_code == 403
+    assert client.get(f"/advertiser/{annual.id}/analytics",
+                      headers=auth_headers(monthly.user)).status_code == 403
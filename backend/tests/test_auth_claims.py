@@ -0,0 +1,29 @@
+"""Claims de plano depois de uma troca de plano"""
+
+from flask_jwt_extended import decode_token
+
+from models import db, Item, SubscriptionPlan
+
+
+def test_subscribe_returns_token_with_new_plan(app, client, make_advertiser, auth_headers):
+    advertiser = make_advertiser(subscription_plan=SubscriptionPlan.MONTHLY)
+    response = client.post(f"/advertiser/{advertiser.id}/subscribe", json={"plan": "annual"},
+                           headers=auth_headers(advertiser.user))
+
+    assert response.status_code == 200
+    claims = decode_token(response.get_json()["access_token"])
+    assert (claims["plan"], claims["item_quota"]) == ("annual", 25)
+    assert claims["sub"] == str(advertiser.user_id)
+
+
+def test_item_quota_follows_plan_changed_after_token(client, make_advertiser, auth_headers):
+    advertiser = make_advertiser(subscription_plan=SubscriptionPlan.MONTHLY)
+    headers = auth_headers(advertiser.user)  # item_quota=5 na claim
+    # Upgrade aplicado fora da requisição (webhook), sem token novo
+    advertiser.subscription_plan = SubscriptionPlan.ANNUAL
+    db.session.commit()
+
+    statuses = [client.post(f"/advertiser/{advertiser.id}/items", json={"title": f"Item {n}"},
+                            headers=headers).status_code for n in range(6)]
+    assert statuses == [201] * 6
+    assert Item.query.filter_by(advertiser_id=advertiser.id).count() == 6
@@ -0,0 +1,127 @@
+"""Cache de respostas: versões por tag, invalidação e o limite de TTL em memória"""
+
+import pytest
+
+import cache
+from cache import MemoryBackend, ResponseCache, invalidate_advertiser, invalidate_advertisers
+from models import db
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def response_cache(app):
+    """Cache ligado, com um backend em memória novo por teste"""
+    previous = app.extensions["response_cache"]
+    app.config["CACHE_DISABLED"] = False
+    app.extensions["response_cache"] = ResponseCache(MemoryBackend())
+    yield app.extensions["response_cache"]
+    app.config["CACHE_DISABLED"] = True
+    app.extensions["response_cache"] = previous
+
+
+def test_invalidating_a_tag_changes_only_its_keys():
+    response_cache = ResponseCache(MemoryBackend())
+    catalog = response_cache.key_for("search", "query=pizza", ("catalog",))
+    profile = response_cache.key_for("advertiser/advertiser_id=7", "", ("advertiser:7",))
+    other = response_cache.key_for("advertiser/advertiser_id=8", "", ("advertiser:8",))
+
+    response_cache.invalidate("catalog", "advertiser:7")
+    assert response_cache.key_for("search", "query=pizza", ("catalog",)) != catalog
+    assert response_cache.key_for("advertiser/advertiser_id=7", "", ("advertiser:7",)) != profile
+    assert response_cache.key_for("advertiser/advertiser_id=8", "", ("advertiser:8",)) == other
+    assert response_cache.invalidations == 2
+
+
+def test_versions_survive_clear_and_eviction():
+    backend = MemoryBackend(max_entries=1)
+    backend.bump("catalog")
+    backend.set("a", 1, 60)
+    backend.set("b", 2, 60)
+    backend.clear()
+    # Uma versão que voltasse a 0 reabriria entradas antigas
+    assert backend.get_versions(["catalog", "plans"]) == [1, 0]
+    assert backend.evictions == 1
+
+
+def test_memory_ttl_is_capped(clock):
+    backend = MemoryBackend(max_ttl=60)
+    backend.set("plans", "longo", 3600)
+    backend.set("sem-ttl", "sempre", None)
+    backend.set("curto", "curto", 10)
+
+    clock.now += 30
+    assert [backend.get(key) for key in ("plans", "sem-ttl", "curto")] == ["longo", "sempre", None]
+    clock.now += 31
+    assert backend.get("plans") is None
+    assert backend.get("sem-ttl") is None
+
+    unbounded = MemoryBackend(max_ttl=None)
+    unbounded.set("plans", "longo", 3600)
+    clock.now += 3599
+    assert unbounded.get("plans") == "longo"
+
+
+def test_other_process_sees_the_change_within_max_ttl(clock):
+    """Worker web e comando (ex: subscriptions-expire) com caches em memória separados"""
+    web, command = ResponseCache(MemoryBackend(max_ttl=60)), ResponseCache(MemoryBackend(max_ttl=60))
+    key = web.key_for("search", "", ("catalog",))
+    web.set(key, "antes da expiração", 300)
+
+    command.invalidate("catalog")
+    assert web.get(web.key_for("search", "", ("catalog",))) == "antes da expiração"
+    clock.now += 60
+    assert web.get(web.key_for("search", "", ("catalog",))) is None
+
+
+def test_search_is_served_from_cache_until_invalidated(client, response_cache, make_advertiser, count_selects):
+    advertiser = make_advertiser(business_name="Pizzaria Bella")
+    advertiser_id = advertiser.id
+
+    first = client.get("/advertiser/?query=pizzaria")
+    with count_selects() as counter:
+        second = client.get("/advertiser/?query=pizzaria")
+    assert counter.count == 0
+    assert second.get_data() == first.get_data()
+    assert (response_cache.hits, response_cache.misses) == (1, 1)
+
+    # Parâmetro vazio não muda a chave
+    client.get("/advertiser/?query=pizzaria&city_id=")
+    assert response_cache.hits == 2
+
+    advertiser.business_name = "Pizzaria Roma"
+    db.session.commit()
+    invalidate_advertiser(advertiser_id)
+    third = client.get("/advertiser/?query=pizzaria")
+    assert third.get_data() != first.get_data()
+    assert response_cache.misses == 2
+
+
+def test_batch_invalidation_bumps_catalog_once(response_cache):
+    invalidate_advertisers([1, 2, 3])
+    invalidate_advertisers([])
+    assert response_cache.backend.get_versions(["catalog", "advertiser:2"]) == [1, 1]
+    assert response_cache.invalidations == 4
+
+
+def test_command_warning_depends_on_backend(app, response_cache):
+    assert "60 s" in cache.local_invalidation_warning()
+
+    class Shared(MemoryBackend):
+        shared = True
+
+    app.extensions["response_cache"] = ResponseCache(Shared())
+    assert cache.local_invalidation_warning() is None
@@ -0,0 +1,46 @@
+"""Início de chat nos relatórios, por /chat/start ou pela primeira mensagem"""
+
+import pytest
+
+import analytics
+
+
+class RecordingBuffer:
+    def __init__(self):
+        self.events = []
+
+    def add(self, events):
+        self.events.extend(events)
+
+    def chat_starts(self):
+        return [advertiser_id for event, advertiser_id in self.events if event == analytics.CHAT_START]
+
+
+@pytest.fixture
+def buffer(app):
+    recording = RecordingBuffer()
+    app.extensions["analytics_buffer"] = recording
+    yield recording
+    app.extensions["analytics_buffer"] = None
+
+
+def test_first_message_records_chat_start_once(client, buffer, make_consumer, make_advertiser, auth_headers):
+    consumer, advertiser = make_consumer(), make_advertiser()
+    url, headers = f"/user/{consumer.id}/chat/{advertiser.id}", auth_headers(consumer)
+
+    for text in ("Oi", "Tudo bem?"):
+        assert client.post(url, json={"message": text}, headers=headers).status_code == 201
+
+    assert buffer.chat_starts() == [advertiser.id]
+
+
+def test_start_chat_records_once(client, buffer, make_consumer, make_advertiser, auth_headers):
+    consumer, advertiser = make_consumer(), make_advertiser()
+    headers = auth_headers(consumer)
+
+    first = client.post("/user/chat/start", json={"advertiser_id": advertiser.id}, headers=headers)
+    again = client.post("/user/chat/start", json={"advertiser_id": advertiser.id}, headers=headers)
+    message = client.post(f"/user/{consumer.id}/chat/{advertiser.id}", json={"message": "Oi"}, headers=headers)
+
+    assert (first.status_code, again.status_code, message.status_code) == (201, 200, 201)
+    assert buffer.chat_starts() == [advertiser.id]
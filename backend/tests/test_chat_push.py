@@ -0,0 +1,83 @@
+"""Push do chat: consumidor e anunciante recebem pela mesma conversa"""
+
+import threading
+
+import chat_push
+
+
+def _participants(make_consumer, make_advertiser, auth_headers):
+    """Ids e cabeçalhos já resolvidos: o long-poll devolve a sessão ao pool e solta os objetos"""
+    consumer, advertiser = make_consumer(), make_advertiser()
+    return consumer.id, advertiser.id, auth_headers(consumer), auth_headers(advertiser.user)
+
+
+def _conversation(client, consumer_id, advertiser_id, headers):
+    response = client.post(f"/user/{consumer_id}/chat/{advertiser_id}", json={"message": "Oi, tem pizza?"},
+                           headers=headers)
+    assert response.status_code == 201
+    return response.get_json()["conversation_id"]
+
+
+def test_both_sides_poll_the_same_conversation(client, make_consumer, make_advertiser, auth_headers):
+    consumer_id, advertiser_id, consumer_headers, advertiser_headers = _participants(
+        make_consumer, make_advertiser, auth_headers)
+    chat_id = _conversation(client, consumer_id, advertiser_id, consumer_headers)
+
+    # O anunciante pega a primeira mensagem pela conversa
+    polled = client.get(f"/user/chat/{chat_id}/poll?timeout=0", headers=advertiser_headers).get_json()
+    assert [message["message"] for message in polled["messages"]] == ["Oi, tem pizza?"]
+
+    client.post(f"/user/chat/{chat_id}/send", json={"message": "Tem sim"}, headers=advertiser_headers)
+    since = polled["last_id"]
+    for url, headers in ((f"/user/{consumer_id}/chat/{advertiser_id}/poll", consumer_headers),
+                         (f"/user/chat/{chat_id}/poll", consumer_headers),
+                         (f"/user/chat/{chat_id}/poll", advertiser_headers)):
+        response = client.get(f"{url}?since={since}&timeout=0", headers=headers)
+        assert [message["message"] for message in response.get_json()["messages"]] == ["Tem sim"]
+
+
+def test_advertiser_long_poll_wakes_on_consumer_message(app, client, make_consumer, make_advertiser,
+                                                        auth_headers):
+    consumer_id, advertiser_id, consumer_headers, advertiser_headers = _participants(
+        make_consumer, make_advertiser, auth_headers)
+    chat_id = _conversation(client, consumer_id, advertiser_id, consumer_headers)
+    since = client.get(f"/user/chat/{chat_id}/poll?timeout=0", headers=advertiser_headers).get_json()["last_id"]
+
+    broker = app.extensions["chat_broker"]
+    name = chat_push.channel(consumer_id, advertiser_id)
+    result = {}
+
+    def wait():
+        result["woke"] = broker.wait(name, since, 5)
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    client.post(f"/user/{consumer_id}/chat/{advertiser_id}", json={"message": "Ainda está aberto?"},
+                headers=consumer_headers)
+    waiter.join(5)
+    assert result == {"woke": True}
+
+    response = client.get(f"/user/chat/{chat_id}/poll?since={since}&timeout=5", headers=advertiser_headers)
+    assert [message["message"] for message in response.get_json()["messages"]] == ["Ainda está aberto?"]
+
+
+def test_conversation_stream_is_limited_to_participants(client, make_consumer, make_advertiser, auth_headers):
+    consumer_id, advertiser_id, consumer_headers, advertiser_headers = _participants(
+        make_consumer, make_advertiser, auth_headers)
+    stranger_headers = auth_headers(make_consumer())
+    chat_id = _conversation(client, consumer_id, advertiser_id, consumer_headers)
+
+    for suffix in ("poll?timeout=0", "stream"):
+        assert client.get(f"/user/chat/{chat_id}/{suffix}", headers=stranger_headers).status_code == 403
+        assert client.get(f"/user/chat/999/{suffix}", headers=consumer_headers).status_code == 404
+
+    response = client.get(f"/user/chat/{chat_id}/stream", headers=advertiser_headers, buffered=False)
+    assert response.mimetype == "text/event-stream"
+    first_chunks = []
+    for chunk in response.response:
+        first_chunks.append(chunk if isinstance(chunk, str) else chunk.decode())
+        if len(first_chunks) == 2:
+            break
+    response.close()
+    assert first_chunks[0].startswith("retry:")
+    assert "Oi, tem pizza?" in first_chunks[1]
@@ -0,0 +1,35 @@
+"""Agendador de cobrança: suspensão pela carência e lembretes"""
+
+from datetime import datetime, timedelta
+
+from dunning import run_due
+from expiry import expire_subscriptions
+from models import db, Advertiser, EmailOutbox, SubscriptionPlan
+
+
+def test_only_dunning_suspends_payment_pending(make_advertiser, beta_mode):
+    beta_mode(False)
+    now = datetime.utcnow()
+    # Venceu, mas a carência ainda corre: nenhum dos motores suspende
+    in_grace = make_advertiser(subscription_status="payment_pending", subscription_end=now - timedelta(days=1),
+                               grace_period_end=now + timedelta(days=2)).id
+    overdue = make_advertiser(subscription_status="payment_pending", subscription_end=now - timedelta(days=5),
+                              grace_period_end=now - timedelta(days=1)).id
+
+    assert expire_subscriptions(now)["rows"] == 0
+    assert run_due(now)["suspended"] == 1
+    assert db.session.get(Advertiser, in_grace).subscription_status == "payment_pending"
+    advertiser = db.session.get(Advertiser, overdue)
+    assert (advertiser.subscription_status, advertiser.is_active) == ("suspended", False)
+
+
+def test_beta_mode_skips_trial_reminders(make_advertiser, beta_mode):
+    soon = datetime.utcnow() + timedelta(days=2)
+    make_advertiser(subscription_plan=SubscriptionPlan.TRIAL, subscription_status="trial", subscription_end=soon)
+    make_advertiser(subscription_end=soon)
+
+    beta_mode(True)
+    assert run_due()["reminder_3"] == 1
+    beta_mode(False)
+    assert run_due()["reminder_3"] == 1
+    assert EmailOutbox.query.filter_by(event_type="subscription_reminder").count() == 2
@@ -0,0 +1,42 @@
+"""Motor de expiração: quem vence, quem fica de fora"""
+
+from datetime import datetime, timedelta
+
+from expiry import expire_subscriptions
+from models import db, Advertiser, SubscriptionPlan
+
+
+def _status(advertiser_id):
+    advertiser = db.session.get(Advertiser, advertiser_id)
+    return advertiser.subscription_status, advertiser.is_active
+
+
+def test_voluntary_cancellation_expires_at_period_end(make_advertiser, beta_mode):
+    beta_mode(False)
+    past = datetime.utcnow() - timedelta(days=1)
+    voluntary = make_advertiser(subscription_status="cancelled", subscription_end=past).id
+    # Cancelado pelo dunning depois da carência: o status final é dele
+    dunned = make_advertiser(subscription_status="cancelled", subscription_end=past, is_active=False,
+                             grace_period_end=past - timedelta(days=30)).id
+    running = make_advertiser(subscription_status="cancelled").id
+
+    report = expire_subscriptions()
+
+    assert report["expired"] == [voluntary]
+    assert _status(voluntary) == ("expired", False)
+    assert _status(dunned) == ("cancelled", False)
+    assert _status(running) == ("cancelled", True)
+
+
+def test_beta_mode_keeps_trials(make_advertiser, beta_mode):
+    past = datetime.utcnow() - timedelta(days=1)
+    trial = make_advertiser(subscription_plan=SubscriptionPlan.TRIAL, subscription_status="trial",
+                            subscription_end=past).id
+    paid = make_advertiser(subscription_end=past).id
+
+    beta_mode(True)
+    assert expire_subscriptions()["expired"] == [paid]
+    assert _status(trial) == ("trial", True)
+
+    beta_mode(False)
+    assert expire_subscriptions()["expired"] == [trial]
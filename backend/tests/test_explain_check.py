@@ -0,0 +1,22 @@
+"""Planos das consultas quentes: todas usam índice (ver explain_check.py)"""
+
+from explain_check import _compile, full_scans
+from models import db, Advertiser
+
+
+def test_hot_queries_use_indexes(app):
+    result = app.test_cli_runner().invoke(args=["explain-check", "--seed", "500"])
+
+    assert result.exit_code == 0, result.output
+    assert "FALHA" not in result.output
+    # Os dados sintéticos ficam só dentro da transação desfeita
+    assert Advertiser.query.count() == 0
+
+
+def test_full_scan_is_reported(app):
+    bind = db.session.connection()
+    unindexed = db.session.query(Advertiser.id).filter(Advertiser.phone == "81999999999")
+    indexed = db.session.query(Advertiser.id).filter(Advertiser.city_id == 1)
+
+    assert full_scans(bind, _compile(unindexed, bind)) == ["advertiser"]
+    assert full_scans(bind, _compile(indexed, bind)) == []
@@ -0,0 +1,121 @@
+"""Busca por proximidade: grade, escopos e paginação limitada no banco"""
+
+import math
+import random
+
+import pytest
+
+import geo
+from models import AdScope, Advertiser
+
+RECIFE = (-8.05, -34.9)
+
+
+def _point_at(origin, km, bearing_deg=0.0):
+    """Ponto a `km` do ponto de origem na direção dada (aproximação local, suficiente para os testes)"""
+    latitude, longitude = origin
+    d_lat = km * math.cos(math.radians(bearing_deg)) / geo.KM_PER_DEGREE
+    d_lng = km * math.sin(math.radians(bearing_deg)) / (geo.KM_PER_DEGREE * math.cos(math.radians(latitude)))
+    return latitude + d_lat, longitude + d_lng
+
+
+def _nearby(client, origin, radius_km, limit, cursor=None):
+    params = {"lat": origin[0], "lng": origin[1], "radius_km": radius_km, "limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    response = client.get("/advertiser/", query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json(), response.headers.get("X-Next-Cursor")
+
+
+def _all_pages(client, origin, radius_km, limit):
+    results, cursor = [], None
+    while True:
+        page, cursor = _nearby(client, origin, radius_km, limit, cursor)
+        assert len(page) <= limit
+        results += page
+        if cursor is None:
+            return results
+
+
+def test_geo_cell_grid():
+    assert geo.geo_cell(None, -34.9) is None
+    assert geo.geo_cell(0.0, 0.0) == 450 * geo.GRID_COLUMNS + 900
+    assert geo.geo_cell(-90.0, -180.0) == 0
+    # A longitude 180 é a mesma coluna da -180
+    assert geo.geo_cell(10.0, 180.0) == geo.geo_cell(10.0, -180.0)
+    assert geo.geo_cell(0.19, 0.19) == geo.geo_cell(0.0, 0.0) != geo.geo_cell(0.2, 0.0)
+
+
+def test_cells_for_box_cover_every_point_in_the_box():
+    rng = random.Random(7)
+    for origin, radius_km in ((RECIFE, 10), (RECIFE, 100), ((59.9, 10.7), 50), ((0.05, -0.05), 30)):
+        box = geo.bounding_box(*origin, radius_km)
+        cells = set(geo.cells_for_box(*box))
+        for _ in range(200):
+            latitude, longitude = rng.uniform(box[0], box[1]), rng.uniform(box[2], box[3])
+            assert geo.geo_cell(latitude, longitude) in cells
+    assert len(geo.cells_for_box(0.01, 0.02, 0.01, 0.02)) == 1
+    assert len(geo.cells_for_box(0.1, 0.3, 0.1, 0.3)) == 4
+
+
+@pytest.mark.parametrize("scope, km, visible", [
+    (AdScope.CITY, 14.9, True), (AdScope.CITY, 15.2, False),
+    (AdScope.CITY_REGION, 99.0, True), (AdScope.CITY_REGION_OTHER_STATES, 99.0, True),
+])
+def test_scope_distance_cut_offs(client, make_advertiser, scope, km, visible):
+    latitude, longitude = _point_at(RECIFE, km, 45)
+    advertiser_id = make_advertiser(latitude=latitude, longitude=longitude, ad_scope=scope).id
+
+    results, _ = _nearby(client, RECIFE, geo.MAX_RADIUS_KM, 20)
+    assert [result["id"] for result in results] == ([advertiser_id] if visible else [])
+    assert geo.is_visible_at(scope, km) is visible
+
+
+def test_radius_cut_off(client, make_advertiser):
+    inside = make_advertiser(latitude=_point_at(RECIFE, 9.9)[0], longitude=RECIFE[1]).id
+    make_advertiser(latitude=_point_at(RECIFE, 10.1)[0], longitude=RECIFE[1])
+
+    results, _ = _nearby(client, RECIFE, 10, 20)
+    assert [result["id"] for result in results] == [inside]
+    assert 9.8 < results[0]["distance_km"] < 10
+
+
+@pytest.mark.parametrize("origin", [RECIFE, (59.9, 10.7)])
+def test_pages_follow_exact_distance_order(client, make_advertiser, origin):
+    rng = random.Random(42)
+    for _ in range(60):
+        latitude, longitude = _point_at(origin, rng.uniform(0, 60), rng.uniform(0, 360))
+        make_advertiser(latitude=latitude, longitude=longitude, ad_scope=AdScope.CITY_REGION)
+
+    results = _all_pages(client, origin, 50, 7)
+    distances = [(result["distance_km"], result["id"]) for result in results]
+    assert distances == sorted(distances)
+    assert all(distance <= 50 for distance, _ in distances)
+    # Mesmo conjunto da distância exata calculada sobre todos os anunciantes
+    expected = sorted(
+        (round(geo.haversine_km(*origin, row.latitude, row.longitude), 3), row.id)
+        for row in Advertiser.query.all()
+        if geo.haversine_km(*origin, row.latitude, row.longitude) <= 50
+    )
+    assert distances == expected
+
+
+def test_page_reads_a_bounded_batch(client, make_advertiser, monkeypatch):
+    for n in range(40):
+        latitude, longitude = _point_at(RECIFE, 0.5 + n * 0.2, n * 37)
+        make_advertiser(latitude=latitude, longitude=longitude)
+
+    loaded = []
+    rank = geo.rank_by_distance
+
+    def counting(rows, *args):
+        loaded.append(len(rows))
+        return rank(rows, *args)
+
+    monkeypatch.setattr(geo, "rank_by_distance", counting)
+    results, cursor = _nearby(client, RECIFE, 10, 5)
+
+    assert len(results) == 5 and cursor
+    # Um lote de limit + 2 no banco, em vez das 40 linhas do raio
+    assert loaded == [7]
@@ -0,0 +1,91 @@
+"""Requisições condicionais do perfil público: ETag, Last-Modified e 304"""
+
+from datetime import datetime
+
+from models import db, Advertiser, Item, SubscriptionPlan
+
+LONG_AGO = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def _profile(client, advertiser_id, **headers):
+    return client.get(f"/advertiser/{advertiser_id}", headers=headers)
+
+
+def _advertiser_with_item(make_advertiser):
+    """Anunciante (plano que recebe avaliações) e item com datas antigas, para o Last-Modified ficar no passado"""
+    advertiser = make_advertiser(subscription_plan=SubscriptionPlan.ANNUAL)
+    item = Item(advertiser_id=advertiser.id, title="Pizza", updated_at=LONG_AGO)
+    db.session.add(item)
+    db.session.flush()
+    advertiser.updated_at = LONG_AGO
+    db.session.commit()
+    return advertiser.id, item.id
+
+
+def test_etag_revalidation(client, make_advertiser):
+    advertiser_id, _ = _advertiser_with_item(make_advertiser)
+
+    first = _profile(client, advertiser_id)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "public, max-age=60"
+
+    revalidated = _profile(client, advertiser_id, **{"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["ETag"] == etag
+    assert revalidated.get_data() == b""
+
+    # If-None-Match manda: com a ETag errada, 200 mesmo com a data em dia
+    stale = _profile(client, advertiser_id, **{"If-None-Match": '"outra"',
+                                               "If-Modified-Since": first.headers["Last-Modified"]})
+    assert stale.status_code == 200
+
+
+def test_last_modified_revalidation(client, make_advertiser):
+    advertiser_id, _ = _advertiser_with_item(make_advertiser)
+
+    first = _profile(client, advertiser_id)
+    assert first.headers["Last-Modified"] == "Mon, 01 Jan 2024 12:00:00 GMT"
+    since = {"If-Modified-Since": first.headers["Last-Modified"]}
+    assert _profile(client, advertiser_id, **since).status_code == 304
+
+    db.session.add(Item(advertiser_id=advertiser_id, title="Calzone"))
+    db.session.commit()
+    assert _profile(client, advertiser_id, **since).status_code == 200
+
+
+def test_item_delete_moves_last_modified(client, make_advertiser, auth_headers):
+    advertiser_id, item_id = _advertiser_with_item(make_advertiser)
+    owner = auth_headers(db.session.get(Advertiser, advertiser_id).user)
+
+    first = _profile(client, advertiser_id)
+    assert client.delete(f"/advertiser/items/{item_id}", headers=owner).status_code == 200
+
+    # Sem itens, a data máxima dos itens some: quem revalida por data precisa ver a remoção
+    after = _profile(client, advertiser_id, **{"If-Modified-Since": first.headers["Last-Modified"]})
+    assert after.status_code == 200
+    assert after.headers["ETag"] != first.headers["ETag"]
+    assert after.last_modified > first.last_modified
+    assert after.get_json()["items"] == []
+
+
+def test_review_changes_validators(client, make_advertiser, make_consumer, auth_headers):
+    advertiser_id, _ = _advertiser_with_item(make_advertiser)
+    consumer = make_consumer()
+    consumer_id, headers = consumer.id, auth_headers(consumer)
+
+    first = _profile(client, advertiser_id)
+    response = client.post(f"/user/{consumer_id}/reviews", json={"advertiser_id": advertiser_id, "rating": 5},
+                           headers=headers)
+    assert response.status_code == 201
+
+    after = _profile(client, advertiser_id, **{"If-None-Match": first.headers["ETag"],
+                                               "If-Modified-Since": first.headers["Last-Modified"]})
+    assert after.status_code == 200
+    assert after.last_modified > first.last_modified
+
+
+def test_missing_advertiser_is_not_conditional(client, app):
+    response = _profile(client, 999, **{"If-None-Match": "*"})
+    assert response.status_code == 404
+    assert "ETag" not in response.headers
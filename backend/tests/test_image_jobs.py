@@ -0,0 +1,120 @@
+"""Fila de imagens: staging, processamento pelo worker, reaproveitamento e limites"""
+
+import io
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from PIL import Image
+
+import image_jobs
+import storage
+from models import db, ImageJob
+
+
+def _png(color=(200, 30, 30), size=(800, 600)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def worker_mode(app, uploads, monkeypatch):
+    """Sem pool de processos: os jobs ficam na fila para run_pending (como `flask image-worker`)"""
+    monkeypatch.setitem(app.config, "IMAGE_WORKERS", 0)
+    monkeypatch.setitem(app.config, "IMAGE_QUEUE_MAX", 50)
+    return uploads
+
+
+@pytest.fixture
+def owner(make_advertiser, auth_headers):
+    advertiser = make_advertiser()
+    return advertiser.user_id, auth_headers(advertiser.user)
+
+
+def _upload(client, headers, content, filename="logo.png"):
+    return client.post("/advertiser/upload-image", data={"file": (io.BytesIO(content), filename)},
+                       headers=headers, content_type="multipart/form-data")
+
+
+def test_upload_is_queued_then_processed(client, worker_mode, owner):
+    _, headers = owner
+    response = _upload(client, headers, _png())
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+    assert response.get_json()["status_url"] == f"/advertiser/upload-image/{job_id}"
+    source_hash = db.session.get(ImageJob, job_id).source_hash
+    assert os.path.exists(image_jobs.staged_path(source_hash))
+
+    assert image_jobs.run_pending() == 1
+    status = client.get(f"/advertiser/upload-image/{job_id}", headers=headers).get_json()
+    assert status["status"] == "done"
+    assert status["image_url"] == f"/uploads/{storage.blob_base(source_hash)}_full.jpg"
+    assert set(status["variants"]) == {"thumbnail", "card", "full"}
+    assert "160w" in status["srcset"]["webp"]
+    # Variantes no armazenamento, staging limpo
+    assert storage.has_blob(source_hash)
+    assert not os.path.exists(image_jobs.staged_path(source_hash))
+    assert db.session.get(ImageJob, job_id).attempts == 1
+
+
+def test_same_content_reuses_stored_variants(client, worker_mode, owner):
+    _, headers = owner
+    first = _upload(client, headers, _png()).get_json()["job_id"]
+    image_jobs.run_pending()
+
+    again = _upload(client, headers, _png(), filename="copia.png")
+    assert again.status_code == 200
+    assert again.get_json()["status"] == "done"
+    assert again.get_json()["image_url"] == client.get(f"/advertiser/upload-image/{first}",
+                                                        headers=headers).get_json()["image_url"]
+    assert image_jobs.run_pending() == 0
+
+
+def test_invalid_and_broken_images(client, worker_mode, owner):
+    _, headers = owner
+    response = _upload(client, headers, b"isto nao e uma imagem")
+    assert response.status_code == 400
+    assert os.listdir(image_jobs.staging_folder()) == []
+    assert _upload(client, headers, b"texto", filename="notas.txt").status_code == 400
+
+    # Cabeçalho válido, pixels cortados: passa na checagem rápida e falha no worker
+    truncated = _png(size=(1200, 900))[:400]
+    job_id = _upload(client, headers, truncated).get_json()["job_id"]
+    image_jobs.run_pending()
+    status = client.get(f"/advertiser/upload-image/{job_id}", headers=headers).get_json()
+    assert status["status"] == "failed"
+    assert status["error"]
+
+
+def test_full_queue_is_refused(app, client, worker_mode, owner, monkeypatch):
+    _, headers = owner
+    monkeypatch.setitem(app.config, "IMAGE_QUEUE_MAX", 1)
+    assert _upload(client, headers, _png((1, 2, 3))).status_code == 202
+
+    response = _upload(client, headers, _png((4, 5, 6)))
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "10"
+    assert ImageJob.query.count() == 1
+    assert len(os.listdir(image_jobs.staging_folder())) == 1
+
+
+def test_job_status_is_private(client, worker_mode, owner, make_advertiser, auth_headers):
+    _, headers = owner
+    job_id = _upload(client, headers, _png()).get_json()["job_id"]
+    other = auth_headers(make_advertiser().user)
+    assert client.get(f"/advertiser/upload-image/{job_id}", headers=other).status_code == 403
+
+
+def test_claim_and_requeue_stale(client, worker_mode, owner):
+    _, headers = owner
+    job_id = _upload(client, headers, _png()).get_json()["job_id"]
+
+    assert image_jobs.claim(job_id)
+    # Outro processo não pega o mesmo job
+    assert not image_jobs.claim(job_id)
+    assert image_jobs.requeue_stale() == 0
+    assert image_jobs.requeue_stale(datetime.utcnow() + image_jobs.STALE_AFTER + timedelta(seconds=1)) == 1
+    assert db.session.get(ImageJob, job_id).status == "queued"
+    assert image_jobs.run_pending() == 1
+    assert db.session.get(ImageJob, job_id).attempts == 2
@@ -0,0 +1,54 @@
+"""Listagens: só as colunas do card, imagens pela thumbnail e tamanho de página limitado"""
+
+import pytest
+
+import queries
+from models import db, Favorite, Item
+from pagination import MAX_PAGE_SIZE, DEFAULT_PAGE_SIZE
+
+PRIVATE = {"cpf", "birth_date", "email", "address", "latitude", "longitude", "password_hash"}
+
+
+def test_search_cards_select_only_card_columns(app):
+    selected = {column.name for column in queries.search_cards().statement.selected_columns}
+    assert selected == {"id", "business_name", "logo", "city", "category", "description", "phone",
+                        "average_rating", "rating_count"}
+
+
+def test_list_payloads_reference_thumbnails(client, make_advertiser, make_consumer, auth_headers):
+    advertiser = make_advertiser(logo="/uploads/ab12_full.jpg")
+    legacy = make_advertiser(logo="/uploads/logo-antigo.png")
+    db.session.add(Item(advertiser_id=advertiser.id, title="Pizza", image="/uploads/cd34_card.webp"))
+    consumer = make_consumer()
+    db.session.add(Favorite(user_id=consumer.id, advertiser_id=advertiser.id))
+    db.session.commit()
+    advertiser_id, legacy_id, consumer_id = advertiser.id, legacy.id, consumer.id
+
+    search = {card["id"]: card for card in client.get("/advertiser/").get_json()}
+    assert set(search[advertiser_id]) == {"id", "business_name", "description", "phone", "logo", "city",
+                                          "category", "average_rating", "rating_count"}
+    assert search[advertiser_id]["logo"] == "/uploads/ab12_thumbnail.jpg"
+    # URLs de antes das variantes voltam como estão
+    assert search[legacy_id]["logo"] == "/uploads/logo-antigo.png"
+
+    top10 = {card["id"]: card for card in client.get("/advertiser/top10").get_json()}
+    assert top10[advertiser_id]["logo"] == "/uploads/ab12_thumbnail.jpg"
+    assert [item["image"] for item in top10[advertiser_id]["featured_items"]] == ["/uploads/cd34_thumbnail.webp"]
+
+    favorites = client.get(f"/user/{consumer_id}/favorites", headers=auth_headers(consumer)).get_json()
+    assert favorites[0]["logo"] == "/uploads/ab12_thumbnail.jpg"
+
+    for card in [*search.values(), *top10.values(), *favorites]:
+        assert not PRIVATE & set(card)
+
+
+@pytest.mark.parametrize("limit, expected", [
+    ("500", MAX_PAGE_SIZE), ("0", 1), ("-3", 1), ("abc", DEFAULT_PAGE_SIZE), (None, DEFAULT_PAGE_SIZE),
+])
+def test_page_limit_is_clamped(client, make_advertiser, limit, expected):
+    for _ in range(MAX_PAGE_SIZE + 5):
+        make_advertiser()
+
+    response = client.get("/advertiser/", query_string={"limit": limit} if limit else {})
+    assert len(response.get_json()) == expected
+    assert response.headers["X-Next-Cursor"]
@@ -0,0 +1,202 @@
+"""Caixa de saída e worker de email contra um servidor SMTP de teste no próprio processo"""
+
+import socketserver
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import mailer
+from models import db, EmailOutbox
+
+
+class StubSMTP(socketserver.ThreadingTCPServer):
+    """
+    SMTP mínimo: aceita tudo, exceto os destinatários em `replies` (código e
+    texto devolvidos no RCPT). Com `drop_after`, fecha a conexão depois de
+    tantas mensagens, como um servidor que derruba conexões paradas.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubSMTPHandler)
+        self.replies = {}
+        self.drop_after = None
+        self.connections = 0
+        self.messages = []
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        delivered = 0
+        recipients = []
+        self.reply("220 stub ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.reply("250-stub")
+                self.reply("250 8BITMIME")
+            elif verb == "RCPT":
+                address = command.split(":", 1)[1].strip().strip("<>")
+                if address in server.replies:
+                    self.reply(server.replies[address])
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                server.messages.append(recipients)
+                recipients = []
+                delivered += 1
+                self.reply("250 OK")
+                if server.drop_after and delivered >= server.drop_after:
+                    return
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                # HELO, MAIL, RSET, NOOP
+                recipients = [] if verb == "RSET" else recipients
+                self.reply("250 OK")
+
+
+@pytest.fixture
+def smtp_server():
+    server = StubSMTP()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def connection(smtp_server):
+    connection = mailer.SMTPConnection("127.0.0.1", smtp_server.server_address[1],
+                                       sender="nao-responda@tudomais.app")
+    yield connection
+    connection.close()
+
+
+class NoWait:
+    def wait(self):
+        pass
+
+
+TEMPLATE = dict(user_name="Ana", plan_name="monthly", grace_period=3,
+                payment_update_url="https://pagseguro.uol.com.br", app_url="https://tudomais.app")
+
+
+def _queue(app, *addresses):
+    for address in addresses:
+        mailer.queue_email(address, "payment_failed", **TEMPLATE)
+    db.session.commit()
+
+
+def test_queued_email_rolls_back_with_the_transaction(app):
+    mailer.queue_email("ana@teste.com", "payment_failed", **TEMPLATE)
+    db.session.rollback()
+
+    assert EmailOutbox.query.count() == 0
+
+
+def test_batch_reuses_one_connection(app, smtp_server, connection):
+    _queue(app, "a@teste.com", "b@teste.com", "c@teste.com")
+
+    assert mailer.run_pending(connection, NoWait()) == {"sent": 3}
+    assert smtp_server.connections == 1
+    assert smtp_server.messages == [["a@teste.com"], ["b@teste.com"], ["c@teste.com"]]
+    assert {email.status for email in EmailOutbox.query} == {"sent"}
+
+
+def test_reconnects_after_server_disconnect(app, smtp_server, connection):
+    smtp_server.drop_after = 1
+    _queue(app, "a@teste.com", "b@teste.com")
+
+    assert mailer.run_pending(connection, NoWait()) == {"sent": 2}
+    assert smtp_server.connections == 2
+
+
+def test_temporary_failure_goes_back_to_pending_with_backoff(app, smtp_server, connection):
+    smtp_server.replies["cheia@teste.com"] = "452 Mailbox full"
+    _queue(app, "cheia@teste.com")
+
+    started = datetime.utcnow()
+    assert mailer.run_pending(connection, NoWait()) == {"retry": 1}
+    email = EmailOutbox.query.one()
+    assert (email.status, email.attempts) == ("pending", 1)
+    assert "Mailbox full" in email.last_error
+    delay = email.next_attempt_at - started
+    assert mailer.retry_delay(1) <= delay < mailer.retry_delay(1) + timedelta(seconds=5)
+
+    # Segunda tentativa: a espera dobra
+    email.next_attempt_at = datetime.utcnow()
+    db.session.commit()
+    started = datetime.utcnow()
+    mailer.run_pending(connection, NoWait())
+    email = EmailOutbox.query.one()
+    assert email.attempts == 2
+    assert email.next_attempt_at - started >= mailer.retry_delay(2) == 2 * mailer.retry_delay(1)
+
+
+def test_permanent_failure_is_dead(app, smtp_server, connection):
+    smtp_server.replies["nao-existe@teste.com"] = "550 No such user"
+    _queue(app, "nao-existe@teste.com", "ok@teste.com")
+
+    assert mailer.run_pending(connection, NoWait()) == {"dead": 1, "sent": 1}
+    assert EmailOutbox.query.filter_by(to_email="nao-existe@teste.com").one().status == "dead"
+
+
+def test_last_attempt_is_dead(app, smtp_server, connection):
+    smtp_server.replies["cheia@teste.com"] = "452 Mailbox full"
+    _queue(app, "cheia@teste.com")
+    EmailOutbox.query.update({"attempts": mailer.MAX_ATTEMPTS - 1})
+    db.session.commit()
+
+    assert mailer.run_pending(connection, NoWait()) == {"dead": 1}
+    assert EmailOutbox.query.one().status == "dead"
+
+
+def test_rate_limiter_spacing():
+    moments = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        moments[0] += seconds
+
+    limiter = mailer.RateLimiter(30, clock=lambda: moments[0], sleep=sleep)
+    limiter.wait()
+    limiter.wait()
+    moments[0] += 0.5
+    limiter.wait()
+    moments[0] += 10
+    limiter.wait()
+
+    # 30/min = um envio a cada 2 s; depois de uma pausa longa não há espera
+    assert sleeps == [2.0, 1.5]
+
+
+def test_requeue_stale_returns_abandoned_sends(app):
+    _queue(app, "a@teste.com", "b@teste.com")
+    now = datetime.utcnow()
+    stale, fresh = EmailOutbox.query.order_by(EmailOutbox.id).all()
+    stale.status, stale.next_attempt_at = "sending", now - mailer.STALE_AFTER - timedelta(minutes=1)
+    fresh.status, fresh.next_attempt_at = "sending", now
+    db.session.commit()
+
+    assert mailer.requeue_stale(now) == 1
+    assert db.session.get(EmailOutbox, stale.id).status == "pending"
+    assert db.session.get(EmailOutbox, fresh.id).status == "sending"
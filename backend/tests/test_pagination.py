@@ -0,0 +1,32 @@
+"""Paginação por cursor: percorrer as páginas entrega cada linha uma vez, na ordem"""
+
+from models import db, Advertiser
+
+
+def _walk(client, url):
+    ids, cursor = [], None
+    while True:
+        response = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200
+        ids.extend(card["id"] for card in response.get_json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids
+
+
+def test_cursor_walk_with_ties(client, make_advertiser):
+    # Notas repetidas: a ordem só é total por causa do id no fim da chave
+    for n in range(23):
+        make_advertiser(rating_average=float(n % 3), rating_count=n % 2)
+
+    ids = _walk(client, "/advertiser/?sort=rating&limit=5")
+    expected = [row.id for row in db.session.query(Advertiser.id).order_by(
+        Advertiser.rating_average.desc(), Advertiser.rating_count.desc(), Advertiser.id)]
+    assert ids == expected
+
+    assert _walk(client, "/advertiser/?limit=4") == sorted(expected)
+
+
+def test_invalid_cursor(client):
+    response = client.get("/advertiser/?cursor=nao-e-um-cursor")
+    assert response.status_code == 400
@@ -0,0 +1,147 @@
+"""Senhas: limite de tentativas, rehash no login e pool de verificação"""
+
+import threading
+
+import pytest
+
+import passwords
+from app import bcrypt
+from models import db, User, UserType
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def throttle(app, clock):
+    previous = app.extensions["login_throttle"]
+    app.extensions["login_throttle"] = passwords.LoginThrottle(
+        passwords.MemoryThrottleBackend(), window=60, max_per_email=3, max_per_ip=5, clock=clock)
+    yield app.extensions["login_throttle"]
+    app.extensions["login_throttle"] = previous
+
+
+@pytest.fixture
+def user(app):
+    user = User(email="ana@teste.com", name="Ana", user_type=UserType.CONSUMER)
+    user.set_password("segredo123")
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def _login(client, password, email="ana@teste.com"):
+    return client.post("/auth/login", json={"email": email, "password": password})
+
+
+def test_locks_out_after_failures_per_email(client, throttle, clock, user):
+    for _ in range(3):
+        assert _login(client, "errada").status_code == 401
+
+    blocked = _login(client, "segredo123")
+    assert blocked.status_code == 429
+    assert int(blocked.headers["Retry-After"]) == 61
+
+    # A janela desliza: a falha mais antiga sai e o login volta a ser aceito
+    clock.now += 61
+    assert _login(client, "segredo123").status_code == 200
+
+
+def test_success_resets_email_but_not_ip(throttle, clock):
+    for _ in range(2):
+        throttle.failure("Ana@Teste.com ", "10.0.0.1")
+    throttle.success("ana@teste.com", "10.0.0.1")
+    assert throttle.backend.count("email:ana@teste.com", 60, clock()) == 0
+    assert throttle.backend.count("ip:10.0.0.1", 60, clock()) == 2
+
+    # Muitas contas a partir do mesmo IP: o limite do IP vale para todas
+    for n in range(3):
+        throttle.failure(f"conta{n}@teste.com", "10.0.0.1")
+    assert throttle.retry_after("outra@teste.com", "10.0.0.1") > 0
+    assert throttle.retry_after("outra@teste.com", "10.0.0.2") == 0
+
+
+def test_memory_backend_window_and_key_limit():
+    backend = passwords.MemoryThrottleBackend(max_keys=2)
+    backend.add("a", 10, 100.0)
+    backend.add("a", 10, 105.0)
+    assert backend.count("a", 10, 108.0) == 2
+    assert backend.oldest("a", 10, 111.0) == 105.0
+    assert backend.count("a", 10, 116.0) == 0
+
+    backend.add("a", 10, 200.0)
+    backend.add("b", 10, 200.0)
+    backend.add("c", 10, 200.0)
+    # Passando do limite, sai a chave usada há mais tempo
+    assert [backend.count(key, 10, 201.0) for key in ("a", "b", "c")] == [0, 1, 1]
+
+
+def test_login_rehashes_when_cost_changes(app, client, throttle, user):
+    assert user.password_hash.startswith("$2b$04$")
+    assert not passwords.needs_rehash(user.password_hash)
+
+    app.config["BCRYPT_LOG_ROUNDS"] = 5
+    bcrypt.init_app(app)
+    try:
+        assert passwords.needs_rehash(user.password_hash)
+        assert _login(client, "segredo123").status_code == 200
+        rehashed = db.session.get(User, user.id).password_hash
+        assert rehashed.startswith("$2b$05$")
+        assert passwords.verify_password(rehashed, "segredo123")
+
+        # Já no custo novo: o próximo login não regrava
+        assert _login(client, "segredo123").status_code == 200
+        assert db.session.get(User, user.id).password_hash == rehashed
+    finally:
+        app.config["BCRYPT_LOG_ROUNDS"] = 4
+        bcrypt.init_app(app)
+
+
+def test_wrong_password_does_not_rehash(app, client, throttle, user):
+    original = user.password_hash
+    app.config["BCRYPT_LOG_ROUNDS"] = 5
+    try:
+        assert _login(client, "errada").status_code == 401
+    finally:
+        app.config["BCRYPT_LOG_ROUNDS"] = 4
+    assert db.session.get(User, user.id).password_hash == original
+
+
+def test_verifier_limits_concurrent_hashes():
+    verifier = passwords.PasswordVerifier(workers=1, queue_max=1)
+    release = threading.Event()
+    running = []
+
+    def slow_hash():
+        running.append(threading.current_thread().name)
+        release.wait(5)
+        return True
+
+    callers = [threading.Thread(target=verifier.run, args=(slow_hash,)) for _ in range(2)]
+    for caller in callers:
+        caller.start()
+    # Espera as duas vagas ocuparem (uma em execução, outra na fila)
+    while not running or verifier._slots._value:
+        release.wait(0.01)
+
+    # Sem vaga, a terceira é recusada na hora
+    with pytest.raises(passwords.PasswordVerifierBusy):
+        verifier.run(slow_hash)
+    assert len(running) == 1
+
+    release.set()
+    for caller in callers:
+        caller.join(5)
+    assert len(running) == 2
+    assert verifier.run(lambda: "livre") == "livre"
+    verifier.executor.shutdown()
@@ -0,0 +1,86 @@
+"""QR Codes: cache em memória/disco, formatos crus e revalidação por ETag"""
+
+import base64
+
+import pytest
+
+import qr_codes
+
+URL = "https://exemplo.com/anunciante/42"
+
+
+@pytest.fixture
+def qr_cache(app, tmp_path, monkeypatch):
+    """Cache novo por teste, com o disco numa pasta temporária"""
+    cache = qr_codes.QRCache(str(tmp_path / "qr"), max_entries=2)
+    monkeypatch.setitem(app.extensions, "qr_cache", cache)
+    return cache
+
+
+def test_cache_renders_once_per_key(qr_cache, monkeypatch):
+    calls = []
+    render = qr_codes.render
+    monkeypatch.setattr(qr_codes, "render", lambda *args: calls.append(args) or render(*args))
+
+    key, first = qr_cache.get(URL)
+    assert qr_cache.get(URL) == (key, first)
+    assert len(calls) == 1
+    assert qr_cache.stats()["hits"] == 1
+
+    # Outro worker (memória vazia) lê do disco
+    other = qr_codes.QRCache(qr_cache.folder)
+    assert other.get(URL) == (key, first)
+    assert (other.disk_hits, len(calls)) == (1, 1)
+
+
+def test_memory_is_bounded_lru(qr_cache):
+    for size in (1, 2, 3):
+        qr_cache.get(URL, size=size)
+    assert qr_cache.stats()["entries"] == 2
+    qr_cache.get(URL, size=1)
+    # O mais antigo saiu da memória mas continua no disco
+    assert (qr_cache.misses, qr_cache.disk_hits) == (3, 1)
+
+
+def test_key_depends_on_every_parameter():
+    keys = {qr_codes.cache_key(URL), qr_codes.cache_key(URL, size=5), qr_codes.cache_key(URL, ec="H"),
+            qr_codes.cache_key(URL, fmt="svg"), qr_codes.cache_key(URL + "/")}
+    assert len(keys) == 5
+
+
+def test_raw_formats_and_etag(client, qr_cache):
+    png = client.get(f"/api/qr-code?format=png&url={URL}")
+    assert png.status_code == 200
+    assert png.mimetype == "image/png"
+    assert png.data.startswith(b"\x89PNG")
+    assert png.cache_control.public and png.cache_control.max_age == 86400
+    assert png.get_etag()[0] == qr_codes.cache_key(URL)
+
+    svg = client.get(f"/api/qr-code?format=svg&size=5&ec=h&url={URL}")
+    assert svg.mimetype == "image/svg+xml"
+    assert b"<svg" in svg.data
+    assert svg.get_etag()[0] == qr_codes.cache_key(URL, 5, "H", "svg")
+
+    misses = qr_cache.misses
+    revalidated = client.get(f"/api/qr-code?format=png&url={URL}", headers={"If-None-Match": png.headers["ETag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b""
+    assert qr_cache.misses == misses
+
+
+def test_json_response_keeps_old_shape(client, qr_cache):
+    response = client.get(f"/api/qr-code?url={URL}")
+    payload = response.get_json()
+    assert payload["url"] == URL
+    assert "content" in payload
+    assert base64.b64decode(payload["qr_code"].split(",", 1)[1]) == qr_cache.get(URL)[1]
+    # ETag próprio: um 304 do JSON nunca é confundido com o PNG cru
+    assert response.get_etag()[0] == qr_codes.cache_key(URL) + "-json"
+
+
+@pytest.mark.parametrize("query", ["size=0", "size=21", "ec=X", "format=gif", "url=" + "a" * 3000])
+def test_invalid_parameters(client, qr_cache, query):
+    response = client.get(f"/api/qr-code?{query}")
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+    assert qr_cache.stats()["misses"] == 0
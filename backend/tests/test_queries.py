@@ -0,0 +1,46 @@
+"""Listagens de anunciantes: número fixo de SELECTs com 1 ou N linhas (ver queries.py)"""
+
+import pytest
+from models import db, Favorite, Item
+
+
+def _populate(make_advertiser, consumer, n):
+    for i in range(n):
+        advertiser = make_advertiser(description=f"Descrição da loja {i}")
+        db.session.add_all([Item(advertiser_id=advertiser.id, title=f"Item {j}") for j in range(4)])
+        db.session.add(Favorite(user_id=consumer.id, advertiser_id=advertiser.id))
+    db.session.commit()
+
+
+def _selects(client, count_selects, url, headers=None):
+    db.session.expire_all()
+    with count_selects() as counter:
+        response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    return counter.count, response.get_json()
+
+
+@pytest.mark.parametrize("url", ["/advertiser/", "/advertiser/?query=loja", "/advertiser/top10"])
+def test_public_lists_constant_queries(client, count_selects, make_advertiser, make_consumer, url):
+    consumer = make_consumer()
+    _populate(make_advertiser, consumer, 1)
+    single, rows = _selects(client, count_selects, url)
+    assert len(rows) == 1
+
+    _populate(make_advertiser, consumer, 9)
+    many, rows = _selects(client, count_selects, url)
+    assert len(rows) == 10
+    assert many == single
+
+
+def test_favorites_constant_queries(client, count_selects, make_advertiser, make_consumer, auth_headers):
+    consumer = make_consumer()
+    url = f"/user/{consumer.id}/favorites"
+    _populate(make_advertiser, consumer, 1)
+    single, rows = _selects(client, count_selects, url, auth_headers(consumer))
+    assert len(rows) == 1
+
+    _populate(make_advertiser, consumer, 9)
+    many, rows = _selects(client, count_selects, url, auth_headers(consumer))
+    assert len(rows) == 10
+    assert many == single
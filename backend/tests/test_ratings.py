@@ -0,0 +1,83 @@
+"""Agregados de avaliação no anunciante: soma, contagem, média e histograma"""
+
+import pytest
+
+from models import db, Advertiser, Review, SubscriptionPlan
+
+COLUMNS = ("rating_sum", "rating_count", "rating_average", "rating_1", "rating_2", "rating_3", "rating_4",
+           "rating_5")
+
+
+def _aggregates(advertiser_id):
+    db.session.expire_all()
+    advertiser = db.session.get(Advertiser, advertiser_id)
+    return {column: getattr(advertiser, column) for column in COLUMNS}
+
+
+@pytest.fixture
+def reviewable(make_advertiser):
+    return make_advertiser(subscription_plan=SubscriptionPlan.ANNUAL).id
+
+
+@pytest.fixture
+def consumers(make_consumer, auth_headers):
+    """(id, cabeçalhos) de três consumidores"""
+    return [(user.id, auth_headers(user)) for user in (make_consumer() for _ in range(3))]
+
+
+def _review(client, consumer, advertiser_id, rating):
+    user_id, headers = consumer
+    return client.post(f"/user/{user_id}/reviews", json={"advertiser_id": advertiser_id, "rating": rating},
+                       headers=headers)
+
+
+def test_routes_keep_aggregates_in_step(client, reviewable, consumers):
+    for consumer, rating in zip(consumers, (5, 4, 2)):
+        assert _review(client, consumer, reviewable, rating).status_code == 201
+    assert _aggregates(reviewable) == {"rating_sum": 11, "rating_count": 3, "rating_average": pytest.approx(11 / 3),
+                                       "rating_1": 0, "rating_2": 1, "rating_3": 0, "rating_4": 1, "rating_5": 1}
+
+    (user_id, headers), (other_id, other_headers) = consumers[2], consumers[0]
+    review_id = Review.query.filter_by(user_id=user_id).one().id
+    assert client.put(f"/user/{user_id}/reviews/{review_id}", json={"rating": 5}, headers=headers).status_code == 200
+    other_review = Review.query.filter_by(user_id=other_id).one().id
+    assert client.delete(f"/user/{other_id}/reviews/{other_review}", headers=other_headers).status_code == 200
+
+    expected = {"rating_sum": 9, "rating_count": 2, "rating_average": pytest.approx(4.5),
+                "rating_1": 0, "rating_2": 0, "rating_3": 0, "rating_4": 1, "rating_5": 1}
+    assert _aggregates(reviewable) == expected
+    # A recontagem completa chega aos mesmos números
+    Advertiser.recompute_ratings()
+    db.session.commit()
+    assert _aggregates(reviewable) == expected
+
+
+@pytest.mark.parametrize("rating", [0, 6, "3.5", True, None])
+def test_invalid_ratings_are_rejected(client, reviewable, consumers, rating):
+    assert _review(client, consumers[0], reviewable, rating).status_code == 400
+    assert _aggregates(reviewable)["rating_count"] == 0
+
+
+def test_ratings_repair_fixes_drift(app, make_advertiser, make_consumer, reviewable):
+    db.session.add_all([Review(user_id=make_consumer().id, advertiser_id=reviewable, rating=rating)
+                        for rating in (3, 4)])
+    never_reviewed = make_advertiser(rating_sum=10, rating_count=2, rating_average=5, rating_5=2).id
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["ratings-repair"])
+    assert "1 anunciantes" in result.output
+    assert _aggregates(reviewable)["rating_average"] == pytest.approx(3.5)
+    assert set(_aggregates(never_reviewed).values()) == {0}
+
+
+def test_search_filters_and_sorts_by_stored_average(client, make_advertiser, count_selects):
+    low = make_advertiser(rating_average=2.0, rating_count=4).id
+    high = make_advertiser(rating_average=4.5, rating_count=2).id
+    tied = make_advertiser(rating_average=4.5, rating_count=9).id
+
+    with count_selects() as counter:
+        response = client.get("/advertiser/?min_rating=4&sort=rating")
+    assert [card["id"] for card in response.get_json()] == [tied, high]
+    assert low not in {card["id"] for card in client.get("/advertiser/?min_rating=3").get_json()}
+    # Sem tocar a tabela de avaliações
+    assert counter.count == 1
@@ -0,0 +1,77 @@
+"""Visibilidade por escopo (AdScope) a partir da cidade do consumidor"""
+
+import pytest
+
+import regions
+from models import db, State, City, AdScope
+
+
+@pytest.fixture
+def cities(geo):
+    """Recife e Olinda na mesma região, Caruaru em outra; João Pessoa (PB, vizinho) e São Paulo (SP)"""
+    regions.reset_index()
+    pernambuco = geo["city"].state_id
+    paraiba, sao_paulo = State(name="Paraíba", code="PB"), State(name="São Paulo", code="SP")
+    db.session.add_all([paraiba, sao_paulo])
+    db.session.flush()
+    created = {"recife": geo["city"]}
+    for key, name, state_id in (("olinda", "Olinda", pernambuco), ("caruaru", "Caruaru", pernambuco),
+                                ("joao_pessoa", "João Pessoa", paraiba.id), ("sao_paulo", "São Paulo", sao_paulo.id)):
+        created[key] = City(name=name, state_id=state_id)
+        db.session.add(created[key])
+    db.session.commit()
+
+    updated, missing = regions.import_regions([
+        {"uf": "pe", "municipio": "RECIFE", "regiao": "260001"},
+        {"uf": "PE", "municipio": " olinda ", "regiao": "260001"},
+        {"uf": "PE", "municipio": "Caruaru", "regiao": "260002"},
+        {"uf": "PE", "municipio": "Petrolina", "regiao": "260003"},
+    ])
+    db.session.commit()
+    assert (updated, missing) == (3, ["Petrolina/PE"])
+    yield {key: city.id for key, city in created.items()}
+    regions.reset_index()
+
+
+def _visible(client, city_id):
+    return {card["business_name"] for card in client.get(f"/advertiser/?city_id={city_id}").get_json()}
+
+
+def test_state_neighbors_are_symmetric():
+    neighbors = regions.load_state_neighbors()
+    assert {"AL", "BA", "CE", "PB", "PI"} <= neighbors["PE"]
+    assert all(state in neighbors[other] for state, others in neighbors.items() for other in others)
+    assert "SP" not in neighbors["PE"]
+
+
+def test_visibility_by_scope(client, make_advertiser, cities):
+    olinda = cities["olinda"]
+    make_advertiser(business_name="Cidade", city_id=olinda, ad_scope=AdScope.CITY)
+    make_advertiser(business_name="Região", city_id=olinda, ad_scope=AdScope.CITY_REGION)
+    make_advertiser(business_name="Estados", city_id=olinda, ad_scope=AdScope.CITY_REGION_OTHER_STATES)
+    make_advertiser(business_name="Inativo", city_id=olinda, ad_scope=AdScope.CITY_REGION_OTHER_STATES,
+                    is_active=False)
+
+    assert _visible(client, olinda) == {"Cidade", "Região", "Estados"}
+    assert _visible(client, cities["recife"]) == {"Região", "Estados"}
+    # Outra região do mesmo estado e estado vizinho: só o escopo mais amplo
+    assert _visible(client, cities["caruaru"]) == {"Estados"}
+    assert _visible(client, cities["joao_pessoa"]) == {"Estados"}
+    assert _visible(client, cities["sao_paulo"]) == set()
+
+
+def test_city_without_region_uses_its_state(cities):
+    index = regions.get_index()
+    assert set(index.cities_in_region(cities["recife"])) == {cities["recife"], cities["olinda"]}
+    # João Pessoa não tem região importada: a "região" é o estado todo
+    assert index.cities_in_region(cities["joao_pessoa"]) == (cities["joao_pessoa"],)
+    wide = set(index.cities_in_wide_region(cities["joao_pessoa"]))
+    assert {cities["recife"], cities["caruaru"], cities["joao_pessoa"]} <= wide
+    assert cities["sao_paulo"] not in wide
+
+
+def test_index_is_rebuilt_after_reset(cities):
+    before = regions.get_index()
+    assert regions.get_index() is before
+    regions.reset_index()
+    assert regions.get_index() is not before
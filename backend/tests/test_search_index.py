@@ -0,0 +1,86 @@
+"""Índice de busca: normalização, sincronização pelo after_flush e ranking"""
+
+import pytest
+from sqlalchemy import select
+
+from models import db, Item
+from search_index import strip_accents, tokenize, stem, normalize_field, match_advertisers
+
+
+def _search(query):
+    """Ids na ordem do ranking (maior score primeiro)"""
+    match = match_advertisers(db.session.connection(), query)
+    if match is None:
+        return []
+    rows = db.session.execute(select(match.c.advertiser_id).order_by(match.c.score.desc(), match.c.advertiser_id))
+    return [row.advertiser_id for row in rows]
+
+
+def test_normalization_strips_accents_case_and_stopwords():
+    assert strip_accents("Açaí do Pará") == "Acai do Para"
+    assert tokenize("Pão de Açúcar e CAFÉ") == ["pao", "acucar", "cafe"]
+    assert tokenize("de a", drop_stopwords=False) == ["de", "a"]
+    assert normalize_field("Pizzas") == "pizzas pizzo"
+
+
+@pytest.mark.parametrize("plural, singular", [
+    ("pizzas", "pizza"), ("paes", "pao"), ("hamburgueres", "hamburguer"),
+    ("padarias", "padaria"), ("mecanicos", "mecanica"), ("cafezinho", "cafe"),
+])
+def test_stemmer_conflates_inflections(plural, singular):
+    assert stem(plural) == stem(singular)
+
+
+def test_stemmer_keeps_short_words_and_numbers():
+    assert stem("pao") == "pao"
+    assert stem("2024") == "2024"
+
+
+def test_index_follows_inserts_updates_and_deletes(make_advertiser, geo):
+    advertiser = make_advertiser(business_name="Pizzaria Bella", description="Forno a lenha")
+    assert _search("pizzaria") == [advertiser.id]
+    assert _search("lenha") == [advertiser.id]
+
+    advertiser.business_name = "Cantina Roma"
+    db.session.commit()
+    assert _search("pizzaria") == []
+    assert _search("cantina") == [advertiser.id]
+
+    item = Item(advertiser_id=advertiser.id, title="Lasanha à bolonhesa")
+    db.session.add(item)
+    db.session.commit()
+    assert _search("lasanhas") == [advertiser.id]
+
+    db.session.delete(item)
+    db.session.commit()
+    assert _search("lasanha") == []
+
+    geo["category"].name = "Restaurantes"
+    db.session.commit()
+    assert _search("restaurante") == [advertiser.id]
+
+    db.session.delete(advertiser)
+    db.session.commit()
+    assert _search("cantina") == []
+
+
+def test_accent_and_prefix_matching(make_advertiser):
+    advertiser = make_advertiser(business_name="Oficina do Zé", description="Serviços de mecânica em geral")
+
+    # Sem acento, no plural e pela metade do que está sendo digitado
+    assert _search("mecanicos") == [advertiser.id]
+    assert _search("servico") == [advertiser.id]
+    assert _search("ofic") == [advertiser.id]
+    assert _search("de") == []
+
+
+def test_ranking_weights_name_over_description(make_advertiser):
+    in_description = make_advertiser(business_name="Mercadinho Central", description="Temos pizza congelada")
+    in_items = make_advertiser(business_name="Lanches do Bairro")
+    db.session.add(Item(advertiser_id=in_items.id, title="Pizza brotinho"))
+    db.session.commit()
+    in_name = make_advertiser(business_name="Pizza Express", description="Entrega rápida")
+
+    assert _search("pizza") == [in_name.id, in_items.id, in_description.id]
+    # Todos os termos precisam casar
+    assert _search("pizza congelada") == [in_description.id]
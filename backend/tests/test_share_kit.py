@@ -0,0 +1,39 @@
+"""Kit de divulgação: pool reaproveitado entre exportações e kits pequenos sem pool"""
+
+import csv
+import io
+import zipfile
+
+import share_kit
+
+
+def _rows(count):
+    return [{"id": n, "business_name": f"Loja {n}", "phone": "81999999999", "website": None,
+             "description": "Pizzaria", "city_name": "Recife", "state_name": "Pernambuco"}
+            for n in range(1, count + 1)]
+
+
+def _ids(rows, workers):
+    data = b"".join(share_kit.stream_archive(rows, "https://tudomais.app", "svg", workers=workers))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        rows = list(csv.reader(io.StringIO(archive.read("links.csv").decode())))
+    return [int(row[0]) for row in rows[1:]]
+
+
+def test_pool_is_reused_across_exports(monkeypatch):
+    monkeypatch.setattr(share_kit, "_pool", None)
+    rows = _rows(share_kit.INLINE_MAX * 3)
+
+    assert _ids(rows, workers=2) == [row["id"] for row in rows]
+    pool = share_kit._pool
+    assert pool is not None
+    assert _ids(rows, workers=2) == [row["id"] for row in rows]
+    assert share_kit._pool is pool
+
+
+def test_small_kit_renders_inline(monkeypatch):
+    monkeypatch.setattr(share_kit, "_pool", None)
+    rows = _rows(share_kit.INLINE_MAX - 1)
+
+    assert _ids(rows, workers=2) == [row["id"] for row in rows]
+    assert share_kit._pool is None
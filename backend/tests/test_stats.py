@@ -0,0 +1,74 @@
+"""Contadores do painel: o que as rotas somam com bump() bate com a recontagem"""
+
+from datetime import datetime
+
+import pytest
+
+import stats
+from models import db, User, UserType, Advertiser, Report
+
+
+@pytest.fixture
+def admin_headers(app, auth_headers):
+    admin = User(email="admin@teste.com", name="Admin", user_type=UserType.ADMIN, password_hash="x")
+    db.session.add(admin)
+    db.session.commit()
+    return auth_headers(admin)
+
+
+def _assert_counters_match():
+    db.session.expire_all()
+    day = datetime.utcnow().date()
+    counters = {name: getattr(db.session.get(stats.DailyStats, day), name) for name in stats.TOTALS + stats.DAILY}
+    assert counters == stats.compute(day)
+
+
+def _register(client, geo, n):
+    response = client.post("/auth/register", json={
+        "email": f"loja{n}@teste.com", "password": "segredo123", "name": f"Loja {n}",
+        "birth_date": "1990-01-01", "cpf": f"{n:011d}", "business_name": f"Loja {n}", "phone": "81999999999",
+        "category_id": geo["category"].id, "city_id": geo["city"].id})
+    assert response.status_code == 201, response.get_json()
+    return Advertiser.query.filter_by(cpf=f"{n:011d}").one()
+
+
+def test_route_bumps_match_recount(client, geo, make_advertiser, auth_headers, admin_headers):
+    # Um anunciante de ontem: entra nos totais, não no movimento do dia
+    old = make_advertiser(created_at=datetime(2020, 1, 1), subscription_start=datetime(2020, 1, 1))
+    old_id, old_headers = old.id, auth_headers(old.user)
+    reported_id = make_advertiser().id
+    stats.today()
+    _assert_counters_match()
+
+    advertiser = _register(client, geo, 500)
+    advertiser_id, headers = advertiser.id, auth_headers(advertiser.user)
+    assert client.post("/user/register", json={"email": "ana@teste.com", "password": "segredo123",
+                                                "name": "Ana"}).status_code == 201
+    _assert_counters_match()
+
+    for path, plan in (("subscribe", "monthly"), ("cancel_subscription", None),
+                       ("cancel_subscription", None), ("subscribe", "annual")):
+        for target, target_headers in ((advertiser_id, headers), (old_id, old_headers)):
+            response = client.post(f"/advertiser/{target}/{path}", json={"plan": plan} if plan else None,
+                                   headers=target_headers)
+            assert response.status_code == 200, response.get_json()
+            _assert_counters_match()
+
+    for _ in range(2):
+        response = client.put(f"/admin/advertisers/{advertiser_id}/toggle_active", headers=admin_headers)
+        assert response.status_code == 200
+        _assert_counters_match()
+
+    reporter = User.query.filter_by(email="ana@teste.com").one()
+    report = Report(advertiser_id=reported_id, reporter_id=reporter.id, reason="Golpe")
+    db.session.add(report)
+    db.session.commit()
+    stats.run_rollup()
+    for _ in range(2):
+        assert client.put(f"/admin/reports/{report.id}/resolve", headers=admin_headers).status_code == 200
+        _assert_counters_match()
+
+    assert client.delete(f"/advertiser/{advertiser_id}", headers=headers).status_code == 200
+    _assert_counters_match()
+    assert client.delete(f"/admin/advertisers/{old_id}/delete", headers=admin_headers).status_code == 200
+    _assert_counters_match()
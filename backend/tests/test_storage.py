@@ -0,0 +1,98 @@
+"""Armazenamento por conteúdo: caminhos fatiados, contagem de referências e GC"""
+
+import hashlib
+import io
+import os
+import time
+from datetime import timedelta
+
+from PIL import Image
+
+import images
+import storage
+from models import db, ImageJob, Item
+
+OLD = time.time() - 3 * 24 * 3600
+
+
+def _store(folder, content, mtime=OLD):
+    """Grava as variantes de um blob (conteúdo fictício) e devolve o hash"""
+    source_hash = hashlib.sha256(content).hexdigest()
+    for name in storage.blob_files(source_hash):
+        path = folder / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        os.utime(path, (mtime, mtime))
+    return source_hash
+
+
+def _url(source_hash, variant="full"):
+    return f"{storage.URL_PREFIX}{storage.blob_base(source_hash)}_{variant}.jpg"
+
+
+def test_blob_paths_are_sharded_by_hash():
+    source_hash = hashlib.sha256(b"logo").hexdigest()
+    assert storage.blob_base(source_hash) == f"{source_hash[:2]}/{source_hash[2:4]}/{source_hash}"
+    assert len(storage.blob_files(source_hash)) == len(images.VARIANTS) * len(images.FORMATS)
+    assert storage.hash_from_url(_url(source_hash, "thumbnail")) == source_hash
+    assert storage.hash_from_url("/uploads/20240101_logo.png") is None
+    assert storage.hash_from_url("https://exemplo.com/logo.jpg") is None
+
+
+def test_identical_uploads_share_one_blob(app, uploads):
+    buffer = io.BytesIO()
+    Image.new("RGB", (400, 300), (200, 30, 30)).save(buffer, "PNG")
+    source = uploads.parent / "original.png"
+    source.write_bytes(buffer.getvalue())
+    source_hash = hashlib.sha256(buffer.getvalue()).hexdigest()
+
+    first = images.process_file(str(source), str(uploads), storage.blob_base(source_hash))
+    second = images.process_file(str(source), str(uploads), storage.blob_base(source_hash))
+    assert first == second
+    assert storage.has_blob(source_hash)
+    assert list(storage.stored_blobs()) == [source_hash]
+    assert len(storage.stored_blobs()[source_hash]) == len(storage.blob_files(source_hash))
+
+
+def test_reference_counts(app, uploads, make_advertiser):
+    shared, alone = _store(uploads, b"compartilhado"), _store(uploads, b"sozinho")
+    advertiser = make_advertiser(logo=_url(shared))
+    db.session.add_all([Item(advertiser_id=advertiser.id, title="Pizza", image=_url(shared, "card")),
+                        Item(advertiser_id=advertiser.id, title="Suco", image=_url(alone)),
+                        Item(advertiser_id=advertiser.id, title="Antigo", image="/uploads/20240101_suco.png")])
+    db.session.commit()
+
+    assert storage.reference_counts() == {shared: 2, alone: 1}
+
+
+def test_gc_removes_only_old_unreferenced_blobs(app, uploads, make_advertiser, make_consumer):
+    referenced, orphan = _store(uploads, b"em uso"), _store(uploads, b"sem dono")
+    recent = _store(uploads, b"recem enviado", mtime=time.time())
+    pending = _store(uploads, b"na fila")
+    make_advertiser(logo=_url(referenced))
+    user_id = make_consumer().id
+    db.session.add_all([
+        ImageJob(id="a" * 32, user_id=user_id, source_hash=pending, base_name=storage.blob_base(pending),
+                 status="queued"),
+        ImageJob(id="b" * 32, user_id=user_id, source_hash=orphan, base_name=storage.blob_base(orphan),
+                 status="done", result="{}"),
+    ])
+    db.session.commit()
+
+    removed, freed = storage.collect_garbage(dry_run=True)
+    assert removed == [orphan]
+    assert storage.has_blob(orphan)
+
+    removed, freed = storage.collect_garbage(grace_period=timedelta(hours=24))
+    assert removed == [orphan]
+    assert freed == len(b"sem dono") * len(storage.blob_files(orphan))
+    assert set(storage.stored_blobs()) == {referenced, recent, pending}
+    # O job concluído do arquivo removido não pode mais ser reaproveitado
+    assert db.session.get(ImageJob, "b" * 32) is None
+    assert db.session.get(ImageJob, "a" * 32) is not None
+
+
+def test_gc_command(app, uploads):
+    _store(uploads, b"sem dono")
+    result = app.test_cli_runner().invoke(args=["uploads-gc", "--dry-run"])
+    assert "1 imagens seriam removidas" in result.output
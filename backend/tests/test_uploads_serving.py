@@ -0,0 +1,80 @@
+"""GET /advertiser/uploads/<arquivo>: modos de entrega, Range, validadores e cache"""
+
+import hashlib
+
+import pytest
+
+import storage
+
+CONTENT = bytes(range(256)) * 8
+SOURCE_HASH = hashlib.sha256(b"logo").hexdigest()
+HASHED = f"{storage.blob_base(SOURCE_HASH)}_card.jpg"
+LEGACY = "20240101_logo.png"
+
+
+@pytest.fixture
+def files(uploads):
+    for name in (HASHED, LEGACY):
+        path = uploads / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(CONTENT)
+    return uploads
+
+
+def _get(client, name, **kwargs):
+    return client.get(f"/advertiser/uploads/{name}", **kwargs)
+
+
+def test_hashed_urls_are_immutable(client, files):
+    response = _get(client, HASHED)
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert response.mimetype == "image/jpeg"
+    assert response.cache_control.immutable
+    assert response.cache_control.public
+    assert response.cache_control.max_age == storage.IMMUTABLE_MAX_AGE
+    assert response.headers["Accept-Ranges"] == "bytes"
+
+    legacy = _get(client, LEGACY)
+    assert legacy.cache_control.max_age == storage.LEGACY_MAX_AGE
+    assert not legacy.cache_control.immutable
+
+
+def test_range_and_conditional_requests(client, files):
+    partial = _get(client, HASHED, headers={"Range": "bytes=100-199"})
+    assert partial.status_code == 206
+    assert partial.data == CONTENT[100:200]
+    assert partial.headers["Content-Range"] == f"bytes 100-199/{len(CONTENT)}"
+
+    etag = _get(client, HASHED).headers["ETag"]
+    assert _get(client, HASHED, headers={"If-None-Match": etag}).status_code == 304
+
+
+@pytest.mark.parametrize("name", ["nao-existe.jpg", "../app.py", "..%2Fapp.py", "ab/../../app.py"])
+def test_missing_and_escaping_paths_are_404(client, files, name):
+    assert _get(client, name).status_code == 404
+
+
+def test_x_sendfile_leaves_body_to_the_server(app, client, files, monkeypatch):
+    monkeypatch.setitem(app.config, "UPLOAD_SERVE_MODE", "x-sendfile")
+    response = _get(client, HASHED)
+    assert response.status_code == 200
+    assert response.headers["X-Sendfile"] == str(files / HASHED)
+    assert response.data == b""
+    assert response.cache_control.immutable
+
+
+def test_x_accel_redirects_to_internal_location(app, client, files, monkeypatch):
+    monkeypatch.setitem(app.config, "UPLOAD_SERVE_MODE", "x-accel")
+    monkeypatch.setitem(app.config, "UPLOAD_ACCEL_PREFIX", "/interno/")
+    response = _get(client, HASHED)
+    assert response.headers["X-Accel-Redirect"] == f"/interno/{HASHED}"
+    assert response.mimetype == "image/jpeg"
+    assert response.data == b""
+    assert response.cache_control.max_age == storage.IMMUTABLE_MAX_AGE
+
+    legacy = _get(client, LEGACY)
+    assert legacy.headers["X-Accel-Redirect"] == f"/interno/{LEGACY}"
+    assert legacy.cache_control.max_age == storage.LEGACY_MAX_AGE
+    # Arquivo inexistente não chega ao nginx
+    assert _get(client, "nao-existe.jpg").status_code == 404
@@ -0,0 +1,97 @@
+"""Replay de webhooks pela rota e pelo worker, aplicados com o PagSeguroWebhookHandler real"""
+
+import hashlib
+import hmac
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import webhook_inbox
+from models import db, Advertiser, WebhookEvent, SubscriptionPlan
+
+TOKEN = "token-de-teste"
+
+
+@pytest.fixture
+def deliver(app, client):
+    app.config["PAGSEGURO_WEBHOOK_TOKEN"] = TOKEN
+
+    def send(**data):
+        body = json.dumps(data)
+        signature = hmac.new(TOKEN.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).hexdigest()
+        response = client.post("/webhook/pagseguro", data=body, content_type="application/json",
+                               headers={webhook_inbox.SIGNATURE_HEADER: signature})
+        assert response.status_code == 200
+        return response.get_json()
+    return send
+
+
+def _advertiser(make_advertiser, **fields):
+    advertiser = make_advertiser(**fields)
+    return advertiser.id, advertiser.user.email
+
+
+def test_payment_approved_applies_to_advertiser(deliver, make_advertiser):
+    advertiser_id, email = _advertiser(make_advertiser, subscription_status="payment_pending",
+                                       subscription_end=datetime.utcnow() - timedelta(days=1),
+                                       grace_period_end=datetime.utcnow() + timedelta(days=2))
+    deliver(id="evt-1", eventType="PAYMENT_APPROVED", referenceId=email, amount=59.9,
+            planInfo={"planType": "annual", "planName": "Anual"})
+
+    assert webhook_inbox.run_pending() == {"done": 1}
+    advertiser = db.session.get(Advertiser, advertiser_id)
+    assert advertiser.subscription_status == "active"
+    assert advertiser.subscription_plan == SubscriptionPlan.ANNUAL
+    assert advertiser.subscription_end > datetime.utcnow() + timedelta(days=360)
+    assert advertiser.grace_period_end is None
+
+
+def test_duplicate_event_is_stored_and_applied_once(deliver, make_advertiser):
+    advertiser_id, email = _advertiser(make_advertiser)
+    first = deliver(id="evt-1", eventType="PAYMENT_CANCELLED", referenceId=email)
+    again = deliver(id="evt-1", eventType="PAYMENT_CANCELLED", referenceId=email)
+
+    assert (first["duplicate"], again["duplicate"]) == (False, True)
+    assert WebhookEvent.query.count() == 1
+    assert webhook_inbox.run_pending() == {"done": 1}
+    assert db.session.get(Advertiser, advertiser_id).subscription_status == "payment_pending"
+
+
+def test_out_of_order_delivery_keeps_newest_state(deliver, make_advertiser):
+    advertiser_id, email = _advertiser(make_advertiser)
+    now = datetime.utcnow()
+    # A falha chega depois da aprovação que a resolveu
+    deliver(id="evt-2", eventType="PAYMENT_APPROVED", referenceId=email,
+            date=now.isoformat(), planInfo={"planType": "monthly"})
+    deliver(id="evt-1", eventType="PAYMENT_CANCELLED", referenceId=email,
+            date=(now - timedelta(hours=1)).isoformat())
+
+    assert webhook_inbox.run_pending() == {"done": 2}
+    deliver(id="evt-0", eventType="SUBSCRIPTION_SUSPENDED", referenceId=email,
+            date=(now - timedelta(hours=2)).isoformat())
+    assert webhook_inbox.run_pending() == {"superseded": 1}
+
+    advertiser = db.session.get(Advertiser, advertiser_id)
+    assert advertiser.subscription_status == "active"
+    assert advertiser.is_active is True
+    assert [event.status for event in WebhookEvent.query.order_by(WebhookEvent.occurred_at)] == \
+        ["superseded", "done", "done"]
+
+
+def test_unknown_reference_is_retried_not_applied(deliver, make_advertiser):
+    deliver(id="evt-1", eventType="PAYMENT_APPROVED", referenceId="ninguem@teste.com")
+
+    assert webhook_inbox.run_pending() == {"retry": 1}
+    event = WebhookEvent.query.one()
+    assert (event.status, event.last_error) == ("pending", "Anunciante não encontrado")
+
+
+def test_renewal_moves_subscription_end_forward(deliver, make_advertiser):
+    current_end = datetime.utcnow() + timedelta(days=10)
+    advertiser_id, email = _advertiser(make_advertiser, subscription_end=current_end)
+    deliver(id="evt-1", eventType="PAYMENT_APPROVED", referenceId=email, planInfo={"planType": "monthly"})
+
+    assert webhook_inbox.run_pending() == {"done": 1}
+    # Renovação antecipada: os dias que faltavam não se perdem
+    assert db.session.get(Advertiser, advertiser_id).subscription_end == current_end + timedelta(days=30)
@@ -7,10 +7,12 @@ from datetime import datetime, timedelta
 import hashlib
 import hmac
 import json
-from models import db, Advertiser, SubscriptionPlan
+from models import db, User, Advertiser, SubscriptionPlan
+from cache import invalidate_advertiser
+from mailer import queue_email
 from pagseguro_config import (
     WEBHOOK_CONFIG, SUBSCRIPTION_STATUS, AUTOMATION_CONFIG,
-    get_automated_message, get_plan_max_items
+    get_plan_max_items
 )
 
 class PagSeguroWebhookHandler:
@@ -36,8 +38,9 @@ class PagSeguroWebhookHandler:
             if not event_type or not reference_id:
                 return {"error": "Dados incompletos no webhook"}, 400
             
-            # Buscar o anunciante pelo email (reference_id)
-            advertiser = Advertiser.query.filter_by(email=reference_id).first()
+            # Buscar o anunciante pelo email do usuário dono (reference_id)
+            advertiser = (Advertiser.query.join(User, User.id == Advertiser.user_id)
+                          .filter(User.email == reference_id).first())
             if not advertiser:
                 return {"error": "Anunciante não encontrado"}, 404
             
@@ -66,6 +69,14 @@ class PagSeguroWebhookHandler:
         except Exception as e:
             return {"error": f"Erro ao processar webhook: {str(e)}"}, 500
     
+    @staticmethod
+    def next_billing_date(advertiser, plan_type):
+        """Próximo vencimento: o período do plano a partir do vencimento atual, ou de agora se já venceu"""
+        days = {'semiannual': 180, 'biannual': 180, 'annual': 365}.get(plan_type, 30)
+        now = datetime.utcnow()
+        start = max(advertiser.subscription_end or now, now)
+        return start + timedelta(days=days)
+
     @staticmethod
     def handle_payment_approved(advertiser, webhook_data):
         """Processa pagamento aprovado - ATIVA a assinatura"""
@@ -78,33 +89,23 @@ class PagSeguroWebhookHandler:
             # Mapear tipo de plano
             plan_mapping = {
                 'monthly': SubscriptionPlan.MONTHLY,
-                'semiannual': SubscriptionPlan.SEMIANNUAL,
+                'semiannual': SubscriptionPlan.BIANNUAL,  # O enum chama o semestral de biannual
                 'annual': SubscriptionPlan.ANNUAL
             }
             
             subscription_plan = plan_mapping.get(plan_type, SubscriptionPlan.MONTHLY)
             
-            # Calcular data de vencimento
-            if plan_type == 'monthly':
-                next_billing = datetime.utcnow() + timedelta(days=30)
-            elif plan_type == 'semiannual':
-                next_billing = datetime.utcnow() + timedelta(days=180)
-            elif plan_type == 'annual':
-                next_billing = datetime.utcnow() + timedelta(days=365)
-            else:
-                next_billing = datetime.utcnow() + timedelta(days=30)
+            # Calcular data de vencimento (renovação antecipada soma ao vencimento atual)
+            next_billing = PagSeguroWebhookHandler.next_billing_date(advertiser, plan_type)
             
             # Atualizar dados do anunciante
             advertiser.subscription_plan = subscription_plan
             advertiser.subscription_status = SUBSCRIPTION_STATUS["ACTIVE"]
-            advertiser.trial_end_date = next_billing
+            advertiser.subscription_end = next_billing
+            advertiser.grace_period_end = None
             advertiser.is_active = True
-            advertiser.last_payment_date = datetime.utcnow()
-            advertiser.last_payment_amount = amount
             
-            db.session.commit()
-            
-            # Enviar email de confirmação
+            # Enviar email de confirmação (caixa de saída, no mesmo commit)
             PagSeguroWebhookHandler.send_automated_email(
                 advertiser,
                 "payment_approved",
@@ -112,6 +113,9 @@ class PagSeguroWebhookHandler:
                 amount=f"{amount:.2f}",
                 next_billing_date=next_billing.strftime('%d/%m/%Y')
             )
+
+            db.session.commit()
+            invalidate_advertiser(advertiser.id)
             
             return {"message": "Pagamento aprovado e assinatura ativada"}, 200
             
@@ -132,9 +136,7 @@ class PagSeguroWebhookHandler:
             advertiser.subscription_status = "payment_pending"
             advertiser.grace_period_end = grace_period_end
             
-            db.session.commit()
-            
-            # Enviar email de aviso
+            # Enviar email de aviso (caixa de saída, no mesmo commit)
             PagSeguroWebhookHandler.send_automated_email(
                 advertiser,
                 "payment_failed",
@@ -142,6 +144,9 @@ class PagSeguroWebhookHandler:
                 grace_period=AUTOMATION_CONFIG["grace_period_days"],
                 payment_update_url="https://pagseguro.uol.com.br"  # URL do PagSeguro
             )
+
+            db.session.commit()
+            invalidate_advertiser(advertiser.id)
             
             return {"message": "Falha no pagamento processada, período de carência iniciado"}, 200
             
@@ -159,21 +164,23 @@ class PagSeguroWebhookHandler:
         """Processa cancelamento de assinatura pelo cliente"""
         try:
             # Manter acesso até o fim do período pago
-            expiry_date = advertiser.trial_end_date or datetime.utcnow()
+            expiry_date = advertiser.subscription_end or datetime.utcnow()
             
             # Atualizar status
             advertiser.subscription_status = SUBSCRIPTION_STATUS["CANCELLED"]
-            # Não desativa imediatamente, mantém até o vencimento
-            
-            db.session.commit()
+            # Não desativa imediatamente, mantém até o vencimento (sem carência: ver expiry.py)
+            advertiser.grace_period_end = None
             
-            # Enviar email de confirmação do cancelamento
+            # Enviar email de confirmação do cancelamento (caixa de saída, no mesmo commit)
             PagSeguroWebhookHandler.send_automated_email(
                 advertiser,
                 "subscription_cancelled",
                 expiry_date=expiry_date.strftime('%d/%m/%Y'),
                 reactivation_url="https://tudomais.app/reativar"  # URL do seu app
             )
+
+            db.session.commit()
+            invalidate_advertiser(advertiser.id)
             
             return {"message": "Cancelamento processado"}, 200
             
@@ -190,6 +197,7 @@ class PagSeguroWebhookHandler:
             advertiser.is_active = False
             
             db.session.commit()
+            invalidate_advertiser(advertiser.id)
             
             return {"message": "Assinatura suspensa"}, 200
             
@@ -207,27 +215,22 @@ class PagSeguroWebhookHandler:
             advertiser.grace_period_end = None
             
             # Calcular nova data de vencimento
-            plan_type = advertiser.subscription_plan.value
-            if plan_type == 'monthly':
-                next_billing = datetime.utcnow() + timedelta(days=30)
-            elif plan_type == 'semiannual':
-                next_billing = datetime.utcnow() + timedelta(days=180)
-            elif plan_type == 'annual':
-                next_billing = datetime.utcnow() + timedelta(days=365)
-            else:
-                next_billing = datetime.utcnow() + timedelta(days=30)
-            
-            advertiser.trial_end_date = next_billing
+            next_billing = PagSeguroWebhookHandler.next_billing_date(
+                advertiser, advertiser.subscription_plan.value
+            )
             
-            db.session.commit()
+            advertiser.subscription_end = next_billing
             
-            # Enviar email de reativação
+            # Enviar email de reativação (caixa de saída, no mesmo commit)
             PagSeguroWebhookHandler.send_automated_email(
                 advertiser,
                 "subscription_reactivated",
                 plan_name=advertiser.subscription_plan.value,
                 next_billing_date=next_billing.strftime('%d/%m/%Y')
             )
+
+            db.session.commit()
+            invalidate_advertiser(advertiser.id)
             
             return {"message": "Assinatura reativada"}, 200
             
@@ -237,60 +240,32 @@ class PagSeguroWebhookHandler:
     
     @staticmethod
     def send_automated_email(advertiser, event_type, **kwargs):
-        """Envia email automático para o anunciante"""
+        """Coloca o email automático na caixa de saída; ele vai no commit de quem chamou (ver mailer.py)"""
         try:
             if not AUTOMATION_CONFIG["email_notifications"]:
                 return
             
-            message = get_automated_message(
+            user = advertiser.user
+            queue_email(
+                user.email,
                 event_type,
-                user_name=advertiser.name,
+                user_name=user.name,
                 app_url="https://tudomais.app",  # URL do seu app
                 **kwargs
             )
-            
-            if message:
-                # TODO: Implementar envio real de email
-                # Por enquanto, apenas log
-                print(f"EMAIL AUTOMÁTICO PARA {advertiser.email}:")
-                print(f"Assunto: {message['subject']}")
-                print(f"Corpo: {message['body']}")
-                print("-" * 50)
                 
         except Exception as e:
             print(f"Erro ao enviar email automático: {str(e)}")
     
     @staticmethod
     def check_expired_subscriptions():
-        """Verifica e processa assinaturas expiradas (executar diariamente)"""
+        """Verifica e processa assinaturas expiradas (executar diariamente; ver expiry.py)"""
+        from expiry import expire_subscriptions
+
         try:
-            now = datetime.utcnow()
-            
-            # Buscar assinaturas expiradas
-            expired_advertisers = Advertiser.query.filter(
-                Advertiser.trial_end_date <= now,
-                Advertiser.subscription_status.in_([
-                    SUBSCRIPTION_STATUS["ACTIVE"],
-                    "payment_pending"
-                ])
-            ).all()
-            
-            for advertiser in expired_advertisers:
-                if advertiser.subscription_status == "payment_pending":
-                    # Suspender por falta de pagamento
-                    advertiser.subscription_status = SUBSCRIPTION_STATUS["SUSPENDED"]
-                    advertiser.is_active = False
-                else:
-                    # Expiração normal
-                    advertiser.subscription_status = SUBSCRIPTION_STATUS["EXPIRED"]
-                    advertiser.is_active = False
-            
-            db.session.commit()
-            
-            return len(expired_advertisers)
-            
+            report = expire_subscriptions()
+            return report["rows"]
         except Exception as e:
             db.session.rollback()
             print(f"Erro ao verificar assinaturas expiradas: {str(e)}")
             return 0
-
@@ -0,0 +1,258 @@
+"""
+Caixa de entrada dos webhooks do PagSeguro.
+
+A rota só confere a assinatura, grava a notificação em WebhookEvent e
+responde 200; o PagSeguro não fica esperando consulta ao anunciante,
+commit ou e-mail. A chave única (provider, event_id) descarta reenvios do
+mesmo evento já na gravação.
+
+O worker (`flask webhook-worker`) aplica os eventos pendentes com
+PagSeguroWebhookHandler, em ordem de ocorrência por anunciante
+(referenceId): um evento espera enquanto houver um anterior do mesmo
+anunciante pendente, e um evento que chega atrasado, depois de um mais
+novo já aplicado, é marcado "superseded" em vez de desfazer o estado atual.
+Falhas voltam para a fila com espera exponencial; depois de MAX_ATTEMPTS
+o evento vai para "dead" e aparece no painel do administrador.
+"""
+
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import update, and_, or_
+from sqlalchemy.exc import IntegrityError
+from models import db, WebhookEvent
+from pagseguro_config import WEBHOOK_CONFIG
+from webhook_handler import PagSeguroWebhookHandler
+
+PROVIDER = "pagseguro"
+SIGNATURE_HEADER = "X-PagSeguro-Signature"
+
+MAX_ATTEMPTS = 8
+BASE_DELAY = 30  # segundos; dobra a cada tentativa
+MAX_DELAY = 6 * 3600
+STALE_AFTER = timedelta(minutes=5)  # "processing" há mais tempo que isso volta para a fila
+BATCH_SIZE = 100
+
+UNFINISHED = ("pending", "processing")
+# Respostas do handler que não adianta repetir (dados do evento inválidos)
+PERMANENT_FAILURES = (400, 422)
+
+
+class InvalidWebhook(ValueError):
+    pass
+
+
+def verify_signature(raw_body, signature):
+    """HMAC-SHA256 do corpo com o token configurado no painel do PagSeguro"""
+    token = current_app.config.get("PAGSEGURO_WEBHOOK_TOKEN") or WEBHOOK_CONFIG["token"]
+    if not signature or not token:
+        return False
+    try:
+        return PagSeguroWebhookHandler.verify_webhook_signature(raw_body.decode("utf-8"), signature, token)
+    except (UnicodeDecodeError, TypeError):
+        return False
+
+
+def _event_id(data, raw_body):
+    for field in ("id", "eventId", "notificationCode"):
+        if data.get(field):
+            return str(data[field])[:100]
+    # Sem id do provedor: o reenvio do mesmo corpo tem o mesmo hash
+    return "sha256:" + hashlib.sha256(raw_body).hexdigest()
+
+
+def _occurred_at(data, fallback):
+    for field in ("date", "createdAt", "created_at", "timestamp"):
+        value = data.get(field)
+        if not value:
+            continue
+        try:
+            parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            continue
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    return fallback
+
+
+def ingest(raw_body, now=None):
+    """Grava o evento; retorna (evento, False) se ele já tinha sido recebido"""
+    try:
+        data = json.loads(raw_body)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidWebhook("Corpo do webhook não é JSON válido") from e
+    if not isinstance(data, dict) or not data.get("eventType"):
+        raise InvalidWebhook("Dados incompletos no webhook")
+
+    now = now or datetime.utcnow()
+    event = WebhookEvent(
+        provider=PROVIDER,
+        event_id=_event_id(data, raw_body),
+        event_type=str(data["eventType"])[:50],
+        reference=data.get("referenceId"),
+        payload=raw_body.decode("utf-8"),
+        occurred_at=_occurred_at(data, now),
+        next_attempt_at=now,
+        received_at=now
+    )
+    try:
+        with db.session.begin_nested():
+            db.session.add(event)
+    except IntegrityError:
+        existing = WebhookEvent.query.filter_by(provider=PROVIDER, event_id=event.event_id).first()
+        return existing, False
+    return event, True
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(BASE_DELAY * 2 ** (attempts - 1), MAX_DELAY))
+
+
+def _is_before(event):
+    """Eventos do mesmo anunciante que ocorreram antes deste"""
+    return and_(
+        WebhookEvent.reference == event.reference,
+        or_(WebhookEvent.occurred_at < event.occurred_at,
+            and_(WebhookEvent.occurred_at == event.occurred_at, WebhookEvent.id < event.id))
+    )
+
+
+def blocked(event):
+    """Há evento anterior do mesmo anunciante ainda não aplicado?"""
+    if event.reference is None:
+        return False
+    return db.session.query(WebhookEvent.id).filter(
+        _is_before(event), WebhookEvent.status.in_(UNFINISHED)
+    ).first() is not None
+
+
+def superseded(event):
+    """Um evento mais novo do mesmo anunciante já foi aplicado?"""
+    if event.reference is None:
+        return False
+    return db.session.query(WebhookEvent.id).filter(
+        WebhookEvent.reference == event.reference, WebhookEvent.status == "done",
+        WebhookEvent.occurred_at > event.occurred_at
+    ).first() is not None
+
+
+def claim(event_id, now):
+    """Marca o evento como em processamento; False se outro worker já pegou"""
+    table = WebhookEvent.__table__
+    # Em "processing", next_attempt_at guarda o início do processamento (ver requeue_stale)
+    claimed = db.session.execute(
+        update(table)
+        .where(table.c.id == event_id, table.c.status == "pending")
+        .values(status="processing", attempts=table.c.attempts + 1, next_attempt_at=now)
+    ).rowcount == 1
+    db.session.commit()
+    return claimed
+
+
+def _finish(event_id, **values):
+    table = WebhookEvent.__table__
+    db.session.execute(update(table).where(table.c.id == event_id).values(**values))
+    db.session.commit()
+
+
+def apply(event):
+    """Aplica o evento com o handler existente; retorna (status HTTP do handler, mensagem)"""
+    result, status = PagSeguroWebhookHandler.process_webhook(json.loads(event.payload))
+    return status, result.get("error") or result.get("message")
+
+
+def process(event, now=None):
+    """Processa um evento já reivindicado e grava o resultado"""
+    now = now or datetime.utcnow()
+    event_id, attempts = event.id, event.attempts
+
+    if superseded(event):
+        _finish(event_id, status="superseded", processed_at=now)
+        return "superseded"
+
+    try:
+        status, message = apply(event)
+    except Exception as e:
+        db.session.rollback()
+        status, message = 500, f"Erro ao processar webhook: {e}"
+
+    if 200 <= status < 300:
+        _finish(event_id, status="done", processed_at=now, last_error=None)
+        return "done"
+    if status in PERMANENT_FAILURES or attempts >= MAX_ATTEMPTS:
+        _finish(event_id, status="dead", last_error=str(message)[:255])
+        return "dead"
+    _finish(event_id, status="pending", last_error=str(message)[:255],
+            next_attempt_at=now + retry_delay(attempts))
+    return "retry"
+
+
+def run_pending(limit=None, now=None):
+    """Processa os eventos vencidos em ordem de ocorrência; retorna {resultado: quantidade}"""
+    results = {}
+    processed = 0
+    while limit is None or processed < limit:
+        now_batch = now or datetime.utcnow()
+        batch = (WebhookEvent.query
+                 .filter(WebhookEvent.status == "pending", WebhookEvent.next_attempt_at <= now_batch)
+                 .order_by(WebhookEvent.occurred_at, WebhookEvent.id)
+                 .limit(BATCH_SIZE).all())
+        progressed = False
+        for event in batch:
+            if limit is not None and processed >= limit:
+                break
+            if blocked(event) or not claim(event.id, now_batch):
+                continue
+            db.session.refresh(event)
+            outcome = process(event, now_batch)
+            results[outcome] = results.get(outcome, 0) + 1
+            processed += 1
+            progressed = True
+        if not progressed:
+            break
+    return results
+
+
+def requeue_stale(now=None):
+    """Devolve à fila eventos "processing" abandonados (worker reiniciado no meio)"""
+    cutoff = (now or datetime.utcnow()) - STALE_AFTER
+    table = WebhookEvent.__table__
+    count = db.session.execute(
+        update(table)
+        .where(table.c.status == "processing", table.c.next_attempt_at < cutoff)
+        .values(status="pending")
+    ).rowcount
+    db.session.commit()
+    return count
+
+
+def retry_dead(event_id):
+    """Devolve um evento "dead" à fila (ação do administrador); False se ele não estava morto"""
+    table = WebhookEvent.__table__
+    return db.session.execute(
+        update(table)
+        .where(table.c.id == event_id, table.c.status == "dead")
+        .values(status="pending", attempts=0, next_attempt_at=datetime.utcnow(), last_error=None)
+    ).rowcount == 1
+
+
+def status_counts():
+    return dict(db.session.query(WebhookEvent.status, db.func.count(WebhookEvent.id))
+                .group_by(WebhookEvent.status).all())
+
+
+def event_payload(event):
+    return {
+        "id": event.id,
+        "event_id": event.event_id,
+        "event_type": event.event_type,
+        "reference": event.reference,
+        "status": event.status,
+        "attempts": event.attempts,
+        "last_error": event.last_error,
+        "occurred_at": event.occurred_at.isoformat(),
+        "received_at": event.received_at.isoformat() if event.received_at else None,
+        "next_attempt_at": event.next_attempt_at.isoformat()
+    }